@@ -12,9 +12,10 @@ import matplotlib.pyplot as plt
 from coffea import hist
 from coffea.analysis_objects import JaggedCandidateArray
 from FireHydrant.Analysis.DatasetMapLoader import (DatasetMapLoader,
-                                                   SigDatasetMapLoader)
-from FireHydrant.Tools.correction import (get_nlo_weight_function,
-                                          get_pu_weights_function,
+                                                   SigDatasetMapLoader,
+                                                   metadata_cache)
+from FireHydrant.Analysis.Utils import DatasetGrouping
+from FireHydrant.Tools.correction import (CORRECTIONS, PreloadedPool,
                                           get_ttbar_weight)
 from FireHydrant.Tools.metfilter import MetFilters
 from FireHydrant.Tools.trigger import Triggers
@@ -29,16 +30,13 @@ parser = argparse.ArgumentParser(description="[AN] making cutflow tables")
 parser.add_argument("--sync", action='store_true', help="issue rsync command to sync plots folder to lxplus web server")
 args = parser.parse_args()
 
-dml = DatasetMapLoader()
-bkgDS, bkgMAP, bkgSCALE = dml.fetch('bkg')
-dataDS, dataMAP = dml.fetch('data')
-
-# sdml = SigDatasetMapLoader()
-# sigDS_2mu2e, sigSCALE_2mu2e = sdml.fetch('2mu2e')
 
 class CutflowProcessor(processor.ProcessorABC):
-    def __init__(self, data_type='bkg', region='SR', enforceNeutral=True):
+    def __init__(self, data_type='bkg', region='SR', enforceNeutral=True, groupatfill=True, grouping=None, mapping=None):
         self.data_type = data_type
+        self.groupatfill = groupatfill
+        self.grouping = grouping
+        self.mapping = mapping
         self.region = region
         self.enforceNeutral = enforceNeutral
 
@@ -50,10 +48,7 @@ class CutflowProcessor(processor.ProcessorABC):
             'count': hist.Hist('Counts', dataset_axis, count_axis, channel_axis),
         })
 
-        self.pucorrs = get_pu_weights_function()
-        ## NOT applied for now
-        self.nlo_w = get_nlo_weight_function('w')
-        self.nlo_z = get_nlo_weight_function('z')
+        self.pucorrs = 'pileup'
 
     @property
     def accumulator(self):
@@ -68,8 +63,11 @@ class CutflowProcessor(processor.ProcessorABC):
         wgts = processor.Weights(df.size)
         if self.data_type!='data':
             wgts.add('genw', df['weight'])
+            if self.data_type=='bkg' and self.groupatfill:
+                dataset = self.grouping.fill_weights(dataset, wgts, df.size)
+                if dataset is None: return output
             npv = df['trueInteractionNum']
-            wgts.add('pileup', *(f(npv) for f in self.pucorrs))
+            wgts.add('pileup', *CORRECTIONS[self.pucorrs](npv).T)
 
         triggermask = np.logical_or.reduce([df[t] for t in Triggers])
         wgts.add('trigger', triggermask)
@@ -166,14 +164,11 @@ class CutflowProcessor(processor.ProcessorABC):
         origidentity = list(accumulator)
         for k in origidentity:
             if self.data_type == 'bkg':
-                accumulator[k].scale(bkgSCALE, axis='dataset')
-                accumulator[k] = accumulator[k].group("dataset",
-                                                    hist.Cat("cat", "datasets", sorting='integral'),
-                                                    bkgMAP)
+                accumulator[k] = self.grouping.finalize(accumulator[k], atfill=self.groupatfill)
             if self.data_type == 'data':
                 accumulator[k] = accumulator[k].group("dataset",
                                                     hist.Cat("cat", "datasets",),
-                                                    dataMAP)
+                                                    self.mapping)
             # if self.data_type == 'sig-2mu2e':
             #     accumulator[k].scale(sigSCALE_2mu2e, axis='dataset')
             # if self.data_type == 'sig-4mu':
@@ -192,6 +187,17 @@ if __name__ == "__main__":
     outdir = join(os.getenv('FH_BASE'), "Imgs", reldir)
     if not isdir(outdir): os.makedirs(outdir)
 
+    dml = DatasetMapLoader()
+    bkgDS, bkgMAP, bkgSCALE = dml.fetch('bkg')
+    bkgGROUPING = DatasetGrouping(bkgMAP, bkgSCALE)
+    dataDS, dataMAP = dml.fetch('data')
+
+    # sdml = SigDatasetMapLoader()
+    # sigDS_2mu2e, sigSCALE_2mu2e = sdml.fetch('2mu2e')
+
+    # recorded entries of v2 dataset files, chunked without opening them first
+    metacache = metadata_cache(dml.get_metadata('both'))
+
     YieldsDf = {}
 
     ## SR
@@ -205,10 +211,11 @@ if __name__ == "__main__":
 
     out_bkg = processor.run_uproot_job(bkgDS,
                                   treename='ffNtuplizer/ffNtuple',
-                                  processor_instance=CutflowProcessor(data_type='bkg', region='SR', enforceNeutral=True),
+                                  processor_instance=CutflowProcessor(data_type='bkg', grouping=bkgGROUPING, region='SR', enforceNeutral=True),
                                   executor=processor.futures_executor,
-                                  executor_args=dict(workers=12, flatten=False),
+                                  executor_args=dict(workers=12, flatten=False, pool=PreloadedPool),
                                   chunksize=500000,
+                                  metadata_cache=metacache,
                                  )
     # --- CHANNEL - 2mu2e
     outputs = OrderedDict()
@@ -240,18 +247,20 @@ if __name__ == "__main__":
 
     out_bkg = processor.run_uproot_job(bkgDS,
                                   treename='ffNtuplizer/ffNtuple',
-                                  processor_instance=CutflowProcessor(data_type='bkg', region='CR', enforceNeutral=True),
+                                  processor_instance=CutflowProcessor(data_type='bkg', grouping=bkgGROUPING, region='CR', enforceNeutral=True),
                                   executor=processor.futures_executor,
-                                  executor_args=dict(workers=12, flatten=False),
+                                  executor_args=dict(workers=12, flatten=False, pool=PreloadedPool),
                                   chunksize=500000,
+                                  metadata_cache=metacache,
                                  )
 
     out_data = processor.run_uproot_job(dataDS,
                                   treename='ffNtuplizer/ffNtuple',
-                                  processor_instance=CutflowProcessor(data_type='data', region='CR', enforceNeutral=True),
+                                  processor_instance=CutflowProcessor(data_type='data', mapping=dataMAP, region='CR', enforceNeutral=True),
                                   executor=processor.futures_executor,
-                                  executor_args=dict(workers=12, flatten=False),
+                                  executor_args=dict(workers=12, flatten=False, pool=PreloadedPool),
                                   chunksize=500000,
+                                  metadata_cache=metacache,
                                  )
 
     # --- CHANNEL - 2mu2e
@@ -295,10 +304,11 @@ if __name__ == "__main__":
 
     out_bkg = processor.run_uproot_job(bkgDS,
                                   treename='ffNtuplizer/ffNtuple',
-                                  processor_instance=CutflowProcessor(data_type='bkg', region='SR', enforceNeutral=False),
+                                  processor_instance=CutflowProcessor(data_type='bkg', grouping=bkgGROUPING, region='SR', enforceNeutral=False),
                                   executor=processor.futures_executor,
-                                  executor_args=dict(workers=12, flatten=False),
+                                  executor_args=dict(workers=12, flatten=False, pool=PreloadedPool),
                                   chunksize=500000,
+                                  metadata_cache=metacache,
                                  )
 
     # --- CHANNEL - 2mu2e
@@ -330,18 +340,20 @@ if __name__ == "__main__":
 
     out_bkg = processor.run_uproot_job(bkgDS,
                                   treename='ffNtuplizer/ffNtuple',
-                                  processor_instance=CutflowProcessor(data_type='bkg', region='CR', enforceNeutral=False),
+                                  processor_instance=CutflowProcessor(data_type='bkg', grouping=bkgGROUPING, region='CR', enforceNeutral=False),
                                   executor=processor.futures_executor,
-                                  executor_args=dict(workers=12, flatten=False),
+                                  executor_args=dict(workers=12, flatten=False, pool=PreloadedPool),
                                   chunksize=500000,
+                                  metadata_cache=metacache,
                                  )
 
     out_data = processor.run_uproot_job(dataDS,
                                   treename='ffNtuplizer/ffNtuple',
-                                  processor_instance=CutflowProcessor(data_type='data', region='CR', enforceNeutral=False),
+                                  processor_instance=CutflowProcessor(data_type='data', mapping=dataMAP, region='CR', enforceNeutral=False),
                                   executor=processor.futures_executor,
-                                  executor_args=dict(workers=12, flatten=False),
+                                  executor_args=dict(workers=12, flatten=False, pool=PreloadedPool),
                                   chunksize=500000,
+                                  metadata_cache=metacache,
                                  )
 
     # --- CHANNEL - 2mu2e
@@ -11,9 +11,10 @@ import matplotlib.pyplot as plt
 from coffea import hist
 from coffea.analysis_objects import JaggedCandidateArray
 from FireHydrant.Analysis.DatasetMapLoader import (DatasetMapLoader,
-                                                   SigDatasetMapLoader)
-from FireHydrant.Tools.correction import (get_nlo_weight_function,
-                                          get_pu_weights_function,
+                                                   SigDatasetMapLoader,
+                                                   metadata_cache)
+from FireHydrant.Analysis.Utils import DatasetGrouping
+from FireHydrant.Tools.correction import (CORRECTIONS, PreloadedPool,
                                           get_ttbar_weight)
 from FireHydrant.Tools.metfilter import MetFilters
 from FireHydrant.Tools.trigger import Triggers
@@ -28,17 +29,13 @@ parser = argparse.ArgumentParser(description="[AN] bkg leptonjet, event kinemati
 parser.add_argument("--sync", action='store_true', help="issue rsync command to sync plots folder to lxplus web server")
 args = parser.parse_args()
 
-dml = DatasetMapLoader()
-bkgDS, bkgMAP, bkgSCALE = dml.fetch('bkg')
-# dataDS, dataMAP = dml.fetch('data')
-
-sdml = SigDatasetMapLoader()
-sigDS_2mu2e, sigSCALE_2mu2e = sdml.fetch('2mu2e')
-sigDS_4mu, sigSCALE_4mu = sdml.fetch('4mu')
 
 class LJBkgProcessor(processor.ProcessorABC):
-    def __init__(self, data_type='bkg'):
+    def __init__(self, data_type='bkg', groupatfill=True, grouping=None, scales=None):
         self.data_type = data_type
+        self.groupatfill = groupatfill
+        self.grouping = grouping
+        self.scales = scales
 
         dataset_axis = hist.Cat('dataset', 'dataset')
         pt_axis = hist.Bin('pt', '$p_T$ [GeV]', 100, 0, 200)
@@ -59,10 +56,7 @@ class LJBkgProcessor(processor.ProcessorABC):
             'ljpairdphi': hist.Hist('Counts/$\pi$/50', dataset_axis, dphi_axis, channel_axis),
         })
 
-        self.pucorrs = get_pu_weights_function()
-        ## NOT applied for now
-        self.nlo_w = get_nlo_weight_function('w')
-        self.nlo_z = get_nlo_weight_function('z')
+        self.pucorrs = 'pileup'
 
     @property
     def accumulator(self):
@@ -77,8 +71,11 @@ class LJBkgProcessor(processor.ProcessorABC):
         wgts = processor.Weights(df.size)
         if self.data_type!='data':
             wgts.add('genw', df['weight'])
+            if self.data_type=='bkg' and self.groupatfill:
+                dataset = self.grouping.fill_weights(dataset, wgts, df.size)
+                if dataset is None: return output
             npv = df['trueInteractionNum']
-            wgts.add('pileup', *(f(npv) for f in self.pucorrs))
+            wgts.add('pileup', *CORRECTIONS[self.pucorrs](npv).T)
 
         triggermask = np.logical_or.reduce([df[t] for t in Triggers])
         wgts.add('trigger', triggermask)
@@ -157,18 +154,13 @@ class LJBkgProcessor(processor.ProcessorABC):
         origidentity = list(accumulator)
         for k in origidentity:
             if self.data_type == 'bkg':
-                accumulator[k].scale(bkgSCALE, axis='dataset')
-                accumulator[k] = accumulator[k].group("dataset",
-                                                    hist.Cat("cat", "datasets", sorting='integral'),
-                                                    bkgMAP)
+                accumulator[k] = self.grouping.finalize(accumulator[k], atfill=self.groupatfill)
             # if self.data_type == 'data':
             #     accumulator[k] = accumulator[k].group("dataset",
             #                                         hist.Cat("cat", "datasets",),
             #                                         dataMAP)
-            if self.data_type == 'sig-2mu2e':
-                accumulator[k].scale(sigSCALE_2mu2e, axis='dataset')
-            if self.data_type == 'sig-4mu':
-                accumulator[k].scale(sigSCALE_4mu, axis='dataset')
+            if self.data_type in ('sig-2mu2e', 'sig-4mu'):
+                accumulator[k].scale(self.scales, axis='dataset')
 
         return accumulator
 
@@ -183,33 +175,49 @@ if __name__ == "__main__":
     outdir = join(os.getenv('FH_BASE'), "Imgs", reldir)
     if not isdir(outdir): os.makedirs(outdir)
 
+    dml = DatasetMapLoader()
+    bkgDS, bkgMAP, bkgSCALE = dml.fetch('bkg')
+    bkgGROUPING = DatasetGrouping(bkgMAP, bkgSCALE)
+    # dataDS, dataMAP = dml.fetch('data')
+
+    # only the small mXX signal points are overlaid
+    smallmxx = {100, 150, 200}
+    sdml = SigDatasetMapLoader()
+    sigDS_2mu2e, sigSCALE_2mu2e = sdml.fetch_grid(channel='2mu2e', mXX=smallmxx)
+    sigDS_4mu, sigSCALE_4mu = sdml.fetch_grid(channel='4mu', mXX=smallmxx)
+
+    # recorded entries of v2 dataset files, chunked without opening them first
+    metacache = metadata_cache(dml.get_metadata('bkg'),
+                               sdml.get_grid_metadata(channel='2mu2e', mXX=smallmxx),
+                               sdml.get_grid_metadata(channel='4mu', mXX=smallmxx))
+
     out_sig2mu2e = processor.run_uproot_job(sigDS_2mu2e,
                                   treename='ffNtuplizer/ffNtuple',
-                                  processor_instance=LJBkgProcessor(data_type='sig-2mu2e'),
+                                  processor_instance=LJBkgProcessor(data_type='sig-2mu2e', scales=sigSCALE_2mu2e),
                                   executor=processor.futures_executor,
-                                  executor_args=dict(workers=12, flatten=True),
+                                  executor_args=dict(workers=12, flatten=True, pool=PreloadedPool),
                                   chunksize=500000,
+                                  metadata_cache=metacache,
                                  )
 
     out_sig4mu = processor.run_uproot_job(sigDS_4mu,
                                   treename='ffNtuplizer/ffNtuple',
-                                  processor_instance=LJBkgProcessor(data_type='sig-4mu'),
+                                  processor_instance=LJBkgProcessor(data_type='sig-4mu', scales=sigSCALE_4mu),
                                   executor=processor.futures_executor,
-                                  executor_args=dict(workers=12, flatten=True),
+                                  executor_args=dict(workers=12, flatten=True, pool=PreloadedPool),
                                   chunksize=500000,
+                                  metadata_cache=metacache,
                                  )
 
     out_bkg = processor.run_uproot_job(bkgDS,
                                   treename='ffNtuplizer/ffNtuple',
-                                  processor_instance=LJBkgProcessor(data_type='bkg'),
+                                  processor_instance=LJBkgProcessor(data_type='bkg', grouping=bkgGROUPING),
                                   executor=processor.futures_executor,
-                                  executor_args=dict(workers=12, flatten=True),
+                                  executor_args=dict(workers=12, flatten=True, pool=PreloadedPool),
                                   chunksize=500000,
+                                  metadata_cache=metacache,
                                  )
 
-    import re
-    smallmxx = re.compile('mXX-(100|150|200)_\w+')
-
     ## CHANNEL - 2mu2e
     print('## CHANNEL - 2mu2e')
 
@@ -218,7 +226,7 @@ if __name__ == "__main__":
     bkghist = out_bkg['lj0pt'].integrate('channel', slice(1,2))
     hist.plot1d(bkghist, overlay='cat', ax=ax, stack=True, overflow='over',
                 line_opts=None, fill_opts=fill_opts, error_opts=error_opts)
-    sighist = out_sig2mu2e['lj0pt'][smallmxx].integrate('channel', slice(1,2))
+    sighist = out_sig2mu2e['lj0pt'].integrate('channel', slice(1,2))
     hist.plot1d(sighist, overlay='dataset', ax=ax, overflow='over', clear=False)
 
     ax.set_title('[$2\mu 2e$|MC] leading leptonjet $p_T$', x=0.0, ha="left")
@@ -238,7 +246,7 @@ if __name__ == "__main__":
     bkghist = out_bkg['lj1pt'].integrate('channel', slice(1,2))
     hist.plot1d(bkghist, overlay='cat', ax=ax, stack=True, overflow='over',
                 line_opts=None, fill_opts=fill_opts, error_opts=error_opts)
-    sighist = out_sig2mu2e['lj1pt'][smallmxx].integrate('channel', slice(1,2))
+    sighist = out_sig2mu2e['lj1pt'].integrate('channel', slice(1,2))
     hist.plot1d(sighist, overlay='dataset', ax=ax, overflow='over', clear=False)
 
     ax.set_title('[$2\mu 2e$|MC] subleading leptonjet $p_T$', x=0.0, ha="left")
@@ -258,7 +266,7 @@ if __name__ == "__main__":
     bkghist = out_bkg['muljmass'].integrate('channel', slice(1,2))
     hist.plot1d(bkghist, overlay='cat', ax=ax, stack=True, overflow='over',
                 line_opts=None, fill_opts=fill_opts, error_opts=error_opts)
-    sighist = out_sig2mu2e['muljmass'][smallmxx].integrate('channel', slice(1,2))
+    sighist = out_sig2mu2e['muljmass'].integrate('channel', slice(1,2))
     hist.plot1d(sighist, overlay='dataset', ax=ax, overflow='over', clear=False)
 
     ax.set_title('[$2\mu 2e$|MC] muon-type leptonjet mass', x=0.0, ha="left")
@@ -278,7 +286,7 @@ if __name__ == "__main__":
     bkghist = out_bkg['muljvxy'].integrate('channel', slice(1,2))
     hist.plot1d(bkghist, overlay='cat', ax=ax, stack=True, overflow='over',
                 line_opts=None, fill_opts=fill_opts, error_opts=error_opts)
-    sighist = out_sig2mu2e['muljvxy'][smallmxx].integrate('channel', slice(1,2))
+    sighist = out_sig2mu2e['muljvxy'].integrate('channel', slice(1,2))
     hist.plot1d(sighist, overlay='dataset', ax=ax, overflow='over', clear=False)
 
     ax.set_title('[$2\mu 2e$|MC] muon-type leptonjet vxy', x=0.0, ha="left")
@@ -323,7 +331,7 @@ if __name__ == "__main__":
     bkghist = out_bkg['ljpairmass'].integrate('channel', slice(1,2))
     hist.plot1d(bkghist, overlay='cat', ax=ax, stack=True, overflow='over',
                 line_opts=None, fill_opts=fill_opts, error_opts=error_opts)
-    sighist = out_sig2mu2e['ljpairmass'][smallmxx].integrate('channel', slice(1,2))
+    sighist = out_sig2mu2e['ljpairmass'].integrate('channel', slice(1,2))
     hist.plot1d(sighist, overlay='dataset', ax=ax, overflow='over', clear=False)
 
     ax.set_title('[$2\mu 2e$|MC] leptonjet pair invariant mass', x=0.0, ha="left")
@@ -343,7 +351,7 @@ if __name__ == "__main__":
     bkghist = out_bkg['ljpairdphi'].integrate('channel', slice(1,2))
     hist.plot1d(bkghist, overlay='cat', ax=ax, stack=True, overflow='over',
                 line_opts=None, fill_opts=fill_opts, error_opts=error_opts)
-    sighist = out_sig2mu2e['ljpairdphi'][smallmxx].integrate('channel', slice(1,2))
+    sighist = out_sig2mu2e['ljpairdphi'].integrate('channel', slice(1,2))
     hist.plot1d(sighist, overlay='dataset', ax=ax, overflow='over', clear=False)
 
     ax.set_title('[$2\mu 2e$|MC] leptonjet pair $\Delta\phi$', x=0.0, ha="left")
@@ -371,7 +379,7 @@ if __name__ == "__main__":
     bkghist = out_bkg['lj0pt'].integrate('channel', slice(2,3))
     hist.plot1d(bkghist, overlay='cat', ax=ax, stack=True, overflow='over',
                 line_opts=None, fill_opts=fill_opts, error_opts=error_opts)
-    sighist = out_sig4mu['lj0pt'][smallmxx].integrate('channel', slice(2,3))
+    sighist = out_sig4mu['lj0pt'].integrate('channel', slice(2,3))
     hist.plot1d(sighist, overlay='dataset', ax=ax, overflow='over', clear=False)
 
     ax.set_title('[$4\mu$|MC] leading leptonjet $p_T$', x=0.0, ha="left")
@@ -391,7 +399,7 @@ if __name__ == "__main__":
     bkghist = out_bkg['lj1pt'].integrate('channel', slice(2,3))
     hist.plot1d(bkghist, overlay='cat', ax=ax, stack=True, overflow='over',
                 line_opts=None, fill_opts=fill_opts, error_opts=error_opts)
-    sighist = out_sig4mu['lj1pt'][smallmxx].integrate('channel', slice(2,3))
+    sighist = out_sig4mu['lj1pt'].integrate('channel', slice(2,3))
     hist.plot1d(sighist, overlay='dataset', ax=ax, overflow='over', clear=False)
 
     ax.set_title('[$4\mu$|MC] subleading leptonjet $p_T$', x=0.0, ha="left")
@@ -411,7 +419,7 @@ if __name__ == "__main__":
     bkghist = out_bkg['muljmass'].integrate('channel', slice(2,3))
     hist.plot1d(bkghist, overlay='cat', ax=ax, stack=True, overflow='over',
                 line_opts=None, fill_opts=fill_opts, error_opts=error_opts)
-    sighist = out_sig4mu['muljmass'][smallmxx].integrate('channel', slice(2,3))
+    sighist = out_sig4mu['muljmass'].integrate('channel', slice(2,3))
     hist.plot1d(sighist, overlay='dataset', ax=ax, overflow='over', clear=False)
 
     ax.set_title('[$4\mu$|MC] muon-type leptonjet mass', x=0.0, ha="left")
@@ -431,7 +439,7 @@ if __name__ == "__main__":
     bkghist = out_bkg['muljvxy'].integrate('channel', slice(2,3))
     hist.plot1d(bkghist, overlay='cat', ax=ax, stack=True, overflow='over',
                 line_opts=None, fill_opts=fill_opts, error_opts=error_opts)
-    sighist = out_sig4mu['muljvxy'][smallmxx].integrate('channel', slice(2,3))
+    sighist = out_sig4mu['muljvxy'].integrate('channel', slice(2,3))
     hist.plot1d(sighist, overlay='dataset', ax=ax, overflow='over', clear=False)
 
     ax.set_title('[$4\mu$|MC] muon-type leptonjet vxy', x=0.0, ha="left")
@@ -476,7 +484,7 @@ if __name__ == "__main__":
     bkghist = out_bkg['ljpairmass'].integrate('channel', slice(2,3))
     hist.plot1d(bkghist, overlay='cat', ax=ax, stack=True, overflow='over',
                 line_opts=None, fill_opts=fill_opts, error_opts=error_opts)
-    sighist = out_sig4mu['ljpairmass'][smallmxx].integrate('channel', slice(2,3))
+    sighist = out_sig4mu['ljpairmass'].integrate('channel', slice(2,3))
     hist.plot1d(sighist, overlay='dataset', ax=ax, overflow='over', clear=False)
 
     ax.set_title('[$4\mu$|MC] leptonjet pair invariant mass', x=0.0, ha="left")
@@ -496,7 +504,7 @@ if __name__ == "__main__":
     bkghist = out_bkg['ljpairdphi'].integrate('channel', slice(2,3))
     hist.plot1d(bkghist, overlay='cat', ax=ax, stack=True, overflow='over',
                 line_opts=None, fill_opts=fill_opts, error_opts=error_opts)
-    sighist = out_sig4mu['ljpairdphi'][smallmxx].integrate('channel', slice(2,3))
+    sighist = out_sig4mu['ljpairdphi'].integrate('channel', slice(2,3))
     hist.plot1d(sighist, overlay='dataset', ax=ax, overflow='over', clear=False)
 
     ax.set_title('[$4\mu$|MC] leptonjet pair $\Delta\phi$', x=0.0, ha="left")
@@ -11,9 +11,10 @@ import matplotlib.pyplot as plt
 from coffea import hist
 from coffea.analysis_objects import JaggedCandidateArray
 from FireHydrant.Analysis.DatasetMapLoader import (DatasetMapLoader,
-                                                   SigDatasetMapLoader)
-from FireHydrant.Tools.correction import (get_nlo_weight_function,
-                                          get_pu_weights_function,
+                                                   SigDatasetMapLoader,
+                                                   metadata_cache)
+from FireHydrant.Analysis.Utils import DatasetGrouping
+from FireHydrant.Tools.correction import (CORRECTIONS, PreloadedPool,
                                           get_ttbar_weight)
 from FireHydrant.Tools.metfilter import MetFilters
 from FireHydrant.Tools.trigger import Triggers
@@ -28,15 +29,6 @@ parser = argparse.ArgumentParser(description="[AN] leptonjet pair delta phi")
 parser.add_argument("--sync", action='store_true', help="issue rsync command to sync plots folder to lxplus web server")
 args = parser.parse_args()
 
-dml = DatasetMapLoader()
-bkgDS, bkgMAP, bkgSCALE = dml.fetch('bkg')
-dataDS, dataMAP = dml.fetch('data')
-
-sdml = SigDatasetMapLoader()
-sigDS, sigSCALE = sdml.fetch('all')
-sigDS_2mu2e, sigSCALE_2mu2e = sdml.fetch('2mu2e')
-sigDS_4mu, sigSCALE_4mu = sdml.fetch('4mu')
-
 
 class LjTkIsoProcessorSig(processor.ProcessorABC):
     def __init__(self):
@@ -114,7 +106,7 @@ class LjTkIsoProcessorSig(processor.ProcessorABC):
 
 
 class LjTkIsoProcessor(processor.ProcessorABC):
-    def __init__(self, data_type='bkg', bothNeutral=True):
+    def __init__(self, data_type='bkg', bothNeutral=True, groupatfill=True, grouping=None, scales=None, mapping=None):
         dataset_axis = hist.Cat('dataset', 'dataset')
         sumpt_axis = hist.Bin('sumpt', '$\sum p_T$ [GeV]', 50, 0, 50)
         iso_axis = hist.Bin('iso', 'Isolation', np.arange(0, 1, 0.04))
@@ -128,12 +120,13 @@ class LjTkIsoProcessor(processor.ProcessorABC):
             'lj0pfiso': hist.Hist('Counts', dataset_axis, iso_axis, channel_axis),
         })
 
-        self.pucorrs = get_pu_weights_function()
-        ## NOT applied for now
-        self.nlo_w = get_nlo_weight_function('w')
-        self.nlo_z = get_nlo_weight_function('z')
+        self.pucorrs = 'pileup'
 
         self.data_type = data_type
+        self.groupatfill = groupatfill
+        self.grouping = grouping
+        self.scales = scales
+        self.mapping = mapping
         self.bothNeutral = bothNeutral
 
     @property
@@ -148,8 +141,11 @@ class LjTkIsoProcessor(processor.ProcessorABC):
         wgts = processor.Weights(df.size)
         if self.data_type!='data':
             wgts.add('genw', df['weight'])
+            if self.data_type=='bkg' and self.groupatfill:
+                dataset = self.grouping.fill_weights(dataset, wgts, df.size)
+                if dataset is None: return output
             npv = df['trueInteractionNum']
-            wgts.add('pileup', *(f(npv) for f in self.pucorrs))
+            wgts.add('pileup', *CORRECTIONS[self.pucorrs](npv).T)
 
         triggermask = np.logical_or.reduce([df[t] for t in Triggers])
         wgts.add('trigger', triggermask)
@@ -245,18 +241,13 @@ class LjTkIsoProcessor(processor.ProcessorABC):
         origidentity = list(accumulator)
         for k in origidentity:
             if self.data_type == 'bkg':
-                accumulator[k].scale(bkgSCALE, axis='dataset')
-                accumulator[k] = accumulator[k].group("dataset",
-                                                    hist.Cat("cat", "datasets", sorting='integral'),
-                                                    bkgMAP)
+                accumulator[k] = self.grouping.finalize(accumulator[k], atfill=self.groupatfill)
             if self.data_type == 'data':
                 accumulator[k] = accumulator[k].group("dataset",
                                                     hist.Cat("cat", "datasets",),
-                                                    dataMAP)
-            if self.data_type == 'sig-2mu2e':
-                accumulator[k].scale(sigSCALE_2mu2e, axis='dataset')
-            if self.data_type == 'sig-4mu':
-                accumulator[k].scale(sigSCALE_4mu, axis='dataset')
+                                                    self.mapping)
+            if self.data_type in ('sig-2mu2e', 'sig-4mu'):
+                accumulator[k].scale(self.scales, axis='dataset')
 
         return accumulator
 
@@ -271,36 +262,53 @@ if __name__ == "__main__":
     outdir = join(os.getenv('FH_BASE'), "Imgs", reldir)
     if not isdir(outdir): os.makedirs(outdir)
 
+    dml = DatasetMapLoader()
+    bkgDS, bkgMAP, bkgSCALE = dml.fetch('bkg')
+    bkgGROUPING = DatasetGrouping(bkgMAP, bkgSCALE)
+    dataDS, dataMAP = dml.fetch('data')
+
+    sdml = SigDatasetMapLoader()
+    sigDS, sigSCALE = sdml.fetch('all')
+    sigDS_2mu2e, sigSCALE_2mu2e = sdml.fetch('2mu2e')
+    sigDS_4mu, sigSCALE_4mu = sdml.fetch('4mu')
+
+    # recorded entries of v2 dataset files, chunked without opening them first
+    metacache = metadata_cache(dml.get_metadata('both'), sdml.get_metadata('2mu2e'), sdml.get_metadata('4mu'))
+
     output_2mu2e = processor.run_uproot_job(sigDS_2mu2e,
                                     treename='ffNtuplizer/ffNtuple',
-                                    processor_instance=LjTkIsoProcessor(data_type='sig-2mu2e'),
+                                    processor_instance=LjTkIsoProcessor(data_type='sig-2mu2e', scales=sigSCALE_2mu2e),
                                     executor=processor.futures_executor,
-                                    executor_args=dict(workers=12, flatten=False),
+                                    executor_args=dict(workers=12, flatten=False, pool=PreloadedPool),
                                     chunksize=500000,
+                                    metadata_cache=metacache,
                                     )
 
     output_4mu = processor.run_uproot_job(sigDS_4mu,
                                     treename='ffNtuplizer/ffNtuple',
-                                    processor_instance=LjTkIsoProcessor(data_type='sig-4mu'),
+                                    processor_instance=LjTkIsoProcessor(data_type='sig-4mu', scales=sigSCALE_4mu),
                                     executor=processor.futures_executor,
-                                    executor_args=dict(workers=12, flatten=False),
+                                    executor_args=dict(workers=12, flatten=False, pool=PreloadedPool),
                                     chunksize=500000,
+                                    metadata_cache=metacache,
                                     )
 
     output_bkg = processor.run_uproot_job(bkgDS,
                                     treename='ffNtuplizer/ffNtuple',
-                                    processor_instance=LjTkIsoProcessor(data_type='bkg'),
+                                    processor_instance=LjTkIsoProcessor(data_type='bkg', grouping=bkgGROUPING),
                                     executor=processor.futures_executor,
-                                    executor_args=dict(workers=12, flatten=False),
+                                    executor_args=dict(workers=12, flatten=False, pool=PreloadedPool),
                                     chunksize=500000,
+                                    metadata_cache=metacache,
                                     )
 
     output_data = processor.run_uproot_job(dataDS,
                                     treename='ffNtuplizer/ffNtuple',
-                                    processor_instance=LjTkIsoProcessor(data_type='data'),
+                                    processor_instance=LjTkIsoProcessor(data_type='data', mapping=dataMAP),
                                     executor=processor.futures_executor,
-                                    executor_args=dict(workers=12, flatten=False),
+                                    executor_args=dict(workers=12, flatten=False, pool=PreloadedPool),
                                     chunksize=500000,
+                                    metadata_cache=metacache,
                                     )
 
     sampleSig = re.compile('mXX-150_mA-0p25_lxy-300|mXX-500_mA-1p2_lxy-300|mXX-800_mA-5_lxy-300')
@@ -434,34 +442,38 @@ if __name__ == "__main__":
 
     output_2mu2e = processor.run_uproot_job(sigDS_2mu2e,
                                     treename='ffNtuplizer/ffNtuple',
-                                    processor_instance=LjTkIsoProcessor(data_type='sig-2mu2e', bothNeutral=False),
+                                    processor_instance=LjTkIsoProcessor(data_type='sig-2mu2e', scales=sigSCALE_2mu2e, bothNeutral=False),
                                     executor=processor.futures_executor,
-                                    executor_args=dict(workers=12, flatten=False),
+                                    executor_args=dict(workers=12, flatten=False, pool=PreloadedPool),
                                     chunksize=500000,
+                                    metadata_cache=metacache,
                                     )
 
     output_4mu = processor.run_uproot_job(sigDS_4mu,
                                     treename='ffNtuplizer/ffNtuple',
-                                    processor_instance=LjTkIsoProcessor(data_type='sig-4mu', bothNeutral=False),
+                                    processor_instance=LjTkIsoProcessor(data_type='sig-4mu', scales=sigSCALE_4mu, bothNeutral=False),
                                     executor=processor.futures_executor,
-                                    executor_args=dict(workers=12, flatten=False),
+                                    executor_args=dict(workers=12, flatten=False, pool=PreloadedPool),
                                     chunksize=500000,
+                                    metadata_cache=metacache,
                                     )
 
     output_bkg = processor.run_uproot_job(bkgDS,
                                     treename='ffNtuplizer/ffNtuple',
-                                    processor_instance=LjTkIsoProcessor(data_type='bkg', bothNeutral=False),
+                                    processor_instance=LjTkIsoProcessor(data_type='bkg', grouping=bkgGROUPING, bothNeutral=False),
                                     executor=processor.futures_executor,
-                                    executor_args=dict(workers=12, flatten=False),
+                                    executor_args=dict(workers=12, flatten=False, pool=PreloadedPool),
                                     chunksize=500000,
+                                    metadata_cache=metacache,
                                     )
 
     output_data = processor.run_uproot_job(dataDS,
                                     treename='ffNtuplizer/ffNtuple',
-                                    processor_instance=LjTkIsoProcessor(data_type='data', bothNeutral=False),
+                                    processor_instance=LjTkIsoProcessor(data_type='data', mapping=dataMAP, bothNeutral=False),
                                     executor=processor.futures_executor,
-                                    executor_args=dict(workers=12, flatten=False),
+                                    executor_args=dict(workers=12, flatten=False, pool=PreloadedPool),
                                     chunksize=500000,
+                                    metadata_cache=metacache,
                                     )
 
     ## min pfiso05 noPU
@@ -514,7 +526,7 @@ if __name__ == "__main__":
     #                                 treename='ffNtuplizer/ffNtuple',
     #                                 processor_instance=LjTkIsoProcessorSig(),
     #                                 executor=processor.futures_executor,
-    #                                 executor_args=dict(workers=12, flatten=False),
+    #                                 executor_args=dict(workers=12, flatten=False, pool=PreloadedPool),
     #                                 chunksize=500000,
     #                                 )
     # channel_2mu2e = re.compile('2mu2e.*$')
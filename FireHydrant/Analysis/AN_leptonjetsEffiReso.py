@@ -11,7 +11,8 @@ import matplotlib.pyplot as plt
 from coffea import hist
 from coffea.analysis_objects import JaggedCandidateArray
 from FireHydrant.Analysis.DatasetMapLoader import (DatasetMapLoader,
-                                                   SigDatasetMapLoader)
+                                                   SigDatasetMapLoader,
+                                                   metadata_cache)
 from FireHydrant.Tools.correction import (get_nlo_weight_function,
                                           get_pu_weights_function,
                                           get_ttbar_weight)
@@ -27,14 +28,6 @@ parser = argparse.ArgumentParser(description="[AN] leptonjet efficiencies/resolu
 parser.add_argument("--sync", action='store_true', help="issue rsync command to sync plots folder to lxplus web server")
 args = parser.parse_args()
 
-# dml = DatasetMapLoader()
-# bkgDS, bkgMAP, bkgSCALE = dml.fetch('bkg')
-# dataDS, dataMAP = dml.fetch('data')
-
-sdml = SigDatasetMapLoader()
-sigDS_2mu2e, sigSCALE_2mu2e = sdml.fetch('2mu2e')
-sigDS_4mu, sigSCALE_4mu = sdml.fetch('4mu')
-
 
 class MuEffiResoProcessor(processor.ProcessorABC):
     def __init__(self):
@@ -433,6 +426,17 @@ if __name__ == "__main__":
     outdir = join(os.getenv('FH_BASE'), "Imgs", reldir)
     if not isdir(outdir): os.makedirs(outdir)
 
+    # dml = DatasetMapLoader()
+    # bkgDS, bkgMAP, bkgSCALE = dml.fetch('bkg')
+    # dataDS, dataMAP = dml.fetch('data')
+
+    sdml = SigDatasetMapLoader()
+    sigDS_2mu2e, sigSCALE_2mu2e = sdml.fetch('2mu2e')
+    sigDS_4mu, sigSCALE_4mu = sdml.fetch('4mu')
+
+    # recorded entries of v2 dataset files, chunked without opening them first
+    metacache = metadata_cache(sdml.get_metadata('2mu2e'))
+
     import re
     longdecay = re.compile('^.*_lxy-300$')
 
@@ -445,6 +449,7 @@ if __name__ == "__main__":
                                     executor=processor.futures_executor,
                                     executor_args=dict(workers=12, flatten=False),
                                     chunksize=500000,
+                                    metadata_cache=metacache,
                                     )
 
     fig, ax = plt.subplots(figsize=(8,6))
@@ -504,6 +509,7 @@ if __name__ == "__main__":
                                     executor=processor.futures_executor,
                                     executor_args=dict(workers=12, flatten=False),
                                     chunksize=500000,
+                                    metadata_cache=metacache,
                                     )
 
     fig, ax = plt.subplots(figsize=(8,6))
@@ -562,6 +568,7 @@ if __name__ == "__main__":
                                     executor=processor.futures_executor,
                                     executor_args=dict(workers=12, flatten=False),
                                     chunksize=500000,
+                                    metadata_cache=metacache,
                                     )
 
     fig, ax = plt.subplots(figsize=(8,6))
@@ -609,6 +616,7 @@ if __name__ == "__main__":
                                     executor=processor.futures_executor,
                                     executor_args=dict(workers=12, flatten=False),
                                     chunksize=500000,
+                                    metadata_cache=metacache,
                                     )
 
     fig, ax = plt.subplots(figsize=(8,6))
@@ -11,7 +11,8 @@ import matplotlib.pyplot as plt
 from coffea import hist
 from coffea.analysis_objects import JaggedCandidateArray
 from FireHydrant.Analysis.DatasetMapLoader import (DatasetMapLoader,
-                                                   SigDatasetMapLoader)
+                                                   SigDatasetMapLoader,
+                                                   metadata_cache)
 from FireHydrant.Tools.correction import (get_nlo_weight_function,
                                           get_pu_weights_function,
                                           get_ttbar_weight)
@@ -27,9 +28,6 @@ parser = argparse.ArgumentParser(description="[AN] leptonjet pair delta phi")
 parser.add_argument("--sync", action='store_true', help="issue rsync command to sync plots folder to lxplus web server")
 args = parser.parse_args()
 
-sdml = SigDatasetMapLoader()
-sigDS, sigSCALE = sdml.fetch('all')
-
 
 class MuLJVtxProcessor(processor.ProcessorABC):
     def __init__(self):
@@ -146,6 +144,12 @@ if __name__ == "__main__":
     outdir = join(os.getenv('FH_BASE'), "Imgs", reldir)
     if not isdir(outdir): os.makedirs(outdir)
 
+    sdml = SigDatasetMapLoader()
+    sigDS, sigSCALE = sdml.fetch('all')
+
+    # recorded entries of v2 dataset files, chunked without opening them first
+    metacache = metadata_cache(sdml.get_metadata('all'))
+
     import re
     longdecay = re.compile('^.*_lxy-300$')
 
@@ -155,6 +159,7 @@ if __name__ == "__main__":
                                     executor=processor.futures_executor,
                                     executor_args=dict(workers=12, flatten=False),
                                     chunksize=500000,
+                                    metadata_cache=metacache,
                                     )
 
     ## vertex efficiency
@@ -2,7 +2,9 @@
 
 import json
 import os
-from os.path import join, basename
+import pickle
+from collections import namedtuple
+from os.path import join, basename, isfile
 
 DATASET_BKG = join(os.getenv("FH_BASE"), "FireHydrant/Samples/latest/skimmed_backgrounds.json")
 DATASET_DATA = join(os.getenv("FH_BASE"), "FireHydrant/Samples/latest/skimmed_control_data2018.json")
@@ -15,21 +17,153 @@ SCALE_SIG_2MU2E = join(os.getenv('FH_BASE'), 'FireHydrant/Samples/latest/signal_
 
 LUMI = 59.74 * 1e3
 
+INDEX_DIR = join(os.getenv('FH_BASE'), 'FireHydrant/Samples/.index')
+
+
+SignalPoint = namedtuple('SignalPoint', ['channel', 'mXX', 'mA', 'lxy', 'paramtag'])
+
+## (mXX, mA) of the 'simple' signal set, at lxy 300 and 0.3
+SIMPLE_POINTS = [(100, 5), (1000, 0.25)]
+
+
+def decompose_paramtag(paramtag):
+    """mXX-1000_mA-0p8_lxy-300 => (1000, 0.8, 300)"""
+    paramtags = paramtag.split('_')
+    assert (len(paramtags) == 3)
+
+    res = []
+    for t in paramtags:
+        v = t.split('-')[1]
+        if 'p' in v:
+            res.append(float(v.replace('p', '.')))
+        else:
+            res.append(int(v))
+
+    return tuple(res)
+
+
+def _matches(value, condition):
+    """``condition``: None (anything), a value, a collection of values,
+    slice(lo, hi) for lo <= value <= hi (either end open with None), or a callable
+    """
+    if condition is None:
+        return True
+    if isinstance(condition, slice):
+        return (condition.start is None or value >= condition.start) and (condition.stop is None or value <= condition.stop)
+    if callable(condition):
+        return condition(value)
+    if isinstance(condition, (list, tuple, set, frozenset)):
+        return value in condition
+    return value == condition
+
+
+def load_index(name, paths):
+    """parsed content of the JSON files ``paths``.
+
+    A compiled (pickled) copy is kept under ``INDEX_DIR``, keyed by the
+    resolved symlink targets and their mtimes; it is used as long as the
+    ``latest`` links still point to the same, unmodified files. Returns
+    (list of parsed objects, True if the JSON files had to be parsed).
+    """
+    key = [(os.path.realpath(p), os.stat(p).st_mtime) for p in paths]
+    indexfn = join(INDEX_DIR, f'{name}.pkl')
+    if isfile(indexfn):
+        try:
+            with open(indexfn, 'rb') as f:
+                index = pickle.load(f)
+            if index['key'] == key:
+                return index['content'], False
+        except Exception:
+            pass
+
+    content = []
+    for p in paths:
+        with open(p) as f:
+            content.append(json.load(f))
+    try:
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        tmpfn = f'{indexfn}.{os.getpid()}'
+        with open(tmpfn, 'wb') as f:
+            pickle.dump(dict(key=key, content=content), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpfn, indexfn)
+    except OSError as e:
+        print(f">> Fail to write dataset index {indexfn}\n{str(e)}")
+    return content, True
+
+
+def filelist(entry):
+    """file names of a dataset entry, either a plain list (v1) or
+    {file: {nentries, treename, size, uuid}} (v2)
+    """
+    return list(entry)
+
+
+def filemetadata(entry):
+    """{file: metadata} of the v2 entries with known entries and uuid,
+    {} for v1 entries
+    """
+    if not isinstance(entry, dict):
+        return {}
+    return {f: m for f, m in entry.items() if m.get('nentries') is not None and m.get('uuid')}
+
+
+def metadata_cache(*metadata):
+    """``metadata_cache`` argument of ``run_uproot_job`` from v2 ``metadata``
+    ({dataset: {file: metadata}}, as ``get_metadata``), so that the job chunks
+    those files from their recorded entries instead of opening them first.
+    """
+    try:
+        from coffea.processor.executor import FileMeta
+    except ImportError as e:
+        raise ImportError("coffea without file metadata cache, v2 dataset entries cannot be used") from e
+
+    cache = {}
+    for md in metadata:
+        for dataset, files in md.items():
+            for f, m in files.items():
+                try:
+                    uuid = bytes.fromhex(m['uuid'])
+                except ValueError:
+                    uuid = m['uuid']
+                cache[FileMeta(dataset, f, m['treename'])] = {'numentries': m['nentries'], 'uuid': uuid}
+    return cache
+
 
 class DatasetMapLoader:
+    """backgrounds/data datasets, mapping and scales. Nothing is read until
+    first used, then the compiled index (``load_index``) is loaded once.
+    """
+
     def __init__(self, debug=True):
-        self.fBkg = json.load(open(DATASET_BKG))
-        self.fData = json.load(open(DATASET_DATA))
-        self.fBkgScale = json.load(open(SCALE_BKG))
+        self.debug = debug
         self.fLumi = LUMI
-        if debug:
-            print("DatasetMapLoader loading...")
-            print('+'*50)
-            print("@ Backgrounds -->", basename(os.readlink(DATASET_BKG)))
-            print("@ Data        -->", basename(os.readlink(DATASET_DATA)))
-            print("@ bkg scale   -->", basename(os.readlink(SCALE_BKG)))
-            print(f"@ Lumi set as --> {LUMI}/pb")
-            print('+'*50)
+        self._content = None
+
+    def _load(self):
+        if self._content is None:
+            self._content, parsed = load_index('datasetmap', [DATASET_BKG, DATASET_DATA, SCALE_BKG])
+            if self.debug:
+                print("DatasetMapLoader loading...")
+                print('+'*50)
+                print("@ Backgrounds -->", basename(os.readlink(DATASET_BKG)))
+                print("@ Data        -->", basename(os.readlink(DATASET_DATA)))
+                print("@ bkg scale   -->", basename(os.readlink(SCALE_BKG)))
+                print(f"@ Lumi set as --> {LUMI}/pb")
+                print(f"@ Index       --> {'rebuilt' if parsed else 'cached'}")
+                print('+'*50)
+        return self._content
+
+    @property
+    def fBkg(self):
+        return self._load()[0]
+
+    @property
+    def fData(self):
+        return self._load()[1]
+
+    @property
+    def fBkgScale(self):
+        return self._load()[2]
 
     def get_mapping(self, which):
         mapping = {}
@@ -43,16 +177,23 @@ class DatasetMapLoader:
         return mapping
 
 
-    def get_datasets(self, which):
-        datasets = {}
+    def _entries(self, which):
+        entries = {}
         if which == "bkg":
-            datasets = {tag: self.fBkg[group][tag] for group in self.fBkg for tag in self.fBkg[group]}
+            entries = {tag: self.fBkg[group][tag] for group in self.fBkg for tag in self.fBkg[group]}
         if which == "data":
-            datasets = self.fData
+            entries = dict(self.fData)
         if which == "both":
-            datasets = {tag: self.fBkg[group][tag] for group in self.fBkg for tag in self.fBkg[group]}
-            datasets.update(self.fData)
-        return datasets
+            entries = {tag: self.fBkg[group][tag] for group in self.fBkg for tag in self.fBkg[group]}
+            entries.update(self.fData)
+        return entries
+
+    def get_datasets(self, which):
+        return {k: filelist(v) for k, v in self._entries(which).items()}
+
+    def get_metadata(self, which):
+        """{dataset: {file: metadata}}, empty for v1 dataset files"""
+        return {k: filemetadata(v) for k, v in self._entries(which).items()}
 
     def get_bkgscales(self):
         scales = {tag: self.fBkgScale[group][tag] for group in self.fBkgScale for tag in self.fBkgScale[group]}
@@ -71,21 +212,44 @@ class DatasetMapLoader:
 
 
 class SigDatasetMapLoader:
+    """signal datasets and scales, loaded lazily like ``DatasetMapLoader``"""
+
     def __init__(self, debug=True):
-        self.fSig4mu = json.load(open(DATASET_SIG_4MU))
-        self.fSig2mu2e = json.load(open(DATASET_SIG_2MU2E))
-        self.fScale4mu = json.load(open(SCALE_SIG_4MU))
-        self.fScale2mu2e = json.load(open(SCALE_SIG_2MU2E))
+        self.debug = debug
         self.fLumi = LUMI
-        if debug:
-            print("SigDatasetMapLoader loading...")
-            print("+"*80)
-            print("@ 4mu   / scale -->", basename(os.readlink(DATASET_SIG_4MU)), '/', basename(os.readlink(SCALE_SIG_4MU)))
-            print("@ 2mu2e / scale -->", basename(os.readlink(DATASET_SIG_2MU2E)), '/', basename(os.readlink(SCALE_SIG_2MU2E)))
-            print(f"@ Lumi set as   --> {LUMI}/pb")
-            print("+"*80)
+        self._content = None
+        self._grid = None
 
-    def get_datasets(self, which):
+    def _load(self):
+        if self._content is None:
+            self._content, parsed = load_index('sigdatasetmap', [DATASET_SIG_4MU, DATASET_SIG_2MU2E, SCALE_SIG_4MU, SCALE_SIG_2MU2E])
+            if self.debug:
+                print("SigDatasetMapLoader loading...")
+                print("+"*80)
+                print("@ 4mu   / scale -->", basename(os.readlink(DATASET_SIG_4MU)), '/', basename(os.readlink(SCALE_SIG_4MU)))
+                print("@ 2mu2e / scale -->", basename(os.readlink(DATASET_SIG_2MU2E)), '/', basename(os.readlink(SCALE_SIG_2MU2E)))
+                print(f"@ Lumi set as   --> {LUMI}/pb")
+                print(f"@ Index         --> {'rebuilt' if parsed else 'cached'}")
+                print("+"*80)
+        return self._content
+
+    @property
+    def fSig4mu(self):
+        return self._load()[0]
+
+    @property
+    def fSig2mu2e(self):
+        return self._load()[1]
+
+    @property
+    def fScale4mu(self):
+        return self._load()[2]
+
+    @property
+    def fScale2mu2e(self):
+        return self._load()[3]
+
+    def _entries(self, which):
         res = {}
         if which == "all":
             res.update({f'4mu/{k}': self.fSig4mu[k] for k in self.fSig4mu})
@@ -95,21 +259,19 @@ class SigDatasetMapLoader:
         elif which == "2mu2e":
             res.update(self.fSig2mu2e)
         elif which == "simple":
-            res.update({
-                '4mu/mXX-100_mA-5_lxy-300': self.fSig4mu['mXX-100_mA-5_lxy-300'],
-                '4mu/mXX-1000_mA-0p25_lxy-300': self.fSig4mu['mXX-1000_mA-0p25_lxy-300'],
-                '2mu2e/mXX-100_mA-5_lxy-300': self.fSig2mu2e['mXX-100_mA-5_lxy-300'],
-                '2mu2e/mXX-1000_mA-0p25_lxy-300': self.fSig2mu2e['mXX-1000_mA-0p25_lxy-300'],
-
-                '4mu/mXX-100_mA-5_lxy-0p3': self.fSig4mu['mXX-100_mA-5_lxy-0p3'],
-                '4mu/mXX-1000_mA-0p25_lxy-0p3': self.fSig4mu['mXX-1000_mA-0p25_lxy-0p3'],
-                '2mu2e/mXX-100_mA-5_lxy-0p3': self.fSig2mu2e['mXX-100_mA-5_lxy-0p3'],
-                '2mu2e/mXX-1000_mA-0p25_lxy-0p3': self.fSig2mu2e['mXX-1000_mA-0p25_lxy-0p3'],
-            })
+            points = self.query(lxy={300, 0.3}, where=lambda p: (p.mXX, p.mA) in SIMPLE_POINTS)
+            res.update({f'{p.channel}/{p.paramtag}': self._channel(p.channel)[p.paramtag] for p in points})
         else:
             raise ValueError("`which` can only be all/4mu/2mu2e/simple.")
         return res
 
+    def get_datasets(self, which):
+        return {k: filelist(v) for k, v in self._entries(which).items()}
+
+    def get_metadata(self, which):
+        """{dataset: {file: metadata}}, empty for v1 dataset files"""
+        return {k: filemetadata(v) for k, v in self._entries(which).items()}
+
     def get_scales(self, which):
         res = {}
         if which == "all":
@@ -120,17 +282,8 @@ class SigDatasetMapLoader:
         elif which == "2mu2e":
             res.update(self.fScale2mu2e)
         elif which == "simple":
-            res.update({
-                '4mu/mXX-100_mA-5_lxy-300': self.fScale4mu['mXX-100_mA-5_lxy-300'],
-                '4mu/mXX-1000_mA-0p25_lxy-300': self.fScale4mu['mXX-1000_mA-0p25_lxy-300'],
-                '2mu2e/mXX-100_mA-5_lxy-300':self.fScale2mu2e['mXX-100_mA-5_lxy-300'],
-                '2mu2e/mXX-1000_mA-0p25_lxy-300': self.fScale2mu2e['mXX-1000_mA-0p25_lxy-300'],
-
-                '4mu/mXX-100_mA-5_lxy-0p3': self.fScale4mu['mXX-100_mA-5_lxy-0p3'],
-                '4mu/mXX-1000_mA-0p25_lxy-0p3': self.fScale4mu['mXX-1000_mA-0p25_lxy-0p3'],
-                '2mu2e/mXX-100_mA-5_lxy-0p3': self.fScale2mu2e['mXX-100_mA-5_lxy-0p3'],
-                '2mu2e/mXX-1000_mA-0p25_lxy-0p3': self.fScale2mu2e['mXX-1000_mA-0p25_lxy-0p3'],
-            })
+            points = self.query(lxy={300, 0.3}, where=lambda p: (p.mXX, p.mA) in SIMPLE_POINTS)
+            res.update({f'{p.channel}/{p.paramtag}': self._channel(p.channel, scale=True)[p.paramtag] for p in points})
         else:
             raise ValueError("`which` can only be all/4mu/2mu2e/simple.")
 
@@ -141,6 +294,51 @@ class SigDatasetMapLoader:
     def fetch(self, which="all"):
         return self.get_datasets(which), self.get_scales(which)
 
+    def _channel(self, channel, scale=False):
+        if channel == '4mu':
+            return self.fScale4mu if scale else self.fSig4mu
+        if channel == '2mu2e':
+            return self.fScale2mu2e if scale else self.fSig2mu2e
+        raise ValueError("`channel` can only be 4mu/2mu2e.")
+
+    @property
+    def grid(self):
+        """all signal datasets as ``SignalPoint`` (channel, mXX, mA, lxy, paramtag)"""
+        if self._grid is None:
+            self._grid = [SignalPoint(channel, *decompose_paramtag(paramtag), paramtag)
+                          for channel in ('4mu', '2mu2e') for paramtag in self._channel(channel)]
+        return self._grid
+
+    def query(self, channel=None, mXX=None, mA=None, lxy=None, where=None):
+        """signal points passing all given conditions, see ``_matches``
+        for what a condition can be; ``where`` is a predicate on the ``SignalPoint``.
+
+        e.g. query(channel='4mu', mXX=slice(100, 200), mA={0.25, 5}, lxy=300)
+        """
+        conditions = dict(channel=channel, mXX=mXX, mA=mA, lxy=lxy)
+        return [p for p in self.grid
+                if all(_matches(getattr(p, k), c) for k, c in conditions.items())
+                and (where is None or where(p))]
+
+    def _grid_entries(self, channel=None, mXX=None, mA=None, lxy=None, where=None):
+        bare = isinstance(channel, str)
+        return {(p.paramtag if bare else f'{p.channel}/{p.paramtag}'): p
+                for p in self.query(channel=channel, mXX=mXX, mA=mA, lxy=lxy, where=where)}
+
+    def fetch_grid(self, channel=None, mXX=None, mA=None, lxy=None, where=None):
+        """(datasets, scales) of the signal points selected like ``query``.
+        Keys are 'channel/paramtag' as fetch('all'), or bare paramtags as
+        fetch('4mu')/fetch('2mu2e') when ``channel`` is a single channel name.
+        """
+        points = self._grid_entries(channel=channel, mXX=mXX, mA=mA, lxy=lxy, where=where)
+        datasets = {k: filelist(self._channel(p.channel)[p.paramtag]) for k, p in points.items()}
+        scales = {k: self.fLumi/1e3 * self._channel(p.channel, scale=True)[p.paramtag] for k, p in points.items()}
+        return datasets, scales
+
+    def get_grid_metadata(self, channel=None, mXX=None, mA=None, lxy=None, where=None):
+        """{dataset: {file: metadata}} of the datasets of ``fetch_grid``"""
+        points = self._grid_entries(channel=channel, mXX=mXX, mA=mA, lxy=lxy, where=where)
+        return {k: filemetadata(self._channel(p.channel)[p.paramtag]) for k, p in points.items()}
 
 
 if __name__ == "__main__":
@@ -154,4 +352,5 @@ if __name__ == "__main__":
     print(sdml.fetch())
     print(sdml.fetch("4mu"))
     print(sdml.fetch("2mu2e"))
-    print(sdml.fetch("simple"))
\ No newline at end of file
+    print(sdml.fetch("simple"))
+    print(sdml.fetch_grid(channel='4mu', mXX=slice(100, 200), mA={0.25, 5}, lxy=300))
\ No newline at end of file
@@ -7,18 +7,14 @@ import coffea.processor as processor
 import numpy as np
 from coffea import hist
 from coffea.analysis_objects import JaggedCandidateArray
-from FireHydrant.Analysis.DatasetMapLoader import DatasetMapLoader
-from FireHydrant.Tools.correction import (get_nlo_weight_function,
-                                          get_pu_weights_function,
+from FireHydrant.Analysis.DatasetMapLoader import (DatasetMapLoader,
+                                                   metadata_cache)
+from FireHydrant.Tools.correction import (CORRECTIONS, PreloadedPool,
                                           get_ttbar_weight)
 from FireHydrant.Tools.metfilter import MetFilters
 from FireHydrant.Tools.trigger import Triggers
 from FireHydrant.Tools.uproothelpers import fromNestNestIndexArray
 
-dml = DatasetMapLoader()
-# bkgDS, bkgMAP, bkgSCALE = dml.fetch('bkg')
-dataDS, dataMAP = dml.fetch('data')
-
 
 """list events"""
 class LeptonjetEventDrawer(processor.ProcessorABC):
@@ -35,10 +31,7 @@ class LeptonjetEventDrawer(processor.ProcessorABC):
             'era_2': processor.column_accumulator(np.zeros(shape=(0,))),
         })
 
-        self.pucorrs = get_pu_weights_function()
-        ## NOT applied for now
-        self.nlo_w = get_nlo_weight_function('w')
-        self.nlo_z = get_nlo_weight_function('z')
+        self.pucorrs = 'pileup'
 
 
     @property
@@ -59,7 +52,7 @@ class LeptonjetEventDrawer(processor.ProcessorABC):
         if self.data_type!='data':
             wgts.add('genw', df['weight'])
             npv = df['trueInteractionNum']
-            wgts.add('pileup', *(f(npv) for f in self.pucorrs))
+            wgts.add('pileup', *CORRECTIONS[self.pucorrs](npv).T)
 
         triggermask = np.logical_or.reduce([df[t] for t in Triggers])
         wgts.add('trigger', triggermask)
@@ -193,12 +186,20 @@ class LeptonjetEventDrawer(processor.ProcessorABC):
 if __name__ == "__main__":
     import pandas as pd
 
+    dml = DatasetMapLoader()
+    # bkgDS, bkgMAP, bkgSCALE = dml.fetch('bkg')
+    dataDS, dataMAP = dml.fetch('data')
+
+    # recorded entries of v2 dataset files, chunked without opening them first
+    metacache = metadata_cache(dml.get_metadata('data'))
+
     out_ = processor.run_uproot_job(dataDS,
                                   treename='ffNtuplizer/ffNtuple',
                                   processor_instance=LeptonjetEventDrawer(data_type='data'),
                                   executor=processor.futures_executor,
-                                  executor_args=dict(workers=12, flatten=False),
+                                  executor_args=dict(workers=12, flatten=False, pool=PreloadedPool),
                                   chunksize=500000,
+                                  metadata_cache=metacache,
                                  )
 
     df_4mu = pd.DataFrame(
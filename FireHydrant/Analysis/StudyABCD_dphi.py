@@ -10,9 +10,10 @@ import matplotlib.pyplot as plt
 from coffea import hist
 from coffea.analysis_objects import JaggedCandidateArray
 from FireHydrant.Analysis.DatasetMapLoader import (DatasetMapLoader,
-                                                   SigDatasetMapLoader)
-from FireHydrant.Tools.correction import (get_nlo_weight_function,
-                                          get_pu_weights_function,
+                                                   SigDatasetMapLoader,
+                                                   metadata_cache)
+from FireHydrant.Analysis.Utils import DatasetGrouping
+from FireHydrant.Tools.correction import (CORRECTIONS, PreloadedPool,
                                           get_ttbar_weight)
 from FireHydrant.Tools.metfilter import MetFilters
 from FireHydrant.Tools.trigger import Triggers
@@ -25,19 +26,13 @@ parser.add_argument("--sync", action='store_true', help="issue rsync command to
 args = parser.parse_args()
 
 
-dml = DatasetMapLoader()
-dataDS, dataMAP = dml.fetch('data')
-bkgDS, bkgMAP, bkgSCALE = dml.fetch('bkg')
-
-sdml = SigDatasetMapLoader()
-sigDS_2mu2e, sigSCALE_2mu2e = sdml.fetch('2mu2e')
-sigDS_4mu, sigSCALE_4mu = sdml.fetch('4mu')
-
-
-
 class LjDphiABCDProcessor(processor.ProcessorABC):
-    def __init__(self, data_type='bkg'):
+    def __init__(self, data_type='bkg', groupatfill=True, grouping=None, scales=None, mapping=None):
         self.data_type = data_type
+        self.groupatfill = groupatfill
+        self.grouping = grouping
+        self.scales = scales
+        self.mapping = mapping
 
         dataset_axis = hist.Cat('dataset', 'dataset')
         dphi_axis = hist.Bin('dphi', '$\Delta\phi$', 8, 0, np.pi)
@@ -47,10 +42,7 @@ class LjDphiABCDProcessor(processor.ProcessorABC):
             'chan-2mu2e': hist.Hist('Counts', dataset_axis, dphi_axis, categ_axis),
         })
 
-        self.pucorrs = get_pu_weights_function()
-        ## NOT applied for now
-        self.nlo_w = get_nlo_weight_function('w')
-        self.nlo_z = get_nlo_weight_function('z')
+        self.pucorrs = 'pileup'
 
     @property
     def accumulator(self):
@@ -64,8 +56,11 @@ class LjDphiABCDProcessor(processor.ProcessorABC):
         wgts = processor.Weights(df.size)
         if self.data_type!='data':
             wgts.add('genw', df['weight'])
+            if self.data_type=='bkg' and self.groupatfill:
+                dataset = self.grouping.fill_weights(dataset, wgts, df.size)
+                if dataset is None: return output
             npv = df['trueInteractionNum']
-            wgts.add('pileup', *(f(npv) for f in self.pucorrs))
+            wgts.add('pileup', *CORRECTIONS[self.pucorrs](npv).T)
 
         triggermask = np.logical_or.reduce([df[t] for t in Triggers])
         wgts.add('trigger', triggermask)
@@ -177,18 +172,13 @@ class LjDphiABCDProcessor(processor.ProcessorABC):
         origidentity = list(accumulator)
         for k in origidentity:
             if self.data_type == 'bkg':
-                accumulator[k].scale(bkgSCALE, axis='dataset')
-                accumulator[k] = accumulator[k].group("dataset",
-                                                    hist.Cat("cat", "datasets", sorting='integral'),
-                                                    bkgMAP)
+                accumulator[k] = self.grouping.finalize(accumulator[k], atfill=self.groupatfill)
             if self.data_type == 'data':
                 accumulator[k] = accumulator[k].group("dataset",
                                                     hist.Cat("cat", "datasets",),
-                                                    dataMAP)
-            if self.data_type == 'sig-2mu2e':
-                accumulator[k].scale(sigSCALE_2mu2e, axis='dataset')
-            if self.data_type == 'sig-4mu':
-                accumulator[k].scale(sigSCALE_4mu, axis='dataset')
+                                                    self.mapping)
+            if self.data_type in ('sig-2mu2e', 'sig-4mu'):
+                accumulator[k].scale(self.scales, axis='dataset')
 
         return accumulator
 
@@ -204,37 +194,52 @@ if __name__ == "__main__":
     outdir = join(os.getenv('FH_BASE'), "Imgs", reldir)
     if not isdir(outdir): os.makedirs(outdir)
 
+    dml = DatasetMapLoader()
+    dataDS, dataMAP = dml.fetch('data')
+    bkgDS, bkgMAP, bkgSCALE = dml.fetch('bkg')
+    bkgGROUPING = DatasetGrouping(bkgMAP, bkgSCALE)
+
+    sdml = SigDatasetMapLoader()
+    sigDS_2mu2e, sigSCALE_2mu2e = sdml.fetch('2mu2e')
+    sigDS_4mu, sigSCALE_4mu = sdml.fetch('4mu')
+
+    # recorded entries of v2 dataset files, chunked without opening them first
+    metacache = metadata_cache(dml.get_metadata('both'), sdml.get_metadata('2mu2e'), sdml.get_metadata('4mu'))
 
     output_2mu2e = processor.run_uproot_job(sigDS_2mu2e,
                                     treename='ffNtuplizer/ffNtuple',
-                                    processor_instance=LjDphiABCDProcessor(data_type='sig-2mu2e'),
+                                    processor_instance=LjDphiABCDProcessor(data_type='sig-2mu2e', scales=sigSCALE_2mu2e),
                                     executor=processor.futures_executor,
-                                    executor_args=dict(workers=12, flatten=False),
+                                    executor_args=dict(workers=12, flatten=False, pool=PreloadedPool),
                                     chunksize=500000,
+                                    metadata_cache=metacache,
                                     )
 
     output_4mu = processor.run_uproot_job(sigDS_4mu,
                                     treename='ffNtuplizer/ffNtuple',
-                                    processor_instance=LjDphiABCDProcessor(data_type='sig-4mu'),
+                                    processor_instance=LjDphiABCDProcessor(data_type='sig-4mu', scales=sigSCALE_4mu),
                                     executor=processor.futures_executor,
-                                    executor_args=dict(workers=12, flatten=False),
+                                    executor_args=dict(workers=12, flatten=False, pool=PreloadedPool),
                                     chunksize=500000,
+                                    metadata_cache=metacache,
                                     )
 
     output_bkg = processor.run_uproot_job(bkgDS,
                                     treename='ffNtuplizer/ffNtuple',
-                                    processor_instance=LjDphiABCDProcessor(data_type='bkg'),
+                                    processor_instance=LjDphiABCDProcessor(data_type='bkg', grouping=bkgGROUPING),
                                     executor=processor.futures_executor,
-                                    executor_args=dict(workers=12, flatten=False),
+                                    executor_args=dict(workers=12, flatten=False, pool=PreloadedPool),
                                     chunksize=500000,
+                                    metadata_cache=metacache,
                                     )
 
     output_data = processor.run_uproot_job(dataDS,
                                     treename='ffNtuplizer/ffNtuple',
-                                    processor_instance=LjDphiABCDProcessor(data_type='data'),
+                                    processor_instance=LjDphiABCDProcessor(data_type='data', mapping=dataMAP),
                                     executor=processor.futures_executor,
-                                    executor_args=dict(workers=12, flatten=False),
+                                    executor_args=dict(workers=12, flatten=False, pool=PreloadedPool),
                                     chunksize=500000,
+                                    metadata_cache=metacache,
                                     )
 
     sampleSig = re.compile('mXX-150_mA-0p25_lxy-300|mXX-500_mA-1p2_lxy-300|mXX-800_mA-5_lxy-300')
@@ -11,7 +11,8 @@ import matplotlib.pyplot as plt
 from coffea import hist
 from coffea.analysis_objects import JaggedCandidateArray
 from FireHydrant.Analysis.DatasetMapLoader import (DatasetMapLoader,
-                                                   SigDatasetMapLoader)
+                                                   SigDatasetMapLoader,
+                                                   metadata_cache)
 from FireHydrant.Tools.correction import (get_nlo_weight_function,
                                           get_pu_weights_function,
                                           get_ttbar_weight)
@@ -29,9 +30,6 @@ import ROOT
 ROOT.gROOT.SetBatch()
 
 
-dml = DatasetMapLoader()
-dataDS, dataMAP = dml.fetch('data')
-
 @contextmanager
 def _setIgnoreLevel(level):
     originalLevel = ROOT.gErrorIgnoreLevel
@@ -153,6 +151,12 @@ if __name__ == "__main__":
     outdir = join(os.getenv('FH_BASE'), "Imgs", reldir)
     if not isdir(outdir): os.makedirs(outdir)
 
+    dml = DatasetMapLoader()
+    dataDS, dataMAP = dml.fetch('data')
+
+    # recorded entries of v2 dataset files, chunked without opening them first
+    metacache = metadata_cache(dml.get_metadata('data'))
+
     SetROOTHistStyle()
 
     outputs = {}
@@ -166,6 +170,7 @@ if __name__ == "__main__":
                                         executor=processor.futures_executor,
                                         executor_args=dict(workers=12, flatten=False),
                                         chunksize=500000,
+                                        metadata_cache=metacache,
                                         )
 
         hist_title = f'#Delta#phi(LJ0, LJ1), LJ0 {CHOICES[c[0]]} & LJ1 {CHOICES[c[1]]}'
@@ -10,9 +10,9 @@ import matplotlib.pyplot as plt
 from coffea import hist
 from coffea.analysis_objects import JaggedCandidateArray
 from FireHydrant.Analysis.DatasetMapLoader import (DatasetMapLoader,
-                                                   SigDatasetMapLoader)
-from FireHydrant.Tools.correction import (get_nlo_weight_function,
-                                          get_pu_weights_function,
+                                                   SigDatasetMapLoader,
+                                                   metadata_cache)
+from FireHydrant.Tools.correction import (CORRECTIONS, PreloadedPool,
                                           get_ttbar_weight)
 from FireHydrant.Tools.metfilter import MetFilters
 from FireHydrant.Tools.trigger import Triggers
@@ -27,23 +27,18 @@ parser = argparse.ArgumentParser(description="[AN] about hadronic jets")
 parser.add_argument("--sync", action='store_true', help="issue rsync command to sync plots folder to lxplus web server")
 args = parser.parse_args()
 
-sdml = SigDatasetMapLoader()
-sigDS_2mu2e, sigSCALE_2mu2e = sdml.fetch('2mu2e')
-sigDS_4mu, sigSCALE_4mu = sdml.fetch('4mu')
-
 class GenJetProcessor(processor.ProcessorABC):
-    def __init__(self, data_type = 'sig-2mu2e'):
+    def __init__(self, data_type = 'sig-2mu2e', grouping=None, scales=None):
         self.data_type = data_type
+        self.grouping = grouping
+        self.scales = scales
 
         dataset_axis = hist.Cat('dataset', 'dataset')
         count_axis = hist.Bin('cnt', 'Number of Jets', 10, 0, 10)
         self._accumulator = processor.dict_accumulator({
             'njets': hist.Hist('Counts', dataset_axis, count_axis),
         })
-        self.pucorrs = get_pu_weights_function()
-        ## NOT applied for now
-        self.nlo_w = get_nlo_weight_function('w')
-        self.nlo_z = get_nlo_weight_function('z')
+        self.pucorrs = 'pileup'
 
     @property
     def accumulator(self):
@@ -59,7 +54,7 @@ class GenJetProcessor(processor.ProcessorABC):
         if self.data_type!='data':
             wgts.add('genw', df['weight'])
             npv = df['trueInteractionNum']
-            wgts.add('pileup', *(f(npv) for f in self.pucorrs))
+            wgts.add('pileup', *CORRECTIONS[self.pucorrs](npv).T)
 
         triggermask = np.logical_or.reduce([df[t] for t in Triggers])
         wgts.add('trigger', triggermask)
@@ -101,18 +96,13 @@ class GenJetProcessor(processor.ProcessorABC):
         origidentity = list(accumulator)
         for k in origidentity:
             if self.data_type == 'bkg':
-                accumulator[k].scale(bkgSCALE, axis='dataset')
-                accumulator[k] = accumulator[k].group("dataset",
-                                                    hist.Cat("cat", "datasets", sorting='integral'),
-                                                    bkgMAP)
+                accumulator[k] = self.grouping.finalize(accumulator[k], atfill=False)
             # if self.data_type == 'data':
             #     accumulator[k] = accumulator[k].group("dataset",
             #                                         hist.Cat("cat", "datasets",),
             #                                         dataMAP)
-            if self.data_type == 'sig-2mu2e':
-                accumulator[k].scale(sigSCALE_2mu2e, axis='dataset')
-            if self.data_type == 'sig-4mu':
-                accumulator[k].scale(sigSCALE_4mu, axis='dataset')
+            if self.data_type in ('sig-2mu2e', 'sig-4mu'):
+                accumulator[k].scale(self.scales, axis='dataset')
 
         return accumulator
 
@@ -125,19 +115,28 @@ if __name__ == "__main__":
     outdir = join(os.getenv('FH_BASE'), "Imgs", reldir)
     if not isdir(outdir): os.makedirs(outdir)
 
+    sdml = SigDatasetMapLoader()
+    sigDS_2mu2e, sigSCALE_2mu2e = sdml.fetch('2mu2e')
+    sigDS_4mu, sigSCALE_4mu = sdml.fetch('4mu')
+
+    # recorded entries of v2 dataset files, chunked without opening them first
+    metacache = metadata_cache(sdml.get_metadata('2mu2e'), sdml.get_metadata('4mu'))
+
     out_sig2mu2e = processor.run_uproot_job(sigDS_2mu2e,
                                   treename='ffNtuplizer/ffNtuple',
-                                  processor_instance=GenJetProcessor(data_type='sig-2mu2e'),
+                                  processor_instance=GenJetProcessor(data_type='sig-2mu2e', scales=sigSCALE_2mu2e),
                                   executor=processor.futures_executor,
-                                  executor_args=dict(workers=12, flatten=False),
+                                  executor_args=dict(workers=12, flatten=False, pool=PreloadedPool),
                                   chunksize=500000,
+                                  metadata_cache=metacache,
                                  )
     out_sig4mu = processor.run_uproot_job(sigDS_4mu,
                                   treename='ffNtuplizer/ffNtuple',
-                                  processor_instance=GenJetProcessor(data_type='sig-4mu'),
+                                  processor_instance=GenJetProcessor(data_type='sig-4mu', scales=sigSCALE_4mu),
                                   executor=processor.futures_executor,
-                                  executor_args=dict(workers=12, flatten=False),
+                                  executor_args=dict(workers=12, flatten=False, pool=PreloadedPool),
                                   chunksize=500000,
+                                  metadata_cache=metacache,
                                  )
 
     import re
@@ -11,9 +11,10 @@ import numpy as np
 import uproot
 from coffea import hist
 from coffea.analysis_objects import JaggedCandidateArray
-from FireHydrant.Analysis.DatasetMapLoader import DatasetMapLoader
-from FireHydrant.Tools.correction import (get_nlo_weight_function,
-                                          get_pu_weights_function,
+from FireHydrant.Analysis.DatasetMapLoader import (DatasetMapLoader,
+                                                   metadata_cache)
+from FireHydrant.Analysis.Utils import DatasetGrouping
+from FireHydrant.Tools.correction import (CORRECTIONS, PreloadedPool,
                                           get_ttbar_weight)
 from FireHydrant.Tools.metfilter import MetFilters
 from FireHydrant.Tools.trigger import Triggers
@@ -28,16 +29,13 @@ parser.add_argument("--sync", action='store_true', help="issue rsync command to
 args = parser.parse_args()
 
 
-dml = DatasetMapLoader()
-bkgDS, bkgMAP, bkgSCALE = dml.fetch('bkg')
-dataDS, dataMAP = dml.fetch('data')
-
-
 """Leptonjet hadronic jet splitting"""
 class LeptonjetHadronicjetProcessor(processor.ProcessorABC):
-    def __init__(self, dphi_control=False, data_type='bkg'):
+    def __init__(self, dphi_control=False, data_type='bkg', grouping=None, mapping=None):
         self.dphi_control = dphi_control
         self.data_type = data_type
+        self.grouping = grouping
+        self.mapping = mapping
 
         dataset_axis = hist.Cat('dataset', 'dataset')
         pt_axis = hist.Bin('pt', '$p_T$ [GeV]', 60, 0, 300)
@@ -48,10 +46,7 @@ class LeptonjetHadronicjetProcessor(processor.ProcessorABC):
             'pt': hist.Hist('Counts', dataset_axis, pt_axis, channel_axis, njet_axis),
         })
 
-        self.pucorrs = get_pu_weights_function()
-        ## NOT applied for now
-        self.nlo_w = get_nlo_weight_function('w')
-        self.nlo_z = get_nlo_weight_function('z')
+        self.pucorrs = 'pileup'
 
     @property
     def accumulator(self):
@@ -68,7 +63,7 @@ class LeptonjetHadronicjetProcessor(processor.ProcessorABC):
         if self.data_type!='data':
             wgts.add('genw', df['weight'])
             npv = df['trueInteractionNum']
-            wgts.add('pileup', *(f(npv) for f in self.pucorrs))
+            wgts.add('pileup', *CORRECTIONS[self.pucorrs](npv).T)
 
         triggermask = np.logical_or.reduce([df[t] for t in Triggers])
         wgts.add('trigger', triggermask)
@@ -161,14 +156,11 @@ class LeptonjetHadronicjetProcessor(processor.ProcessorABC):
         origidentity = list(accumulator)
         for k in origidentity:
             if self.data_type == 'bkg':
-                accumulator[k].scale(bkgSCALE, axis='dataset')
-                accumulator[k+'_cat'] = accumulator[k].group("dataset",
-                                                    hist.Cat("cat", "datasets", sorting='integral'),
-                                                    bkgMAP)
+                accumulator[k+'_cat'] = self.grouping.finalize(accumulator[k], atfill=False)
             if self.data_type == 'data':
                 accumulator[k+'_cat'] = accumulator[k].group("dataset",
                                                     hist.Cat("cat", "datasets",),
-                                                    dataMAP)
+                                                    self.mapping)
         return accumulator
 
 
@@ -254,20 +246,30 @@ if __name__ == "__main__":
     outdir = join(os.getenv('FH_BASE'), "Imgs", __file__.split('.')[0])
     if not isdir(outdir): os.makedirs(outdir)
 
+    dml = DatasetMapLoader()
+    bkgDS, bkgMAP, bkgSCALE = dml.fetch('bkg')
+    bkgGROUPING = DatasetGrouping(bkgMAP, bkgSCALE)
+    dataDS, dataMAP = dml.fetch('data')
+
+    # recorded entries of v2 dataset files, chunked without opening them first
+    metacache = metadata_cache(dml.get_metadata('both'))
+
     outputs = {}
     outputs['bkg'] = processor.run_uproot_job(bkgDS,
                                   treename='ffNtuplizer/ffNtuple',
-                                  processor_instance=LeptonjetHadronicjetProcessor(dphi_control=True, data_type='bkg'),
+                                  processor_instance=LeptonjetHadronicjetProcessor(dphi_control=True, data_type='bkg', grouping=bkgGROUPING),
                                   executor=processor.futures_executor,
-                                  executor_args=dict(workers=12, flatten=True),
+                                  executor_args=dict(workers=12, flatten=True, pool=PreloadedPool),
                                   chunksize=500000,
+                                  metadata_cache=metacache,
                                  )
     outputs['data'] = processor.run_uproot_job(dataDS,
                                   treename='ffNtuplizer/ffNtuple',
-                                  processor_instance=LeptonjetHadronicjetProcessor(dphi_control=True, data_type='data'),
+                                  processor_instance=LeptonjetHadronicjetProcessor(dphi_control=True, data_type='data', mapping=dataMAP),
                                   executor=processor.futures_executor,
-                                  executor_args=dict(workers=12, flatten=True),
+                                  executor_args=dict(workers=12, flatten=True, pool=PreloadedPool),
                                   chunksize=500000,
+                                  metadata_cache=metacache,
                                  )
 
     plotsmap = plot_datamc(outputs)
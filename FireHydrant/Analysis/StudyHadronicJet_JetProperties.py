@@ -12,11 +12,12 @@ import uproot
 from coffea import hist
 from coffea.analysis_objects import JaggedCandidateArray
 from FireHydrant.Analysis.DatasetMapLoader import (DatasetMapLoader,
-                                                   SigDatasetMapLoader)
+                                                   SigDatasetMapLoader,
+                                                   metadata_cache)
+from FireHydrant.Analysis.Utils import DatasetGrouping
 from FireHydrant.Analysis.StudyLeadingSubleading import (filterSigDS,
                                                          groupHandleLabel)
-from FireHydrant.Tools.correction import (get_nlo_weight_function,
-                                          get_pu_weights_function,
+from FireHydrant.Tools.correction import (CORRECTIONS, PreloadedPool,
                                           get_ttbar_weight)
 from FireHydrant.Tools.metfilter import MetFilters
 from FireHydrant.Tools.trigger import Triggers
@@ -31,18 +32,14 @@ parser.add_argument("--sync", action='store_true', help="issue rsync command to
 args = parser.parse_args()
 
 
-sdml = SigDatasetMapLoader()
-sigDS_2mu2e, sigSCALE_2mu2e = sdml.fetch('2mu2e')
-sigDS_4mu, sigSCALE_4mu = sdml.fetch('4mu')
-
-dml = DatasetMapLoader()
-bkgDS, bkgMAP, bkgSCALE = dml.fetch('bkg')
-dataDS, dataMAP = dml.fetch('data')
-
 """Hadronic jet properties"""
 class HadronicjetPropertyProcessor(processor.ProcessorABC):
-    def __init__(self, data_type, region='SR'):
+    def __init__(self, data_type, region='SR', groupatfill=True, grouping=None, scales=None, mapping=None):
         self.data_type = data_type
+        self.groupatfill = groupatfill
+        self.grouping = grouping
+        self.scales = scales
+        self.mapping = mapping
         self.region = region
 
         dataset_axis = hist.Cat('dataset', 'dataset')
@@ -57,10 +54,7 @@ class HadronicjetPropertyProcessor(processor.ProcessorABC):
             'njet': hist.Hist('Counts', dataset_axis, count_axis, channel_axis),
         })
 
-        self.pucorrs = get_pu_weights_function()
-        ## NOT applied for now
-        self.nlo_w = get_nlo_weight_function('w')
-        self.nlo_z = get_nlo_weight_function('z')
+        self.pucorrs = 'pileup'
 
     @property
     def accumulator(self):
@@ -76,8 +70,11 @@ class HadronicjetPropertyProcessor(processor.ProcessorABC):
         wgts = processor.Weights(df.size)
         if self.data_type!='data':
             wgts.add('genw', df['weight'])
+            if self.data_type=='bkg' and self.groupatfill:
+                dataset = self.grouping.fill_weights(dataset, wgts, df.size)
+                if dataset is None: return output
             npv = df['trueInteractionNum']
-            wgts.add('pileup', *(f(npv) for f in self.pucorrs))
+            wgts.add('pileup', *CORRECTIONS[self.pucorrs](npv).T)
 
         triggermask = np.logical_or.reduce([df[t] for t in Triggers])
         wgts.add('trigger', triggermask)
@@ -177,18 +174,13 @@ class HadronicjetPropertyProcessor(processor.ProcessorABC):
         origidentity = list(accumulator)
         for k in origidentity:
             if self.data_type == 'bkg':
-                accumulator[k].scale(bkgSCALE, axis='dataset')
-                accumulator[k] = accumulator[k].group("dataset",
-                                                    hist.Cat("cat", "datasets", sorting='integral'),
-                                                    bkgMAP)
+                accumulator[k] = self.grouping.finalize(accumulator[k], atfill=self.groupatfill)
             if self.data_type == 'data':
                 accumulator[k] = accumulator[k].group("dataset",
                                                     hist.Cat("cat", "datasets",),
-                                                    dataMAP)
-            if self.data_type == 'sig-2mu2e':
-                accumulator[k].scale(sigSCALE_2mu2e, axis='dataset')
-            if self.data_type == 'sig-4mu':
-                accumulator[k].scale(sigSCALE_4mu, axis='dataset')
+                                                    self.mapping)
+            if self.data_type in ('sig-2mu2e', 'sig-4mu'):
+                accumulator[k].scale(self.scales, axis='dataset')
 
         return accumulator
 
@@ -201,6 +193,18 @@ if __name__ == "__main__":
     outdir = join(os.getenv('FH_BASE'), "Imgs", reldir)
     if not isdir(outdir): os.makedirs(outdir)
 
+    sdml = SigDatasetMapLoader()
+    sigDS_2mu2e, sigSCALE_2mu2e = sdml.fetch('2mu2e')
+    sigDS_4mu, sigSCALE_4mu = sdml.fetch('4mu')
+
+    dml = DatasetMapLoader()
+    bkgDS, bkgMAP, bkgSCALE = dml.fetch('bkg')
+    bkgGROUPING = DatasetGrouping(bkgMAP, bkgSCALE)
+    dataDS, dataMAP = dml.fetch('data')
+
+    # recorded entries of v2 dataset files, chunked without opening them first
+    metacache = metadata_cache(dml.get_metadata('both'), sdml.get_metadata('2mu2e'), sdml.get_metadata('4mu'))
+
     fill_opts = {
         'edgecolor': (0,0,0,0.3),
         'alpha': 0.8
@@ -217,18 +221,20 @@ if __name__ == "__main__":
     outputs = {}
     outputs['bkg'] = processor.run_uproot_job(bkgDS,
                                   treename='ffNtuplizer/ffNtuple',
-                                  processor_instance=HadronicjetPropertyProcessor(data_type='bkg', region='SR'),
+                                  processor_instance=HadronicjetPropertyProcessor(data_type='bkg', grouping=bkgGROUPING, region='SR'),
                                   executor=processor.futures_executor,
-                                  executor_args=dict(workers=12, flatten=True),
+                                  executor_args=dict(workers=12, flatten=True, pool=PreloadedPool),
                                   chunksize=500000,
+                                  metadata_cache=metacache,
                                  )
 
     outputs['sig-2mu2e'] = processor.run_uproot_job(filterSigDS(sigDS_2mu2e),
                                   treename='ffNtuplizer/ffNtuple',
-                                  processor_instance=HadronicjetPropertyProcessor(region='SR', data_type='sig-2mu2e'),
+                                  processor_instance=HadronicjetPropertyProcessor(region='SR', data_type='sig-2mu2e', scales=sigSCALE_2mu2e),
                                   executor=processor.futures_executor,
-                                  executor_args=dict(workers=12, flatten=True),
+                                  executor_args=dict(workers=12, flatten=True, pool=PreloadedPool),
                                   chunksize=500000,
+                                  metadata_cache=metacache,
                                  )
 
     ## CHANNEL - 2mu2e
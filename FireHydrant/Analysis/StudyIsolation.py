@@ -14,9 +14,10 @@ import uproot
 from coffea import hist
 from coffea.analysis_objects import JaggedCandidateArray
 from FireHydrant.Analysis.DatasetMapLoader import (DatasetMapLoader,
-                                                   SigDatasetMapLoader)
-from FireHydrant.Tools.correction import (get_nlo_weight_function,
-                                          get_pu_weights_function,
+                                                   SigDatasetMapLoader,
+                                                   metadata_cache)
+from FireHydrant.Analysis.Utils import DatasetGrouping
+from FireHydrant.Tools.correction import (CORRECTIONS, PreloadedPool,
                                           get_ttbar_weight)
 from FireHydrant.Tools.metfilter import MetFilters
 from FireHydrant.Tools.trigger import Triggers
@@ -32,19 +33,14 @@ parser.add_argument("--sync", action='store_true', help="issue rsync command to
 args = parser.parse_args()
 
 
-dml = DatasetMapLoader()
-bkgDS, bkgMAP, bkgSCALE = dml.fetch('bkg')
-dataDS, dataMAP = dml.fetch('data')
-
-sdml = SigDatasetMapLoader()
-sigDS, sigSCALE = sdml.fetch('simple')
-
-
 """Leptonjet Isolation."""
 class LeptonJetIsoProcessor(processor.ProcessorABC):
-    def __init__(self, dphi_control=False, data_type='bkg'):
+    def __init__(self, dphi_control=False, data_type='bkg', grouping=None, scales=None, mapping=None):
         self.dphi_control = dphi_control
         self.data_type = data_type
+        self.grouping = grouping
+        self.scales = scales
+        self.mapping = mapping
         dataset_axis = hist.Cat('dataset', 'dataset')
         lj0iso_axis = hist.Bin('lj0iso', 'iso value', 20, 0, 1)
         lj1iso_axis = hist.Bin('lj1iso', 'iso value', 20, 0, 1)
@@ -56,10 +52,7 @@ class LeptonJetIsoProcessor(processor.ProcessorABC):
             'ljpfiso': hist.Hist('Counts', dataset_axis, lj0iso_axis, lj1iso_axis, type_axis, channel_axis, njet_axis)
         })
 
-        ## NOT applied for now
-        self.pucorrs = get_pu_weights_function()
-        self.nlo_w = get_nlo_weight_function('w')
-        self.nlo_z = get_nlo_weight_function('z')
+        self.pucorrs = 'pileup'
 
     @property
     def accumulator(self):
@@ -176,16 +169,13 @@ class LeptonJetIsoProcessor(processor.ProcessorABC):
         origidentity = list(accumulator)
         for k in origidentity:
             if self.data_type == 'bkg':
-                accumulator[k].scale(bkgSCALE, axis='dataset')
-                accumulator[k+'_cat'] = accumulator[k].group("dataset",
-                                                             hist.Cat("cat", "datasets", sorting='integral'),
-                                                             bkgMAP)
+                accumulator[k+'_cat'] = self.grouping.finalize(accumulator[k], atfill=False)
             if self.data_type == 'data':
                 accumulator[k+'_cat'] = accumulator[k].group("dataset",
                                                              hist.Cat("cat", "datasets",),
-                                                             dataMAP)
+                                                             self.mapping)
             if self.data_type == 'sig':
-                accumulator[k].scale(sigSCALE, axis='dataset')
+                accumulator[k].scale(self.scales, axis='dataset')
         return accumulator
 
 
@@ -258,28 +248,42 @@ if __name__ == "__main__":
     outdir = join(os.getenv('FH_BASE'), "Imgs", __file__.split('.')[0])
     if not isdir(outdir): os.makedirs(outdir)
 
+    dml = DatasetMapLoader()
+    bkgDS, bkgMAP, bkgSCALE = dml.fetch('bkg')
+    bkgGROUPING = DatasetGrouping(bkgMAP, bkgSCALE)
+    dataDS, dataMAP = dml.fetch('data')
+
+    sdml = SigDatasetMapLoader()
+    sigDS, sigSCALE = sdml.fetch('simple')
+
+    # recorded entries of v2 dataset files, chunked without opening them first
+    metacache = metadata_cache(dml.get_metadata('both'), sdml.get_metadata('simple'))
+
     outputs = {}
     outputs['bkg'] = processor.run_uproot_job(bkgDS,
                                   treename='ffNtuplizer/ffNtuple',
-                                  processor_instance=LeptonJetIsoProcessor(),
+                                  processor_instance=LeptonJetIsoProcessor(grouping=bkgGROUPING),
                                   executor=processor.futures_executor,
-                                  executor_args=dict(workers=12, flatten=True),
+                                  executor_args=dict(workers=12, flatten=True, pool=PreloadedPool),
                                   chunksize=500000,
+                                  metadata_cache=metacache,
                                  )
     outputs['data'] = processor.run_uproot_job(dataDS,
                                   treename='ffNtuplizer/ffNtuple',
-                                  processor_instance=LeptonJetIsoProcessor(dphi_control=True, data_type='data'),
+                                  processor_instance=LeptonJetIsoProcessor(dphi_control=True, data_type='data', mapping=dataMAP),
                                   executor=processor.futures_executor,
-                                  executor_args=dict(workers=12, flatten=True),
+                                  executor_args=dict(workers=12, flatten=True, pool=PreloadedPool),
                                   chunksize=500000,
+                                  metadata_cache=metacache,
                                  )
 
     outputs['sig'] = processor.run_uproot_job(sigDS,
                                   treename='ffNtuplizer/ffNtuple',
-                                  processor_instance=LeptonJetIsoProcessor(dphi_control=False, data_type='sig'),
+                                  processor_instance=LeptonJetIsoProcessor(dphi_control=False, data_type='sig', scales=sigSCALE),
                                   executor=processor.futures_executor,
-                                  executor_args=dict(workers=12, flatten=True),
+                                  executor_args=dict(workers=12, flatten=True, pool=PreloadedPool),
                                   chunksize=500000,
+                                  metadata_cache=metacache,
                                  )
 
     for iso in ['all05', 'nopu05', 'dbeta']:
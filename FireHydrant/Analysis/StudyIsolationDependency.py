@@ -11,9 +11,10 @@ import numpy as np
 from coffea import hist
 from coffea.analysis_objects import JaggedCandidateArray
 from FireHydrant.Analysis.DatasetMapLoader import (DatasetMapLoader,
-                                                   SigDatasetMapLoader)
-from FireHydrant.Tools.correction import (get_nlo_weight_function,
-                                          get_pu_weights_function,
+                                                   SigDatasetMapLoader,
+                                                   metadata_cache)
+from FireHydrant.Analysis.Utils import DatasetGrouping
+from FireHydrant.Tools.correction import (CORRECTIONS, PreloadedPool,
                                           get_ttbar_weight)
 from FireHydrant.Tools.metfilter import MetFilters
 from FireHydrant.Tools.trigger import Triggers
@@ -27,14 +28,6 @@ import ROOT
 ROOT.gROOT.SetBatch()
 
 
-sdml = SigDatasetMapLoader()
-sigDS, sigSCALE = sdml.fetch()
-
-dml = DatasetMapLoader()
-bkgDS, bkgMAP, bkgSCALE = dml.fetch('bkg')
-dataDS, dataMAP = dml.fetch('data')
-
-
 @contextmanager
 def _setIgnoreLevel(level):
     originalLevel = ROOT.gErrorIgnoreLevel
@@ -44,9 +37,10 @@ def _setIgnoreLevel(level):
 
 """Leptonjet isolation, pt, """
 class LeptonjetIsoProcessor(processor.ProcessorABC):
-    def __init__(self, dphi_control=False, data_type='sig'):
+    def __init__(self, dphi_control=False, data_type='sig', grouping=None):
         self.dphi_control = dphi_control
         self.data_type = data_type
+        self.grouping = grouping
 
         dataset_axis = hist.Cat('dataset', 'dataset')
         self._accumulator = processor.dict_accumulator({
@@ -63,10 +57,7 @@ class LeptonjetIsoProcessor(processor.ProcessorABC):
             'channel': processor.column_accumulator(np.zeros(shape=(0,))),
         })
 
-        self.pucorrs = get_pu_weights_function()
-        ## NOT applied for now
-        self.nlo_w = get_nlo_weight_function('w')
-        self.nlo_z = get_nlo_weight_function('z')
+        self.pucorrs = 'pileup'
 
     @property
     def accumulator(self):
@@ -82,7 +73,7 @@ class LeptonjetIsoProcessor(processor.ProcessorABC):
         if self.data_type!='data':
             wgts.add('genw', df['weight'])
             npv = df['trueInteractionNum']
-            wgts.add('pileup', *(f(npv) for f in self.pucorrs))
+            wgts.add('pileup', *CORRECTIONS[self.pucorrs](npv).T)
 
         triggermask = np.logical_or.reduce([df[t] for t in Triggers])
         wgts.add('trigger', triggermask)
@@ -153,7 +144,7 @@ class LeptonjetIsoProcessor(processor.ProcessorABC):
 
 
         if self.data_type == 'bkg':
-            wgt *= bkgSCALE[dataset]
+            wgt *= self.grouping.scales[dataset]
 
         output['all05'] += processor.column_accumulator(dileptonjets.pfisoAll05.flatten())
         output['nopu05'] += processor.column_accumulator(dileptonjets.pfisoNopu05.flatten())
@@ -226,6 +217,17 @@ if __name__ == "__main__":
     outdir = join(os.getenv('FH_BASE'), "Imgs", __file__.split('.')[0])
     if not isdir(outdir): os.makedirs(outdir)
 
+    sdml = SigDatasetMapLoader()
+    sigDS, sigSCALE = sdml.fetch()
+
+    dml = DatasetMapLoader()
+    bkgDS, bkgMAP, bkgSCALE = dml.fetch('bkg')
+    bkgGROUPING = DatasetGrouping(bkgMAP, bkgSCALE)
+    dataDS, dataMAP = dml.fetch('data')
+
+    # recorded entries of v2 dataset files, chunked without opening them first
+    metacache = metadata_cache(dml.get_metadata('both'), sdml.get_metadata('all'))
+
     hprofs_pt, hprofs_eta = {}, {}
 
     print('[signal]')
@@ -233,8 +235,9 @@ if __name__ == "__main__":
                                       treename='ffNtuplizer/ffNtuple',
                                       processor_instance=LeptonjetIsoProcessor(),
                                       executor=processor.futures_executor,
-                                      executor_args=dict(workers=12, flatten=True),
+                                      executor_args=dict(workers=12, flatten=True, pool=PreloadedPool),
                                       chunksize=500000,
+                                      metadata_cache=metacache,
                                       )
 
 
@@ -262,10 +265,11 @@ if __name__ == "__main__":
     print('[background]')
     output = processor.run_uproot_job(bkgDS,
                                       treename='ffNtuplizer/ffNtuple',
-                                      processor_instance=LeptonjetIsoProcessor(data_type='bkg'),
+                                      processor_instance=LeptonjetIsoProcessor(data_type='bkg', grouping=bkgGROUPING),
                                       executor=processor.futures_executor,
-                                      executor_args=dict(workers=12, flatten=True),
+                                      executor_args=dict(workers=12, flatten=True, pool=PreloadedPool),
                                       chunksize=500000,
+                                      metadata_cache=metacache,
                                       )
 
 
@@ -294,8 +298,9 @@ if __name__ == "__main__":
                                       treename='ffNtuplizer/ffNtuple',
                                       processor_instance=LeptonjetIsoProcessor(dphi_control=True, data_type='data'),
                                       executor=processor.futures_executor,
-                                      executor_args=dict(workers=12, flatten=True),
+                                      executor_args=dict(workers=12, flatten=True, pool=PreloadedPool),
                                       chunksize=500000,
+                                      metadata_cache=metacache,
                                       )
 
 
@@ -11,7 +11,9 @@ import numpy as np
 from coffea import hist
 from coffea.analysis_objects import JaggedCandidateArray
 from FireHydrant.Analysis.DatasetMapLoader import (DatasetMapLoader,
-                                                   SigDatasetMapLoader)
+                                                   SigDatasetMapLoader,
+                                                   metadata_cache)
+from FireHydrant.Analysis.Utils import DatasetGrouping
 from FireHydrant.Tools.correction import (get_nlo_weight_function,
                                           get_pu_weights_function,
                                           get_ttbar_weight)
@@ -29,13 +31,6 @@ import ROOT
 ROOT.gROOT.SetBatch()
 
 
-sdml = SigDatasetMapLoader()
-sigDS, sigSCALE = sdml.fetch('2mu2e')
-
-dml = DatasetMapLoader()
-bkgDS, bkgMAP, bkgSCALE = dml.fetch('bkg')
-dataDS, dataMAP = dml.fetch('data')
-
 @contextmanager
 def _setIgnoreLevel(level):
     originalLevel = ROOT.gErrorIgnoreLevel
@@ -73,6 +68,17 @@ if __name__ == "__main__":
     outdir = join(os.getenv('FH_BASE'), "Imgs", reldir)
     if not isdir(outdir): os.makedirs(outdir)
 
+    sdml = SigDatasetMapLoader()
+    sigDS, sigSCALE = sdml.fetch('2mu2e')
+
+    dml = DatasetMapLoader()
+    bkgDS, bkgMAP, bkgSCALE = dml.fetch('bkg')
+    bkgGROUPING = DatasetGrouping(bkgMAP, bkgSCALE)
+    dataDS, dataMAP = dml.fetch('data')
+
+    # recorded entries of v2 dataset files, chunked without opening them first
+    metacache = metadata_cache(dml.get_metadata('both'), sdml.get_metadata('2mu2e'))
+
     histos = {}
 
     print('[signal]')
@@ -84,6 +90,7 @@ if __name__ == "__main__":
                                       executor=processor.futures_executor,
                                       executor_args=dict(workers=12, flatten=True),
                                       chunksize=500000,
+                                      metadata_cache=metacache,
                                       )
     print("Filling..")
     histos['sig'] = {}
@@ -93,10 +100,11 @@ if __name__ == "__main__":
     print('[background]')
     output = processor.run_uproot_job(bkgDS,
                                       treename='ffNtuplizer/ffNtuple',
-                                      processor_instance=LeptonjetIsoProcessor(dphi_control=False, data_type='bkg'),
+                                      processor_instance=LeptonjetIsoProcessor(dphi_control=False, data_type='bkg', grouping=bkgGROUPING),
                                       executor=processor.futures_executor,
                                       executor_args=dict(workers=12, flatten=True),
                                       chunksize=500000,
+                                      metadata_cache=metacache,
                                       )
     print("Filling..")
     histos['bkg'] = root_filling(output, 'bkg')
@@ -108,6 +116,7 @@ if __name__ == "__main__":
                                       executor=processor.futures_executor,
                                       executor_args=dict(workers=12, flatten=True),
                                       chunksize=500000,
+                                      metadata_cache=metacache,
                                       )
     print("Filling..")
     histos['data'] = root_filling(output, 'data')
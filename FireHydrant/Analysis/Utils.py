@@ -1,5 +1,8 @@
 #!/usr/bin/env python
 """Utilities collection for Analysis"""
+import numpy as np
+from coffea import hist
+
 
 def sigsort(param):
     # mXX-1000_mA-0p25_lxy-0p3
@@ -9,3 +12,47 @@ def sigsort(param):
     lxy = float(params_[2].split('-')[-1].replace('p', '.'))
 
     return lxy*1e6 + mxx*1e3 + ma
+
+
+class DatasetGrouping:
+    """per-dataset scale and dataset->category mapping, e.g. bkgSCALE/bkgMAP.
+
+    In fill-time mode a processor calls ``fill_weights`` for the chunk being
+    processed and fills the returned category with pre-scaled weights, so the
+    accumulators carry one bin per category instead of one per dataset tag.
+    ``finalize`` turns either flavour into the ``cat`` axis that the plotting
+    code expects. Dataset tags without a category are dropped in both modes,
+    as ``h.group`` does.
+    """
+
+    def __init__(self, mapping, scales):
+        self.mapping = mapping
+        self.scales = scales
+        self._category = {tag: cat for cat, tags in mapping.items() for tag in tags}
+
+    def category(self, dataset):
+        """category name, scale of dataset; None if it belongs to no category"""
+        if dataset not in self._category:
+            return None
+        return self._category[dataset], self.scales[dataset]
+
+    def fill_weights(self, dataset, wgts, n):
+        """add the cross-section scale of dataset to coffea Weights `wgts`
+        of a chunk of `n` events, return the category to fill (None to skip)
+        """
+        res = self.category(dataset)
+        if res is None:
+            return None
+        cat, xsecscale = res
+        wgts.add('xsecscale', np.full(n, xsecscale))
+        return cat
+
+    def finalize(self, h, atfill, sorting='integral'):
+        """dataset axis -> cat axis for histogram `h`,
+        scaling per dataset first unless it was done at fill time
+        """
+        cataxis = hist.Cat("cat", "datasets", sorting=sorting)
+        if atfill:
+            return h.group("dataset", cataxis, {c: [c] for c in self.mapping})
+        h.scale(self.scales, axis='dataset')
+        return h.group("dataset", cataxis, self.mapping)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""FeatureWriter partitions and load_trainingdata"""
+import sys
+from os.path import abspath, dirname
+
+import numpy as np
+import pytest
+
+pytest.importorskip('pyarrow')
+pytest.importorskip('pandas')
+sys.path.insert(0, dirname(dirname(abspath(__file__))))  # BDT scripts import their siblings by module name
+from trainingdata import FEATURES, FeatureWriter, categorize, load_trainingdata
+
+
+def chunk(rng, n, notrackfraction):
+    matrix = rng.rand(n, len(FEATURES)).astype(np.float32)
+    matrix[:, FEATURES.index('nef')] = np.where(rng.rand(n) < notrackfraction, 1., 0.5)
+    return matrix
+
+
+def test_round_trip(tmp_path):
+    rng = np.random.RandomState(11)
+    writer = FeatureWriter(str(tmp_path / 'td'))
+    written = []
+    for dataset, label in [('2mu2e/mXX-100_mA-5_lxy-300', 1), ('TTJets', 0)]:
+        for _ in range(2):
+            matrix = chunk(rng, 300, 0.4)
+            writer.append(dataset, matrix, np.full(len(matrix), label))
+            written.append((dataset, label, matrix))
+
+    for category in ('notrack', 'tracked'):
+        df = load_trainingdata(writer.outdir, category)
+        assert list(df.columns) == FEATURES + ['label']
+        expected = np.concatenate([m[categorize(m[:, FEATURES.index('nef')]) == category] for _, _, m in written])
+        assert len(df) == len(expected)
+        # same rows, whatever the file order
+        np.testing.assert_array_equal(np.sort(df[FEATURES].to_numpy(), axis=0), np.sort(expected, axis=0))
+        nsignal = sum((categorize(m[:, FEATURES.index('nef')]) == category).sum() for _, l, m in written if l == 1)
+        assert (df['label'].astype(int) == 1).sum() == nsignal
+
+    df = load_trainingdata(writer.outdir, 'notrack', columns=['pt', 'label'], datasets=['TTJets'])
+    assert list(df.columns) == ['pt', 'label'] and (df['label'].astype(int) == 0).all()
+
+
+def test_mixed_labels_in_one_chunk(tmp_path):
+    rng = np.random.RandomState(12)
+    writer = FeatureWriter(str(tmp_path / 'td'))
+    matrix = chunk(rng, 500, 1.)
+    label = rng.rand(500) < 0.5
+    writer.append('4mu/mXX-500_mA-1p2_lxy-30', matrix, label)
+    df = load_trainingdata(writer.outdir, 'notrack')
+    assert (df['label'].astype(int) == 1).sum() == label.sum()
+
+
+def test_refuses_nonempty_outdir(tmp_path):
+    rng = np.random.RandomState(13)
+    writer = FeatureWriter(str(tmp_path / 'td'))
+    matrix = chunk(rng, 100, 1.)
+    writer.append('TTJets', matrix, np.zeros(100))
+
+    with pytest.raises(FileExistsError):
+        FeatureWriter(writer.outdir)
+    FeatureWriter(writer.outdir, overwrite=True).append('TTJets', matrix, np.zeros(100))
+    assert len(load_trainingdata(writer.outdir, 'notrack')) == 100
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""WorkingPoints against a brute-force roc curve"""
+import sys
+from os.path import abspath, dirname
+
+import numpy as np
+import pytest
+
+pytest.importorskip('pandas')
+sys.path.insert(0, dirname(dirname(abspath(__file__))))  # BDT scripts import their siblings by module name
+from workingpoints import WorkingPoints
+
+
+def sample(seed, n=2000, weighted=True):
+    rng = np.random.RandomState(seed)
+    y = rng.rand(n) < 0.3
+    score = np.round(rng.normal(y * 1.5, 1.), 2)  # rounded, so that there are ties
+    weight = rng.exponential(size=n) if weighted else np.ones(n)
+    groups = rng.choice(['TTJets', 'DYJetsToLL', 'QCD'], size=n)
+    return y, score, weight, groups
+
+
+def brute_force(y, score, weight, groups, cut):
+    """efficiencies of score >= cut"""
+    sel = score >= cut
+    res = dict(tpr=weight[sel & y].sum() / weight[y].sum(), fpr=weight[sel & ~y].sum() / weight[~y].sum())
+    for g in np.unique(groups):
+        res[g] = weight[sel & (groups == g)].sum() / weight[groups == g].sum()
+    return res
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_roc_points(seed):
+    y, score, weight, groups = sample(seed)
+    wp = WorkingPoints(y, score, weight=weight, groups=groups)
+
+    np.testing.assert_array_equal(wp.thresholds[1:], np.unique(score)[::-1])
+    assert wp.fpr[0] == wp.tpr[0] == 0 and wp.fpr[-1] == wp.tpr[-1] == 1
+    for i, cut in enumerate(wp.thresholds):
+        ref = brute_force(y, score, weight, groups, cut)
+        assert wp.tpr[i] == pytest.approx(ref['tpr'])
+        assert wp.fpr[i] == pytest.approx(ref['fpr'])
+        for g, eff in wp.groupeff.items():
+            assert eff[i] == pytest.approx(ref[g])
+
+
+def test_auc():
+    y, score, weight, groups = sample(0, n=500, weighted=False)
+    wp = WorkingPoints(y, score)
+    # probability that a signal outscores a background, ties counting half
+    diff = score[y][:, None] - score[~y][None, :]
+    ref = ((diff > 0).sum() + 0.5 * (diff == 0).sum()) / diff.size
+    assert wp.auc == pytest.approx(ref)
+
+
+def test_queries():
+    y, score, weight, groups = sample(1)
+    wp = WorkingPoints(y, score, weight=weight, groups=groups)
+
+    cuts = np.array([-10., -0.5, 0., 0.37, 1.2, 10.])
+    for cut, i in zip(cuts, wp.index_threshold(cuts)):
+        # loosest point not selecting more than score >= cut
+        assert wp.thresholds[i] >= cut
+        assert i == len(wp.thresholds) - 1 or wp.thresholds[i+1] < cut
+        assert wp.tpr[i] == pytest.approx(brute_force(y, score, weight, groups, cut)['tpr'])
+
+    targets = np.array([0., 1e-3, 0.01, 0.1, 0.5, 1.])
+    for t, i in zip(targets, wp.index_fpr(targets)):
+        assert i == len(wp.fpr) - 1 or (wp.fpr[i] > t and wp.fpr[i-1] <= t)
+    for t, i in zip(targets, wp.index_tpr(targets)):
+        assert wp.tpr[i] >= t and (i == 0 or wp.tpr[i-1] < t)
+
+    table = wp.table(fpr=targets, tpr=targets, thresholds=cuts)
+    assert list(table['query']) == ['fpr'] * 6 + ['tpr'] * 6 + ['threshold'] * 6
+    np.testing.assert_array_equal(table['tpr'][12:], wp.tpr[wp.index_threshold(cuts)])
+    assert {'eff_TTJets', 'eff_DYJetsToLL', 'eff_QCD'} <= set(table.columns)
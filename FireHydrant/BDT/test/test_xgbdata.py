@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""RowIndex of a small partitioned training dataset"""
+import sys
+from os.path import abspath, dirname
+
+import numpy as np
+import pytest
+
+pytest.importorskip('pyarrow')
+pytest.importorskip('xgboost')
+sys.path.insert(0, dirname(dirname(abspath(__file__))))  # BDT scripts import their siblings by module name
+from trainingdata import FEATURES, FeatureWriter
+from xgbdata import RowIndex
+
+
+@pytest.fixture
+def trainingdata(tmp_path):
+    """notrack rows of a signal and two background datasets, a few files each"""
+    rng = np.random.RandomState(7)
+    writer = FeatureWriter(str(tmp_path / 'trainingdata'))
+    for dataset, label, nchunks in [('4mu/mXX-100_mA-5_lxy-300', 1, 2), ('TTJets', 0, 3), ('DYJetsToLL-M-50', 0, 2)]:
+        for _ in range(nchunks):
+            matrix = rng.rand(rng.randint(50, 200), len(FEATURES)).astype(np.float32)
+            matrix[:, FEATURES.index('nef')] = 1.
+            writer.append(dataset, matrix, np.full(len(matrix), label))
+    return writer.outdir
+
+
+def test_rows(trainingdata):
+    import pyarrow.parquet as pq
+
+    index = RowIndex(trainingdata, 'notrack')
+    assert len(index.files) == 7
+    assert len(RowIndex(trainingdata, 'tracked').files) == 0
+    np.testing.assert_array_equal(index.counts, [pq.read_metadata(f).num_rows for f in index.files])
+    assert len(index) == index.counts.sum() == len(index.label_array()) == len(index.dataset_array())
+    for f, label, dataset in zip(index.files, index.labels, index.datasets):
+        assert f'label={label}' in f
+        assert dataset in ('4mu/mXX-100_mA-5_lxy-300', 'TTJets', 'DYJetsToLL-M-50')
+        assert (label == 1) == dataset.startswith('4mu/')
+
+
+@pytest.mark.parametrize('balance', [True, False])
+def test_split(trainingdata, balance):
+    index = RowIndex(trainingdata, 'notrack')
+    train, test = index.split(0.7, seed=3, balance=balance)
+
+    assert np.all(np.diff(train) > 0) and np.all(np.diff(test) > 0)
+    assert np.intersect1d(train, test).size == 0
+    assert len(test) == len(index) - int(round(0.7 * len(index)))
+
+    y = index.label_array()
+    if balance:
+        assert (y[train] == 0).sum() == (y[train] == 1).sum() > 0
+        unbalanced, _ = index.split(0.7, seed=3, balance=False)
+        assert np.isin(train, unbalanced).all()
+        assert (y[train] == 1).sum() == min((y[unbalanced] == 0).sum(), (y[unbalanced] == 1).sum())
+    else:
+        np.testing.assert_array_equal(np.union1d(train, test), np.arange(len(index)))
+
+    again = index.split(0.7, seed=3, balance=balance)
+    np.testing.assert_array_equal(again[0], train)
+    np.testing.assert_array_equal(again[1], test)
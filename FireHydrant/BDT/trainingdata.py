@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""on-disk layout of BDT training data (Parquet dataset)
+
+Rows are leptonjets, columns the float32 ``FEATURES``. Files are partitioned
+hive-style by category, label and source dataset::
+
+    <outdir>/category=notrack/label=1/dataset=4mu%2FmXX-100_mA-5_lxy-300/<uuid>.parquet
+
+so a training reads only the partition and columns it needs, and row-group
+statistics let filters on feature columns skip row groups.
+"""
+import os
+import shutil
+import uuid
+from os.path import join
+from urllib.parse import quote
+
+import numpy as np
+
+FEATURES = [
+    'pt', 'eta', 'nef', 'maxd0', 'mind0', 'maxd0sig', 'mind0sig',
+    'tkiso05', 'pfiso05', 'tkiso06', 'pfiso06', 'tkiso07', 'pfiso07',
+    'spreadpt', 'spreaddr', 'lamb', 'epsi', 'ecfe1', 'ecfe2', 'ecfe3',
+]
+NOTRACK_NEF = 0.999
+
+
+def categorize(nef):
+    """category name per leptonjet, 'notrack' for nef >= 0.999, else 'tracked'"""
+    return np.where(nef >= NOTRACK_NEF, 'notrack', 'tracked')
+
+
+class FeatureWriter:
+    """append-only writer of the partitioned dataset. Each ``append`` writes
+    one file per (category, label) of the chunk, so it is safe to call from
+    concurrent workers and nothing has to be held in memory.
+
+    A non-empty ``outdir`` is refused, since its files would be read back
+    together with the new ones; ``overwrite=True`` removes it first.
+    """
+
+    def __init__(self, outdir, rowgroupsize=100000, overwrite=False):
+        if os.path.isdir(outdir) and os.listdir(outdir):
+            if not overwrite:
+                raise FileExistsError(f"{outdir} is not empty, remove it or pass overwrite=True")
+            shutil.rmtree(outdir)
+        self.outdir = outdir
+        self.rowgroupsize = rowgroupsize
+
+    def append(self, dataset, matrix, label):
+        """write ``matrix`` (nrows, len(FEATURES)) float32 with per-row ``label``"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        category = categorize(matrix[:, FEATURES.index('nef')])
+        label = np.asarray(label).astype(int)
+        for cat in np.unique(category):
+            for lab in np.unique(label):
+                mask = (category == cat) & (label == lab)
+                if not mask.any():
+                    continue
+                table = pa.Table.from_arrays([pa.array(matrix[mask, i]) for i in range(len(FEATURES))], names=FEATURES)
+                partdir = join(self.outdir, f'category={cat}', f'label={lab}', f'dataset={quote(dataset, safe="")}')
+                os.makedirs(partdir, exist_ok=True)
+                pq.write_table(table, join(partdir, f'{uuid.uuid4().hex}.parquet'),
+                               row_group_size=self.rowgroupsize, write_statistics=True)
+
+
+def load_trainingdata(path, category, columns=None, datasets=None):
+    """DataFrame of ``columns`` (default ``FEATURES`` + label) of one
+    ``category``, optionally restricted to source ``datasets``. Only the
+    matching partitions are read.
+    """
+    import pyarrow.dataset as ds
+
+    columns = columns or FEATURES + ['label']
+    dset = ds.dataset(path, format='parquet', partitioning='hive')
+    selection = ds.field('category') == category
+    if datasets:
+        selection = selection & ds.field('dataset').isin(list(datasets))
+    return dset.to_table(columns=columns, filter=selection).to_pandas()
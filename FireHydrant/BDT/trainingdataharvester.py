@@ -1,8 +1,15 @@
 #!/usr/bin/env python
 """collect feature variables from ffNtuples for BDT training
+
+Signal and background datasets run in one job. Each chunk's leptonjets are
+turned into one contiguous float32 ``FEATURES`` matrix and streamed to the
+partitioned Parquet dataset of ``trainingdata``; the label comes from the
+dataset's strategy in ``LABELERS``.
 """
+import os
+from os.path import join
+
 from coffea.analysis_objects import JaggedCandidateArray
-from coffea.processor import column_accumulator
 import coffea.processor as processor
 
 import numpy as np
@@ -11,140 +18,42 @@ np.seterr(divide='ignore', invalid='ignore', over='ignore')
 from FireHydrant.Tools.uproothelpers import NestNestObjArrayToJagged
 from FireHydrant.Tools.trigger import Triggers
 from FireHydrant.Tools.metfilter import MetFilters
+from FireHydrant.BDT.trainingdata import FEATURES, FeatureWriter
 
+def darkphoton_label(df, leptonjets):
+    """1 for leptonjets matched to a gen dark photon within deltaR 0.3"""
+    genparticles = JaggedCandidateArray.candidatesfromcounts(
+        df['gen_p4'],
+        px=df['gen_p4.fCoordinates.fX'],
+        py=df['gen_p4.fCoordinates.fY'],
+        pz=df['gen_p4.fCoordinates.fZ'],
+        energy=df['gen_p4.fCoordinates.fT'],
+        pid=df['gen_pid']
+    )
+    darkphotons = genparticles[genparticles.pid==32]
+    return leptonjets.match(darkphotons, deltaRCut=0.3)
 
-class SignalLeptonJetsFeatureHarvester(processor.ProcessorABC):
-    def __init__(self):
-
-        self._accumulator = processor.dict_accumulator({
-            'pt': column_accumulator(np.zeros(shape=(0,))),
-            'eta': column_accumulator(np.zeros(shape=(0,))),
-            'nef': column_accumulator(np.zeros(shape=(0,))),
-            'maxd0': column_accumulator(np.zeros(shape=(0,))),
-            'mind0': column_accumulator(np.zeros(shape=(0,))),
-            'maxd0sig': column_accumulator(np.zeros(shape=(0,))),
-            'mind0sig': column_accumulator(np.zeros(shape=(0,))),
-            'tkiso05': column_accumulator(np.zeros(shape=(0,))),
-            'pfiso05': column_accumulator(np.zeros(shape=(0,))),
-            'tkiso06': column_accumulator(np.zeros(shape=(0,))),
-            'pfiso06': column_accumulator(np.zeros(shape=(0,))),
-            'tkiso07': column_accumulator(np.zeros(shape=(0,))),
-            'pfiso07': column_accumulator(np.zeros(shape=(0,))),
-            'spreadpt': column_accumulator(np.zeros(shape=(0,))),
-            'spreaddr': column_accumulator(np.zeros(shape=(0,))),
-            'lamb': column_accumulator(np.zeros(shape=(0,))),
-            'epsi': column_accumulator(np.zeros(shape=(0,))),
-            'ecfe1': column_accumulator(np.zeros(shape=(0,))),
-            'ecfe2': column_accumulator(np.zeros(shape=(0,))),
-            'ecfe3': column_accumulator(np.zeros(shape=(0,))),
-            'label': column_accumulator(np.zeros(shape=(0,))),
-        })
-
-    @property
-    def accumulator(self):
-        return self._accumulator
-
-    def process(self, df):
-        output = self.accumulator.identity()
-
-        absd0 = np.abs(NestNestObjArrayToJagged(df['pfjet_pfcand_tkD0'])).fillna(0)
-        d0sig = NestNestObjArrayToJagged(df['pfjet_pfcand_tkD0Sig']).fillna(0)
-
-        leptonjets = JaggedCandidateArray.candidatesfromcounts(
-            df['pfjet_p4'],
-            px=df['pfjet_p4.fCoordinates.fX'],
-            py=df['pfjet_p4.fCoordinates.fY'],
-            pz=df['pfjet_p4.fCoordinates.fZ'],
-            energy=df['pfjet_p4.fCoordinates.fT'],
-            nef=(df['pfjet_neutralEmE']+df['pfjet_neutralHadronE'])/df['pfjet_p4.fCoordinates.fT'],
-            maxd0=absd0.max().content,
-            mind0=absd0.min().content,
-            maxd0sig=d0sig.max().content,
-            mind0sig=d0sig.min().content,
-            tkiso05=df['pfjet_tkIsolation05'],
-            pfiso05=df['pfjet_pfIsolation05'],
-            tkiso06=df['pfjet_tkIsolation06'],
-            pfiso06=df['pfjet_pfIsolation06'],
-            tkiso07=df['pfjet_tkIsolation07'],
-            pfiso07=df['pfjet_pfIsolation07'],
-            spreadpt=df['pfjet_ptDistribution'],
-            spreaddr=df['pfjet_dRSpread'],
-            lamb=df['pfjet_subjet_lambda'],
-            epsi=df['pfjet_subjet_epsilon'],
-            ecf1=df['pfjet_subjet_ecf1'],
-            ecf2=df['pfjet_subjet_ecf2'],
-            ecf3=df['pfjet_subjet_ecf3'],
-        )
-        genparticles = JaggedCandidateArray.candidatesfromcounts(
-            df['gen_p4'],
-            px=df['gen_p4.fCoordinates.fX'],
-            py=df['gen_p4.fCoordinates.fY'],
-            pz=df['gen_p4.fCoordinates.fZ'],
-            energy=df['gen_p4.fCoordinates.fT'],
-            pid=df['gen_pid']
-        )
-        darkphotons = genparticles[genparticles.pid==32]
-        matchmask = leptonjets.match(darkphotons, deltaRCut=0.3)
-
-        metfiltermask = np.logical_and.reduce([df[mf] for mf in MetFilters])
-        triggermask = np.logical_or.reduce([df[tp] for tp in Triggers])
-
-        leptonjets = leptonjets[metfiltermask&triggermask]
-        matchmask  = matchmask[metfiltermask&triggermask]
 
-        output['pt']       += column_accumulator(leptonjets.pt.flatten())
-        output['eta']      += column_accumulator(leptonjets.eta.flatten())
-        output['nef']      += column_accumulator(leptonjets.nef.flatten())
-        output['maxd0']    += column_accumulator(leptonjets.maxd0.flatten())
-        output['mind0']    += column_accumulator(leptonjets.mind0.flatten())
-        output['maxd0sig'] += column_accumulator(leptonjets.maxd0sig.flatten())
-        output['mind0sig'] += column_accumulator(leptonjets.mind0sig.flatten())
-        output['tkiso05']  += column_accumulator(leptonjets.tkiso05.flatten())
-        output['pfiso05']  += column_accumulator(leptonjets.pfiso05.flatten())
-        output['tkiso06']  += column_accumulator(leptonjets.tkiso06.flatten())
-        output['pfiso06']  += column_accumulator(leptonjets.pfiso06.flatten())
-        output['tkiso07']  += column_accumulator(leptonjets.tkiso07.flatten())
-        output['pfiso07']  += column_accumulator(leptonjets.pfiso07.flatten())
-        output['spreadpt'] += column_accumulator(leptonjets.spreadpt.flatten())
-        output['spreaddr'] += column_accumulator(leptonjets.spreaddr.flatten())
-        output['lamb']     += column_accumulator(leptonjets.lamb.flatten())
-        output['epsi']     += column_accumulator(leptonjets.epsi.flatten())
-        output['ecfe1']    += column_accumulator(leptonjets.ecf1.flatten())
-        output['ecfe2']    += column_accumulator(leptonjets.ecf2.flatten())
-        output['ecfe3']    += column_accumulator(leptonjets.ecf3.flatten())
-        output['label']    += column_accumulator(matchmask.flatten())
+def background_label(df, leptonjets):
+    return leptonjets.pt.zeros_like()
 
-        return output
 
-    def postprocess(self, accumulator):
-        return accumulator
+LABELERS = {
+    'darkphoton': darkphoton_label,
+    'background': background_label,
+}
 
 
-class BackgroundLeptonJetsFeatureHarvester(processor.ProcessorABC):
-    def __init__(self):
+class LeptonJetsFeatureHarvester(processor.ProcessorABC):
+    """``labeling`` maps dataset to a ``LABELERS`` key, datasets not in it
+    are labelled as background.
+    """
 
+    def __init__(self, writer, labeling):
+        self.writer = writer
+        self.labeling = labeling
         self._accumulator = processor.dict_accumulator({
-            'pt': column_accumulator(np.zeros(shape=(0,))),
-            'eta': column_accumulator(np.zeros(shape=(0,))),
-            'nef': column_accumulator(np.zeros(shape=(0,))),
-            'maxd0': column_accumulator(np.zeros(shape=(0,))),
-            'mind0': column_accumulator(np.zeros(shape=(0,))),
-            'maxd0sig': column_accumulator(np.zeros(shape=(0,))),
-            'mind0sig': column_accumulator(np.zeros(shape=(0,))),
-            'tkiso05': column_accumulator(np.zeros(shape=(0,))),
-            'pfiso05': column_accumulator(np.zeros(shape=(0,))),
-            'tkiso06': column_accumulator(np.zeros(shape=(0,))),
-            'pfiso06': column_accumulator(np.zeros(shape=(0,))),
-            'tkiso07': column_accumulator(np.zeros(shape=(0,))),
-            'pfiso07': column_accumulator(np.zeros(shape=(0,))),
-            'spreadpt': column_accumulator(np.zeros(shape=(0,))),
-            'spreaddr': column_accumulator(np.zeros(shape=(0,))),
-            'lamb': column_accumulator(np.zeros(shape=(0,))),
-            'epsi': column_accumulator(np.zeros(shape=(0,))),
-            'ecfe1': column_accumulator(np.zeros(shape=(0,))),
-            'ecfe2': column_accumulator(np.zeros(shape=(0,))),
-            'ecfe3': column_accumulator(np.zeros(shape=(0,))),
-            'label': column_accumulator(np.zeros(shape=(0,))),
+            'nrows': processor.defaultdict_accumulator(int),
         })
 
     @property
@@ -153,6 +62,7 @@ class BackgroundLeptonJetsFeatureHarvester(processor.ProcessorABC):
 
     def process(self, df):
         output = self.accumulator.identity()
+        dataset = df['dataset']
 
         absd0 = np.abs(NestNestObjArrayToJagged(df['pfjet_pfcand_tkD0'])).fillna(0)
         d0sig = NestNestObjArrayToJagged(df['pfjet_pfcand_tkD0Sig']).fillna(0)
@@ -178,38 +88,28 @@ class BackgroundLeptonJetsFeatureHarvester(processor.ProcessorABC):
             spreaddr=df['pfjet_dRSpread'],
             lamb=df['pfjet_subjet_lambda'],
             epsi=df['pfjet_subjet_epsilon'],
-            ecf1=df['pfjet_subjet_ecf1'],
-            ecf2=df['pfjet_subjet_ecf2'],
-            ecf3=df['pfjet_subjet_ecf3'],
+            ecfe1=df['pfjet_subjet_ecf1'],
+            ecfe2=df['pfjet_subjet_ecf2'],
+            ecfe3=df['pfjet_subjet_ecf3'],
         )
-
+        label = LABELERS[self.labeling.get(dataset, 'background')](df, leptonjets)
 
         metfiltermask = np.logical_and.reduce([df[mf] for mf in MetFilters])
         triggermask = np.logical_or.reduce([df[tp] for tp in Triggers])
-
         leptonjets = leptonjets[metfiltermask&triggermask]
+        label = label[metfiltermask&triggermask]
+
+        nrows = leptonjets.counts.sum()
+        if nrows == 0:
+            return output
+
+        matrix = np.empty((nrows, len(FEATURES)), dtype=np.float32)
+        for i, f in enumerate(FEATURES):
+            matrix[:, i] = getattr(leptonjets, f).flatten()
+        matrix[np.isnan(matrix)] = 0 # zero-padding
 
-        output['pt']       += column_accumulator(leptonjets.pt.flatten())
-        output['eta']      += column_accumulator(leptonjets.eta.flatten())
-        output['nef']      += column_accumulator(leptonjets.nef.flatten())
-        output['maxd0']    += column_accumulator(leptonjets.maxd0.flatten())
-        output['mind0']    += column_accumulator(leptonjets.mind0.flatten())
-        output['maxd0sig'] += column_accumulator(leptonjets.maxd0sig.flatten())
-        output['mind0sig'] += column_accumulator(leptonjets.mind0sig.flatten())
-        output['tkiso05']  += column_accumulator(leptonjets.tkiso05.flatten())
-        output['pfiso05']  += column_accumulator(leptonjets.pfiso05.flatten())
-        output['tkiso06']  += column_accumulator(leptonjets.tkiso06.flatten())
-        output['pfiso06']  += column_accumulator(leptonjets.pfiso06.flatten())
-        output['tkiso07']  += column_accumulator(leptonjets.tkiso07.flatten())
-        output['pfiso07']  += column_accumulator(leptonjets.pfiso07.flatten())
-        output['spreadpt'] += column_accumulator(leptonjets.spreadpt.flatten())
-        output['spreaddr'] += column_accumulator(leptonjets.spreaddr.flatten())
-        output['lamb']     += column_accumulator(leptonjets.lamb.flatten())
-        output['epsi']     += column_accumulator(leptonjets.epsi.flatten())
-        output['ecfe1']    += column_accumulator(leptonjets.ecf1.flatten())
-        output['ecfe2']    += column_accumulator(leptonjets.ecf2.flatten())
-        output['ecfe3']    += column_accumulator(leptonjets.ecf3.flatten())
-        output['label']    += column_accumulator(leptonjets.pt.zeros_like().flatten())
+        self.writer.append(dataset, matrix, label.flatten())
+        output['nrows'][dataset] += int(nrows)
 
         return output
 
@@ -218,74 +118,52 @@ class BackgroundLeptonJetsFeatureHarvester(processor.ProcessorABC):
 
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="collect BDT training data")
+    parser.add_argument("--overwrite", action='store_true', help="remove an existing output dataset first")
+    args = parser.parse_args()
 
     ## prepare datasets
-    import os
     import json
-    from os.path import join
 
     dataset4mu_   = json.load(open(join(os.getenv('FH_BASE'), 'Notebooks/MC/Samples/signal_4mu.json')))
     dataset2mu2e_ = json.load(open(join(os.getenv('FH_BASE'), 'Notebooks/MC/Samples/signal_2mu2e.json')))
-    datasetsignal = {}
-    datasetsignal.update({
+    datasets, labeling = {}, {}
+    datasets.update({
         f'4mu/{k}': dict(files=v, treename='ffNtuplizer/ffNtuple')
         for k, v in dataset4mu_.items()
     })
-    datasetsignal.update({
+    datasets.update({
         f'2mu2e/{k}': dict(files=v, treename='ffNtuplizer/ffNtuple')
         for k, v in dataset2mu2e_.items()
     })
+    labeling.update({k: 'darkphoton' for k in datasets})
 
     datasetbkg_ = json.load(open(join(os.getenv('FH_BASE'),
                                 'Notebooks/MC/Samples/backgrounds_nonempty.json')))
-    datasetbackgrounds = {}
     for group in datasetbkg_:
         for tag in datasetbkg_[group]:
             files = datasetbkg_[group][tag]
-            datasetbackgrounds[tag] = {'files': files, 'treename': 'ffNtuples/ffNtuple'}
-            if tag=='TTJets': datasetbackgrounds[tag]['treename'] = 'ffNtuplizer/ffNtuple'
+            datasets[tag] = {'files': files, 'treename': 'ffNtuples/ffNtuple'}
+            if tag=='TTJets': datasets[tag]['treename'] = 'ffNtuplizer/ffNtuple'
+            labeling[tag] = 'background'
 
 
     import time
     starttime = time.time()
     print("Start harvesting at:", time.ctime())
 
-    ## collect from signal
-    print("Collecting from signal ...")
-    output_s = processor.run_uproot_job(datasetsignal,
+    outdir_ = 'trainingdata'
+    writer = FeatureWriter(outdir_, overwrite=args.overwrite)
+    output = processor.run_uproot_job(datasets,
                                   treename=None,
-                                  processor_instance=SignalLeptonJetsFeatureHarvester(),
+                                  processor_instance=LeptonJetsFeatureHarvester(writer, labeling),
                                   executor=processor.futures_executor,
                                   executor_args=dict(workers=12, flatten=True),
                                   chunksize=500000,
                                  )
-    print("... done.")
-
-    ## collect from backgrounds
-    print("Collecting from backgrounds ...")
-    output_b = processor.run_uproot_job(datasetbackgrounds,
-                                  treename=None,
-                                  processor_instance=BackgroundLeptonJetsFeatureHarvester(),
-                                  executor=processor.futures_executor,
-                                  executor_args=dict(workers=12, flatten=True),
-                                  chunksize=500000,
-                                 )
-    print("... done.")
-
-    ## merge together
-    output = output_s + output_b
-
-    ## save as dataframe
-    import pandas as pd
-    df = pd.DataFrame({k: v.value for k, v in output.items()})
-    df.fillna(0, inplace=True) # zero-padding
-    print(df.tail())
-
-    filename_ = 'trainingdatasplit.h5'
-
-    ## saving to disk
-    df.query("nef>=0.999").to_hdf(filename_, key='notrack')
-    df.query("nef< 0.999").to_hdf(filename_, key='tracked')
-    print(f"Saving dataframe as '{filename_}' with key 'notrack' and 'tracked'.")
+    print(f"... done, {sum(output['nrows'].values())} leptonjets from {len(output['nrows'])} datasets.")
+    print(f"Saved as Parquet dataset '{outdir_}', partitioned by category (notrack/tracked), label and dataset.")
     print("--> took {} s".format(time.time() - starttime))
-    print(f"To load:\n\t`df = pd.read_hdf('{filename_}', 'notrack')` or\n\t`df = pd.read_hdf('{filename_}', 'tracked')`")
\ No newline at end of file
+    print(f"To load:\n\t`from trainingdata import load_trainingdata; df = load_trainingdata('{outdir_}', 'notrack')`")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""working points of a BDT score
+
+``WorkingPoints`` sorts the scores once and keeps the cumulative (weighted)
+signal and background efficiencies above each distinct score -- the roc
+curve. Any set of target FPRs, TPRs or thresholds is then answered with
+``np.searchsorted`` on those arrays. With per-row groups (e.g. the source
+dataset) the efficiency of each group is kept along the same points.
+"""
+import numpy as np
+import pandas as pd
+
+
+class WorkingPoints:
+    """roc curve of ``score`` for labels ``y``. Point i selects
+    ``score >= thresholds[i]``; point 0 (threshold inf) selects nothing.
+    """
+
+    def __init__(self, y, score, weight=None, groups=None):
+        order = np.argsort(score, kind='mergesort')[::-1]
+        score = np.asarray(score)[order]
+        y = np.asarray(y)[order].astype(bool)
+        w = np.ones(len(score)) if weight is None else np.asarray(weight, dtype=float)[order]
+
+        distinct = np.r_[np.flatnonzero(np.diff(score)), len(score) - 1]
+        tps = np.r_[0, np.cumsum(w * y)[distinct]]
+        fps = np.r_[0, np.cumsum(w * ~y)[distinct]]
+        self.thresholds = np.r_[np.inf, score[distinct]]
+        self.tpr = tps / tps[-1]
+        self.fpr = fps / fps[-1]
+
+        self.groupeff = {}
+        if groups is not None:
+            groups = np.asarray(groups)[order]
+            names, codes = np.unique(groups, return_inverse=True)
+            for i, name in enumerate(names):
+                cum = np.r_[0, np.cumsum(w * (codes == i))[distinct]]
+                self.groupeff[name] = cum / cum[-1]
+
+    @property
+    def auc(self):
+        return np.sum(np.diff(self.fpr) * (self.tpr[1:] + self.tpr[:-1]) / 2) # trapezoidal
+
+    def roc(self):
+        return dict(fpr=self.fpr, tpr=self.tpr, thresholds=self.thresholds, auc=self.auc)
+
+    def index_fpr(self, targets):
+        """first points with fpr above ``targets``"""
+        idx = np.searchsorted(self.fpr, np.asarray(targets, dtype=float), side='right')
+        return np.minimum(idx, len(self.fpr) - 1)
+
+    def index_tpr(self, targets):
+        """first points with tpr reaching ``targets``"""
+        idx = np.searchsorted(self.tpr, np.asarray(targets, dtype=float), side='left')
+        return np.minimum(idx, len(self.tpr) - 1)
+
+    def index_threshold(self, cuts):
+        """points of the selections ``score >= cuts``"""
+        return np.searchsorted(-self.thresholds, -np.asarray(cuts, dtype=float), side='right') - 1
+
+    def table(self, fpr=(), tpr=(), thresholds=()):
+        """DataFrame of the working points for all queries, one row each:
+        query kind and target, threshold, fpr, tpr and ``eff_<group>``
+        """
+        queries = [('fpr', np.asarray(fpr, dtype=float), self.index_fpr),
+                   ('tpr', np.asarray(tpr, dtype=float), self.index_tpr),
+                   ('threshold', np.asarray(thresholds, dtype=float), self.index_threshold)]
+        kinds, targets, idx = [], [], []
+        for kind, t, locate in queries:
+            kinds.append(np.full(len(t), kind, dtype=object))
+            targets.append(t)
+            idx.append(locate(t).astype(int))
+        idx = np.concatenate(idx)
+
+        data = dict(query=np.concatenate(kinds), target=np.concatenate(targets),
+                    threshold=self.thresholds[idx], fpr=self.fpr[idx], tpr=self.tpr[idx])
+        for name, eff in self.groupeff.items():
+            data[f'eff_{name}'] = eff[idx]
+        return pd.DataFrame(data)
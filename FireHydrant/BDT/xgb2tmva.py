@@ -1,147 +1,192 @@
 #!/usr/bin/env python
-"""from https://github.com/guitargeek/xgbo/blob/master/xgbo/xgboost2tmva.py
+"""convert xgboost models to TMVA BDT weights (XML)
+
+after https://github.com/guitargeek/xgbo/blob/master/xgbo/xgboost2tmva.py
 original from https://gist.github.com/hqucms/56844f4d1e04757704f6afcdaa6f65a8
+
+Trees are read one at a time from the model's JSON dump and written as they
+are walked, into one or several outputs at once. Plain outputs are compact
+as ``ElementTree.write`` made them, ``.gz`` outputs pretty-printed as
+``xmllint --format`` does, so the files match the previous conversion.
 """
-import re
-import xml.etree.cElementTree as ET
-
-regex_float_pattern = r"[-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?"
-
-
-def build_tree(xgtree, base_xml_element, var_indices, fillna=None):
-    parent_element_dict = {"0": base_xml_element}
-    pos_dict = {"0": "s"}
-    for line in xgtree.split("\n"):
-        if not line:
-            continue
-        if ":leaf=" in line:
-            # leaf node
-            if not fillna is None:
-                if "-nan" in line:
-                    line = line.replace("-nan", "-999")
-                if "nan" in line:
-                    line = line.replace("nan", "-999")
-            result = re.match(r"(\t*)(\d+):leaf=({0})$".format(regex_float_pattern), line)
-            if not result:
-                print(line)
-            depth = result.group(1).count("\t")
-            inode = result.group(2)
-            res = result.group(3)
-            node_elementTree = ET.SubElement(parent_element_dict[inode],
-                                            "Node",
-                                            pos=str(pos_dict[inode]),
-                                            depth=str(depth),
-                                            NCoef="0",
-                                            IVar="-1",
-                                            Cut="0.0e+00",
-                                            cType="1",
-                                            res=str(res),
-                                            rms="0.0e+00",
-                                            purity="0.0e+00",
-                                            nType="-99",
-                                        )
+import gzip
+import io
+import json
+import os
+import time
+from xml.sax.saxutils import escape
+
+_attr_entities = {'"': '&quot;', '\n': '&#10;', '\r': '&#13;', '\t': '&#09;'}
+
+
+class XMLStream:
+    """streaming XML writer. ``pretty`` mimics ``xmllint --format`` (XML
+    declaration, 2-space indent, ``<Tag/>``), otherwise the compact output of
+    ``ElementTree.write`` (``<Tag />``). A start tag is held back until it is
+    known whether the element has children.
+    """
+
+    def __init__(self, out, pretty=False):
+        self.out = out
+        self.pretty = pretty
+        self._stack = []
+        self._pending = None
+        if pretty:
+            out.write('<?xml version="1.0"?>\n')
+
+    def _starttag(self, tag, attrs):
+        indent = '  ' * len(self._stack) if self.pretty else ''
+        return indent + '<' + tag + ''.join(f' {k}="{escape(str(v), _attr_entities)}"' for k, v in attrs)
+
+    def _flush(self):
+        if self._pending is not None:
+            self.out.write(self._pending + ('>\n' if self.pretty else '>'))
+            self._pending = None
+
+    def start(self, tag, attrs=()):
+        self._flush()
+        self._pending = self._starttag(tag, attrs)
+        self._stack.append(tag)
+
+    def end(self):
+        tag = self._stack.pop()
+        if self._pending is not None:
+            self.out.write(self._pending + ('/>' if self.pretty else ' />'))
+            self._pending = None
         else:
-            # \t\t3:[var_topcand_mass<138.19] yes=7,no=8,missing=7
-            line_pattern = r"(\t*)([0-9]+):\[(?P<var>.+)<(?P<cut>{0})\]\syes=(?P<yes>\d+),no=(?P<no>\d+)"
-            result = re.match( line_pattern.format(regex_float_pattern), line,)
-            if not result:
-                print(line)
-            depth = result.group(1).count("\t")
-            inode = result.group(2)
-            var = result.group("var")
-            cut = result.group("cut")
-            lnode = result.group("yes")
-            rnode = result.group("no")
-            pos_dict[lnode] = "l"
-            pos_dict[rnode] = "r"
-            node_elementTree = ET.SubElement(parent_element_dict[inode],
-                                            "Node",
-                                            pos=str(pos_dict[inode]),
-                                            depth=str(depth),
-                                            NCoef="0",
-                                            IVar=str(var_indices[var]),
-                                            Cut=str(cut),
-                                            cType="1",
-                                            res="0.0e+00",
-                                            rms="0.0e+00",
-                                            purity="0.0e+00",
-                                            nType="0",
-                                        )
-            parent_element_dict[lnode] = node_elementTree
-            parent_element_dict[rnode] = node_elementTree
-
-
-def convert_model(model, input_variables, output_xml, fillna=None):
+            self.out.write(('  ' * len(self._stack) if self.pretty else '') + f'</{tag}>')
+        if self.pretty:
+            self.out.write('\n')
+
+    def element(self, tag, attrs=(), text=None):
+        if text is None:
+            self.start(tag, attrs)
+            self.end()
+            return
+        self._flush()
+        self.out.write(self._starttag(tag, attrs) + '>' + escape(text) + f'</{tag}>' + ('\n' if self.pretty else ''))
+
+
+class _Tee:
+    """forwards writer calls to several ``XMLStream``"""
+
+    def __init__(self, streams):
+        self.streams = streams
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            for s in self.streams:
+                getattr(s, name)(*args, **kwargs)
+        return call
+
+
+def _raw_number(s):
+    return s
+
+
+def _load_tree(xgtree, fillna=None):
+    """one JSON tree dump, numbers kept as the strings xgboost printed"""
+    if fillna is not None:
+        xgtree = xgtree.replace('"leaf":-nan', '"leaf":-999').replace('"leaf":nan', '"leaf":-999') \
+                       .replace('"leaf": -nan', '"leaf": -999').replace('"leaf": nan', '"leaf": -999')
+    return json.loads(xgtree, parse_float=_raw_number, parse_int=_raw_number)
+
+
+def write_tree(node, writer, var_indices, pos='s', depth=0):
+    if 'leaf' in node:
+        writer.element('Node', [('pos', pos), ('depth', depth), ('NCoef', '0'), ('IVar', '-1'),
+                                ('Cut', '0.0e+00'), ('cType', '1'), ('res', node['leaf']),
+                                ('rms', '0.0e+00'), ('purity', '0.0e+00'), ('nType', '-99')])
+        return
+    writer.start('Node', [('pos', pos), ('depth', depth), ('NCoef', '0'), ('IVar', var_indices[node['split']]),
+                          ('Cut', node['split_condition']), ('cType', '1'), ('res', '0.0e+00'),
+                          ('rms', '0.0e+00'), ('purity', '0.0e+00'), ('nType', '0')])
+    for child in node['children']:
+        write_tree(child, writer, var_indices, pos='l' if child['nodeid'] == node['yes'] else 'r', depth=depth+1)
+    writer.end()
+
+
+def write_model(model, input_variables, writer, fillna=None):
+    """stream the TMVA MethodSetup of ``model`` (list of JSON tree dumps) into ``writer``"""
+    var_indices = {}
+
+    writer.start('MethodSetup', [('Method', 'BDT::BDT')])
+
+    writer.start('Variables', [('NVar', len(input_variables))])
+    for ind, (name, var_type) in enumerate(input_variables):
+        var_indices[name] = ind
+        writer.element('Variable', [('VarIndex', ind), ('Type', var_type), ('Expression', name), ('Label', name),
+                                    ('Title', name), ('Unit', ''), ('Internal', name),
+                                    ('Min', '0.0e+00'), ('Max', '0.0e+00')])
+    writer.end()
+
+    writer.start('GeneralInfo')
+    writer.element('Info', [('name', 'Creator'), ('value', 'xgboost2TMVA')])
+    writer.element('Info', [('name', 'AnalysisType'), ('value', 'Classification')])
+    writer.end()
+
+    writer.start('Options')
+    writer.element('Option', [('name', 'NodePurityLimit'), ('modified', 'No')], text='5.00e-01')
+    writer.element('Option', [('name', 'BoostType'), ('modified', 'Yes')], text='Grad')
+    writer.end()
+
+    writer.start('Weights', [('NTrees', len(model)), ('AnalysisType', '1')])
+    for itree, xgtree in enumerate(model):
+        writer.start('BinaryTree', [('type', 'DecisionTree'), ('boostWeight', '1.0e+00'), ('itree', itree)])
+        write_tree(_load_tree(xgtree, fillna=fillna), writer, var_indices)
+        writer.end()
+    writer.end()
+
+    writer.end()
+
+
+def _open_output(fn):
+    if fn.endswith('.gz'):
+        # header as `gzip` writes it: original name and time
+        raw = open(fn, 'wb')
+        gz = gzip.GzipFile(filename=os.path.basename(fn)[:-len('.gz')], mode='wb', fileobj=raw,
+                           compresslevel=6, mtime=time.time())
+        return io.TextIOWrapper(gz, encoding='ascii', errors='xmlcharrefreplace'), (gz, raw)
+    return open(fn, 'w', encoding='ascii', errors='xmlcharrefreplace'), ()
+
+
+def convert_model(model, input_variables, output_xml, fillna=None, pretty=None):
     """convert xgboost model to tmva xml
 
     *example*
         bst = xgb.train( param, d_train, num_round, watchlist );
-        model = bst.get_dump()
-        convert_model(model,input_variables=[('var1','F'),('var2','I')],output_xml='xgboost.xml')
+        model = bst.get_dump(dump_format='json')
+        convert_model(model,input_variables=[('var1','F'),('var2','I')],output_xml=['xgboost.xml', 'xgboost.xml.gz'])
 
-    :param model: xgboost model dump
-    :type model: str
+    :param model: xgboost model JSON dump, or the booster itself
+    :type model: list
     :param input_variables: list of tuples - (name, type)
     :type input_variables: list
-    :param output_xml: output xml file name
-    :type output_xml: str
+    :param output_xml: output xml file name(s), written in one pass
+    :type output_xml: str or list
     :param fillna: whether to replace nan, defaults to None
     :type fillna: bool, optional
+    :param pretty: pretty-print, defaults to True for ``.gz`` outputs only
+    :type pretty: bool, optional
     """
-    NTrees = len(model)
-    var_list = input_variables
-    var_indices = {}
-
-    # <MethodSetup>
-    MethodSetup = ET.Element("MethodSetup", Method="BDT::BDT")
-
-    # <Variables>
-    Variables = ET.SubElement(MethodSetup, "Variables", NVar=str(len(var_list)))
-    for ind, val in enumerate(var_list):
-        name = val[0]
-        var_type = val[1]
-        var_indices[name] = ind
-        Variable = ET.SubElement(Variables,
-                                "Variable",
-                                VarIndex=str(ind),
-                                Type=val[1],
-                                Expression=name,
-                                Label=name,
-                                Title=name,
-                                Unit="",
-                                Internal=name,
-                                Min="0.0e+00",
-                                Max="0.0e+00",
-                            )
-
-    # <GeneralInfo>
-    GeneralInfo = ET.SubElement(MethodSetup, "GeneralInfo")
-    Info_Creator = ET.SubElement(GeneralInfo, "Info", name="Creator", value="xgboost2TMVA")
-    Info_AnalysisType = ET.SubElement(GeneralInfo, "Info", name="AnalysisType", value="Classification")
-
-    # <Options>
-    Options = ET.SubElement(MethodSetup, "Options")
-    Option_NodePurityLimit = ET.SubElement(Options, "Option", name="NodePurityLimit", modified="No").text = "5.00e-01"
-    Option_BoostType = ET.SubElement(Options, "Option", name="BoostType", modified="Yes").text = "Grad"
-
-    # <Weights>
-    Weights = ET.SubElement(MethodSetup, "Weights", NTrees=str(NTrees), AnalysisType="1")
-
-    for itree in range(NTrees):
-        BinaryTree = ET.SubElement(Weights,
-                                "BinaryTree",
-                                type="DecisionTree",
-                                boostWeight="1.0e+00",
-                                itree=str(itree),
-                            )
-        build_tree(model[itree], BinaryTree, var_indices, fillna=fillna)
-
-    tree = ET.ElementTree(MethodSetup)
-    tree.write(output_xml)
-    # format it with 'xmllint --format'
+    if hasattr(model, 'get_dump'):
+        model = model.get_dump(dump_format='json')
+    outputs = [output_xml] if isinstance(output_xml, str) else list(output_xml)
+
+    files, streams = [], []
+    try:
+        for fn in outputs:
+            f, inner = _open_output(fn)
+            files.append((f, inner))
+            streams.append(XMLStream(f, pretty=fn.endswith('.gz') if pretty is None else pretty))
+        write_model(model, input_variables, _Tee(streams), fillna=fillna)
+    finally:
+        for f, inner in files:
+            f.close()
+            for x in inner:
+                x.close()
 
 
 # example
 # bst = xgb.train( param, d_train, num_round, watchlist );
-# model = bst.get_dump()
-# convert_model(model,input_variables=[('var1','F'),('var2','I')],output_xml='xgboost.xml')
+# convert_model(bst, input_variables=[('var1','F'),('var2','I')], output_xml='xgboost.xml')
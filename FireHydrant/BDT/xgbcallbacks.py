@@ -217,3 +217,39 @@ def early_stop(stopping_rounds, start_round=0, maximize=False, verbose=True, eva
             raise xgb.core.EarlyStopException(best_iteration)
 
     return callback
+
+
+def callback_curve(best_curve, margin, callback_status, metric, maximize=True, start_round=0):
+    """learning curve callback for xgboost, shares early stopping across probes
+
+    :param best_curve: best ``metric`` at each boosting round among previous probes
+    :type best_curve: numpy.array
+    :param margin: how far behind ``best_curve`` a probe may fall before stopping
+    :type margin: float
+    :param callback_status: dictionary holding callback status
+    :type callback_status: dict
+    :param metric: name of the evaluation result to compare, e.g. 'test-auc'
+    :type metric: str
+    :param maximize: whether larger ``metric`` is better, defaults to True
+    :type maximize: bool, optional
+    :param start_round: first round compared, defaults to 0
+    :type start_round: int, optional
+    :raises xgb.core.EarlyStopException: raised in case the probe falls behind
+    :return: callback function to be registered
+    :rtype: function
+    """
+    def callback(env):
+        if env.iteration < start_round or env.iteration >= len(best_curve):
+            return
+        best = best_curve[env.iteration]
+        if np.isnan(best):
+            return
+
+        score = dict((r[0], r[1]) for r in env.evaluation_result_list)[metric]
+        behind = best - score if maximize else score - best
+        if behind > margin:
+            print("Falling behind the best probe so far. Stop boosting.")
+            callback_status["status"] = 4
+            raise xgb.core.EarlyStopException(env.iteration)
+
+    return callback
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""out-of-core training inputs for xgboost from the partitioned training data
+
+Rows of one category are addressed by global index: files of the partition
+in a fixed order, rows in file order. Labels are known from the ``label``
+partition alone, so the train/test split and the class balancing are done
+on index arrays without reading any feature. ``ParquetBatchIter`` then feeds
+the selected rows file by file into a ``QuantileDMatrix``, holding one file
+in memory at a time. ``RowIndexFolds`` does the same for the cross
+validation folds of the optimization, which can't be sliced out of a
+quantized DMatrix.
+"""
+import os
+import re
+from urllib.parse import unquote
+
+import numpy as np
+import xgboost as xgb
+
+from trainingdata import FEATURES
+
+
+class RowIndex:
+    """files of one category partition with row counts and labels"""
+
+    def __init__(self, path, category):
+        import pyarrow.dataset as ds
+
+        dset = ds.dataset(path, format='parquet', partitioning='hive')
+        fragments = sorted(dset.get_fragments(filter=ds.field('category') == category), key=lambda f: f.path)
+        self.files = [f.path for f in fragments]
+        self.labels = np.array([int(re.search(r'label=(\d+)', f.path).group(1)) for f in fragments], dtype=int)
+        self.datasets = np.array([unquote(re.search(r'dataset=([^/]+)', f.path).group(1)) for f in fragments])
+        self.counts = np.array([f.metadata.num_rows for f in fragments], dtype=np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(self.counts)])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def label_array(self):
+        """label of every row"""
+        return np.repeat(self.labels, self.counts)
+
+    def dataset_array(self):
+        """source dataset of every row"""
+        return np.repeat(self.datasets, self.counts)
+
+    def split(self, training_fraction, seed=None, balance=True):
+        """(train, test) sorted global row indices. With ``balance``, train rows
+        of the more populated class are discarded down to the size of the other.
+        """
+        rng = np.random.RandomState(seed)
+        perm = rng.permutation(len(self))
+        ntrain = int(round(training_fraction * len(self)))
+        train, test = perm[:ntrain], perm[ntrain:]
+        if balance:
+            y = self.label_array()[train]
+            nperclass = min((y == 0).sum(), (y == 1).sum())
+            train = np.concatenate([train[y == 0][:nperclass], train[y == 1][:nperclass]])
+        return np.sort(train), np.sort(test)
+
+
+class ParquetBatchIter(xgb.DataIter):
+    """``xgb.DataIter`` over the rows ``index`` (sorted global indices) of a
+    ``RowIndex``, one file per batch, reading only ``features``
+    """
+
+    def __init__(self, rowindex, index, features=None, cache_prefix=None):
+        self.rowindex = rowindex
+        self.features = features or FEATURES
+        bounds = np.searchsorted(index, rowindex.offsets)
+        self._batches = [(i, index[lo:hi] - rowindex.offsets[i])
+                         for i, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])) if hi > lo]
+        self._it = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        import pyarrow.parquet as pq
+
+        if self._it == len(self._batches):
+            return 0
+        ifile, rows = self._batches[self._it]
+        table = pq.read_table(self.rowindex.files[ifile], columns=self.features)
+        data = np.column_stack([table.column(f).to_numpy() for f in self.features])[rows]
+        input_data(data=data, label=np.full(len(rows), self.rowindex.labels[ifile], dtype=np.float32),
+                   feature_names=self.features)
+        self._it += 1
+        return 1
+
+    def reset(self):
+        self._it = 0
+
+
+def build_dmatrix(rowindex, index, features=None, ref=None, cachedir=None):
+    """``QuantileDMatrix`` of the rows ``index``, quantized against ``ref``
+    if given. Older xgboost without it falls back to an external memory
+    ``DMatrix`` cached under ``cachedir``.
+    """
+    if hasattr(xgb, 'QuantileDMatrix'):
+        return xgb.QuantileDMatrix(ParquetBatchIter(rowindex, index, features), ref=ref)
+    cachedir = cachedir or '.'
+    if not os.path.isdir(cachedir):
+        os.makedirs(cachedir)
+    prefix = os.path.join(cachedir, 'xgbcache_{}'.format('test' if ref is not None else 'train'))
+    return xgb.DMatrix(ParquetBatchIter(rowindex, index, features, cache_prefix=prefix))
+
+
+def cv_indices(index, nfold, seed):
+    """``nfold`` (train, test) pairs of sorted sub-arrays of ``index``,
+    random split as ``xgb.cv`` does
+    """
+    perm = np.random.RandomState(seed).permutation(len(index))
+    testpos = np.array_split(perm, nfold)
+    res = []
+    for i in range(nfold):
+        trainpos = np.concatenate([testpos[j] for j in range(nfold) if j != i])
+        res.append((np.sort(index[trainpos]), np.sort(index[testpos[i]])))
+    return res
+
+
+class RowIndexFolds:
+    """cross validation folds of the rows ``index`` of a ``RowIndex``, for
+    ``XgboFitter.optimize(folds=...)``. Only indices are held, ``build``
+    streams one (train, test) DMatrix pair per fold, the test one quantized
+    against its train. Pickled to the worker processes, each builds its own.
+    """
+
+    def __init__(self, rowindex, index, nfold, seed, features=None, cachedir=None):
+        self.rowindex = rowindex
+        self.features = features
+        self.cachedir = cachedir
+        self.nfold = nfold
+        self.indices = cv_indices(np.asarray(index), nfold, seed)
+
+    def __len__(self):
+        return self.nfold
+
+    def build(self):
+        folds = []
+        for i, (trainidx, testidx) in enumerate(self.indices):
+            cachedir = os.path.join(self.cachedir or '.', 'xgbcache_{}'.format(os.getpid()), f'fold{i}')
+            dtrain = build_dmatrix(self.rowindex, trainidx, self.features, cachedir=cachedir)
+            dtest = build_dmatrix(self.rowindex, testidx, self.features, ref=dtrain, cachedir=cachedir)
+            folds.append((dtrain, dtest))
+        return folds
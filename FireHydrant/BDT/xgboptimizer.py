@@ -1,16 +1,22 @@
 #!/usr/bin/env python
 """classes to enforce optimization sequences
 """
+import concurrent.futures
+import contextlib
+import hashlib
+import json
+import multiprocessing
 import os
 import warnings
+from collections import defaultdict, namedtuple
 from os.path import join
 
 import numpy as np
 import pandas as pd
 import xgboost as xgb
-from bayes_opt import BayesianOptimization
+from bayes_opt import BayesianOptimization, UtilityFunction
 from xgb2tmva import convert_model
-from xgbcallbacks import callback_overtraining, early_stop
+from xgbcallbacks import callback_curve, callback_overtraining, early_stop
 
 
 class XgboFitter:
@@ -22,7 +28,8 @@ class XgboFitter:
                 nthread=16,
                 doregression=False,
                 useeffrms=True,
-                usegpu=False
+                usegpu=False,
+                curvemargin=None
                 ):
         assert (hyperparamsetting and isinstance(hyperparamsetting, dict))
 
@@ -32,11 +39,13 @@ class XgboFitter:
         self.hyperparamloguniform_ = \
             [k for k in hyperparamsetting if hyperparamsetting[k]['loguniform']] # hyperparameter names whose value will be sampled in a log-uniform way
         self.randomstate_ = randomstate
+        self.foldseed_ = randomstate                 # fixed across resumes, so cached folds stay valid
         self.maxrounds_ = maxrounds
         self.minrounds_ = minrounds
         self.earlystoprounds_ = earlystoprounds
         self.doregression_ = doregression
         self.useeffrms_ = useeffrms
+        self.curvemargin_ = curvemargin              # stop probes falling this far behind the best one
 
         self.params_ = {
             'silent': 1,
@@ -46,6 +55,9 @@ class XgboFitter:
         }
         self.cvcolumns_ = [] # sequence matters
         self.cvresults_ = [] # holding result of each cross validation
+        self.cvparams_ = []  # hyperparameters of each cross validation
+        self.budgets_ = []   # boosting rounds given to each cross validation
+        self.registered_ = [] # cross validation of each optimizer result
         self.cviter_ = 0     # number of cross validation performed
 
         if usegpu: # enable GPU acceleration
@@ -130,69 +142,233 @@ class XgboFitter:
         #     val_max = df[eval_col].max()
         #     df['target'] = df[eval_col]
 
+        budgets = df['budget'].values if 'budget' in df else np.full(len(df), self.maxrounds_)
         for idx in df.index:
             value = df.loc[idx, eval_col]
             if self.doregression_: value = -value
 
             params = df.loc[idx, list(self.hyperparamranges_)].to_dict()
-            self.optimizer_.register(params, value)
+            self.cvparams_.append(params)
+            self.budgets_.append(int(budgets[idx]))
+            if self._complete(df.loc[idx, 'n_estimators'], budgets[idx]):
+                self.optimizer_.register(params, value)
+                self.registered_.append(idx)
 
 
-    def evaluate_xgb(self, **hyperparameters):
-
+    def _xgbparams(self, hyperparameters):
+        """``params_`` updated with one point of the optimizer space"""
+        hyperparameters = dict(hyperparameters)
         for k in hyperparameters:
             if k in self.hyperparamloguniform_:
                 hyperparameters[k] = 10 ** hyperparameters[k]
 
         self.params_.update(hyperparameters)
         self.params_ = guardxgbparams(self.params_)
+        return dict(self.params_)
 
+
+    def _best_target(self):
         best_test_eval_metric = -9999999.0
         if self.optimizer_.res:
             self.summary.to_csv(join(self.outdir_, 'summary.csv'))
             best_test_eval_metric = max([d['target'] for d in self.optimizer_.res])
+        return best_test_eval_metric
 
-        feval = None # evaluation function
-        callback_status = {'status': 0}
 
-        if self.doregression_ and self.useeffrms_:
-            callbacks = [early_stop(self.earlystoprounds_, start_round=self.minrounds_, eval_idx=-2),]
-            feval = evaleffrms
-        else:
-            callbacks = [
-                early_stop(self.earlystoprounds_, start_round=self.minrounds_,),
-                callback_overtraining(best_test_eval_metric, callback_status),
-            ]
+    def _bestcurve(self):
+        """best test metric at each boosting round over all probes so far"""
+        evalcol = self.cvcolumns_[2]
+        curves = [r[evalcol].values for r in self.cvresults_]
+        if not curves:
+            return np.array([])
+        res = np.full(max(len(c) for c in curves), np.nan)
+        for c in curves:
+            res[:len(c)] = np.fmin(res[:len(c)], c) if self.doregression_ else np.fmax(res[:len(c)], c)
+        return res
+
+
+    def _cvsetting(self, num_boost_round=None):
+        return dict(num_boost_round=num_boost_round or self.maxrounds_,
+                    doregression=self.doregression_, useeffrms=self.useeffrms_,
+                    earlystoprounds=self.earlystoprounds_, minrounds=self.minrounds_,
+                    bestcurve=self._bestcurve() if self.curvemargin_ is not None else None,
+                    curvemargin=self.curvemargin_)
 
-        cv_result = xgb.cv(self.params_, self.xgtrain_,
-                           num_boost_round=self.maxrounds_,
-                           nfold=self.nfold_,
-                           seed=self.randomstate_,
-                           callbacks=callbacks,
-                           verbose_eval=50,
-                           feval=feval)
+
+    def _record(self, cv_result, status, params, budget):
+        """bookkeeping of one cross validation, returns its target"""
         cv_result.to_csv(join(self.outdir_, 'cvresults/{0:04d}.csv'.format(self.cviter_)))
 
         self.cviter_ += 1
         self.earlystophistory_.append(len(cv_result))
         self.cvresults_.append(cv_result)
-        self.callbackstatus_.append(callback_status['status'])
+        self.cvparams_.append(dict(params))
+        self.budgets_.append(int(budget))
+        self.callbackstatus_.append(status)
+        return self._target(cv_result)
+
+
+    def _complete(self, nrounds, budget):
+        """whether a cross validation of ``nrounds`` rounds out of ``budget``
+        is final: given the full budget, or stopped before its end
+        """
+        return budget >= self.maxrounds_ or nrounds < budget
 
+
+    def _target(self, cv_result):
         if self.doregression_:
             return -cv_result[self.cvcolumns_[2]].values[-1]
         else:
             return cv_result[self.cvcolumns_[2]].values[-1]
 
 
-    def optimize(self, xgtrain, init_points=3, n_iter=3, nfold=5, acq='ei'):
+    def evaluate_xgb(self, **hyperparameters):
+
+        params = self._xgbparams(hyperparameters)
+        best_test_eval_metric = self._best_target()
+        cv_result, status = run_cv(params, self.folds_, best_test_eval_metric, **self._cvsetting())
+        target = self._record(cv_result, status, hyperparameters, self.maxrounds_)
+        self.registered_.append(self.cviter_ - 1) # registered by the optimizer on return
+        return target
+
+
+    def _random_points(self, n):
+        return [self.optimizer_.space.array_to_params(self.optimizer_.space.random_sample()) for _ in range(n)]
+
+
+    def _propose_batch(self, utility, batchsize):
+        """``batchsize`` points by constant liar: each suggestion is registered
+        on a scratch optimizer with the worst target so far, so the next one
+        is pushed elsewhere. A suggestion already probed or proposed is
+        replaced by a random point, so the batch is always full.
+        """
+        liaropt = BayesianOptimization(None, self.hyperparamranges_, self.randomstate_ + self.cviter_)
+        for r in self.optimizer_.res:
+            liaropt.register(params=r['params'], target=r['target'])
+        liar = min(r['target'] for r in self.optimizer_.res)
+
+        points = []
+        while len(points) < batchsize:
+            point = liaropt.suggest(utility)
+            try:
+                liaropt.register(params=point, target=liar)
+            except KeyError: # already probed or proposed
+                point = liaropt.space.array_to_params(liaropt.space.random_sample())
+                try:
+                    liaropt.register(params=point, target=liar)
+                except KeyError:
+                    continue
+            points.append(point)
+        return points
+
+
+    def _cv_points(self, points, num_boost_round=None, executor=None, states=None):
+        """[(cv_result, status)] of ``points``, concurrently if ``executor`` is
+        given. ``states`` (a dict per point, see ``cv_folds``) keep the fold
+        boosters, a point with a filled state continues boosting them.
+        """
+        best_test_eval_metric = self._best_target()
+        states = states if states is not None else [None] * len(points)
+        if executor is None:
+            return [run_cv(self._xgbparams(p), self.folds_, best_test_eval_metric, state=st,
+                           **self._cvsetting(num_boost_round))
+                    for p, st in zip(points, states)]
+        futures = [executor.submit(_run_cv_worker, self._xgbparams(p), best_test_eval_metric,
+                                   self._cvsetting(num_boost_round), st)
+                   for p, st in zip(points, states)]
+        res = []
+        for st, f in zip(states, futures):
+            cv_result, status, newstate = f.result()
+            if st is not None:
+                st.update(newstate)
+            res.append((cv_result, status))
+        return res
+
+
+    def _register(self, point, cv_result, status, budget=None):
+        """record one probe, so cvresults/NNNN.csv match the summary rows, and
+        register it with the optimizer if complete (see ``_complete``).
+        Results truncated at a lower ``budget`` are recorded only.
+        """
+        budget = budget or self.maxrounds_
+        target = self._record(cv_result, status, point, budget)
+        if self._complete(len(cv_result), budget):
+            self.optimizer_.register(params=point, target=target)
+            self.registered_.append(self.cviter_ - 1)
+        self.summary.to_csv(join(self.outdir_, 'summary.csv'))
+
 
-        self.nfold_ = nfold
-        self.xgtrain_ = xgtrain
+    def _evaluate_batch(self, points, executor):
+        """cross validate ``points`` concurrently, then register them in order"""
+        for point, (cv_result, status) in zip(points, self._cv_points(points, executor=executor)):
+            self._register(point, cv_result, status)
+
+
+    @contextlib.contextmanager
+    def _cv_executor(self, workers):
+        """process pool of ``workers`` holding the folds, ``nthread`` split
+        among them; None (in-process) for a single worker. Workers are
+        started from a forkserver, not forked from this process whose
+        xgboost/OpenMP threads are already running.
+        """
+        if workers <= 1:
+            yield None
+            return
+        nthread = self.params_['nthread']
+        self.params_['nthread'] = max(1, nthread // workers)
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                        mp_context=multiprocessing.get_context('forkserver'),
+                                                        initializer=_init_cv_worker,
+                                                        initargs=(self.foldsource_,)) as executor:
+                yield executor
+        finally:
+            self.params_['nthread'] = nthread
+
+
+    def optimize(self, xgtrain, init_points=3, n_iter=3, nfold=5, acq='ei', batchsize=1, workers=None,
+                 scheduler=None, eta=3, minbudget=None, folds=None):
+        """Bayesian optimization of the hyperparameters.
+
+        With ``batchsize`` > 1, ``n_iter`` points are proposed ``batchsize`` at
+        a time (constant liar) and cross validated concurrently on ``workers``
+        processes (default ``batchsize``), each with ``nthread/workers`` threads.
+        The cross validation folds are built once, saved in ``outdir/cvfolds``
+        and reused by every probe, worker and resumed optimization.
+
+        ``scheduler`` 'halving' or 'hyperband' runs ``n_iter`` brackets of
+        ``HyperbandScheduler`` instead (``eta``, ``minbudget`` rounds), on
+        ``workers`` processes (default 1).
+
+        ``folds`` are prebuilt folds instead, for an ``xgtrain`` that can't be
+        sliced (``QuantileDMatrix``, external memory): an object whose
+        ``build()`` returns the (train, test) DMatrix pairs, as
+        ``xgbdata.RowIndexFolds``, is built here and in every worker.
+        """
+
+        if folds is None:
+            self.foldsource_ = join(self.outdir_, 'cvfolds')
+            self.folds_ = make_cvfolds(xgtrain, nfold, self.foldseed_, self.foldsource_)
+        else:
+            self.foldsource_ = folds
+            self.folds_ = folds.build()
+        self.nfold_ = len(self.folds_)
 
         if not self.trieddefault_:
             self.optimizer_.probe(params=list(self.hyperparamdefault_.values()), lazy=False)
             self.trieddefault_ = True
 
+        if scheduler is not None:
+            hb = HyperbandScheduler(self, eta=eta, minrounds=minbudget)
+            with self._cv_executor(workers or 1) as executor:
+                hb.run(n_iter, init_points=init_points, acq=acq, hyperband=scheduler == 'hyperband', executor=executor)
+            self.summary.to_csv(join(self.outdir_, 'summary.csv'))
+            return
+
+        if batchsize > 1:
+            self._optimize_batch(init_points, n_iter, acq, batchsize, workers or batchsize)
+            return
+
         ## NOTE
         # The following block is mostly equivalent to
         #   self.optimizer_.maximize(init_points=init_points, n_iter=n_iter, acq=acq)
@@ -206,6 +382,19 @@ class XgboFitter:
         self.summary.to_csv(join(self.outdir_, 'summary.csv'))
 
 
+    def _optimize_batch(self, init_points, n_iter, acq, batchsize, workers):
+
+        utility = UtilityFunction(kind=acq, kappa=2.576, xi=0.0)
+        with self._cv_executor(workers) as executor:
+            randompoints = self._random_points(init_points)
+            for i in range(0, len(randompoints), batchsize):
+                self._evaluate_batch(randompoints[i:i+batchsize], executor)
+
+            for i in range(0, n_iter, batchsize):
+                self._evaluate_batch(self._propose_batch(utility, min(batchsize, n_iter-i)), executor)
+        self.summary.to_csv(join(self.outdir_, 'summary.csv'))
+
+
     def fit(self, xgtrain, model='optimized'):
 
         params = self.params_
@@ -220,7 +409,7 @@ class XgboFitter:
             for k in params:
                 if k in self.hyperparamloguniform_:
                     params[k] = 10 ** params[k]
-            params['n_estimators'] = self.earlystophistory_[idxmax]
+            params['n_estimators'] = self.earlystophistory_[self.registered_[idxmax]]
 
         self.models_[model] = xgb.train(params, xgtrain, params['n_estimators'], verbose_eval=50)
 
@@ -232,17 +421,16 @@ class XgboFitter:
     @property
     def summary(self):
 
-        res = [dict(d) for d in self.optimizer_.res] # [{'target': float, 'params': dict}, ]
-        for d in res:
-            d['params'] = guardxgbparams(d['params'])
+        params = [guardxgbparams(p) for p in self.cvparams_]
 
         data = {}
         for name in self.cvcolumns_:
             data[name] = [r[name].values[-1] for r in self.cvresults_]
         for hp in self.hyperparamranges_:
-            data[hp] = [r['params'][hp] for r in res]
+            data[hp] = [p[hp] for p in params]
         data['n_estimators'] = self.earlystophistory_
         data['callback'] = self.callbackstatus_
+        data['budget'] = self.budgets_
 
         return pd.DataFrame(data)
 
@@ -260,14 +448,9 @@ class XgboFitter:
 
         tmvafile = join(modeldir, 'weights.xml')
         try:
-            convert_model(self.models_[model].get_dump(),
+            convert_model(self.models_[model].get_dump(dump_format='json'),
                           input_variables=[(n, 'F') for n in feature_names],
-                          output_xml=tmvafile)
-            os.system("xmllint --format {0} > {0}.tmp".format(tmvafile))
-            os.system("mv {0} {0}.bak".format(tmvafile))
-            os.system("mv {0}.tmp {0}".format(tmvafile))
-            os.system("gzip -f {0}".format(tmvafile))
-            os.system("mv {0}.bak {0}".format(tmvafile))
+                          output_xml=[tmvafile, tmvafile + '.gz'])
         except:
             warnings.warn("\n".join([
                 "Warning:",
@@ -276,6 +459,67 @@ class XgboFitter:
                 ]))
 
 
+class HyperbandScheduler:
+    """multi-fidelity scheduling of ``XgboFitter`` probes, the budget being
+    the number of boosting rounds.
+
+    A bracket evaluates n candidates at a few rounds, keeps the best 1/eta,
+    evaluates those at eta times more rounds, and so on up to ``maxrounds``
+    (successive halving). Hyperband cycles brackets from many cheap
+    candidates to few full-budget ones. Promoted candidates keep their fold
+    boosters and continue boosting them. Every candidate is recorded once,
+    with its last result and budget; only final results (full budget, or
+    stopped before the budget) are registered with the Bayesian optimizer,
+    on which candidates are proposed by constant liar.
+    """
+
+    def __init__(self, fitter, eta=3, minrounds=None):
+        self.fitter = fitter
+        self.eta = eta
+        self.maxrounds = fitter.maxrounds_
+        self.minrounds = minrounds or fitter.minrounds_ + fitter.earlystoprounds_
+        self.smax = int(np.floor(np.log(self.maxrounds / self.minrounds) / np.log(eta) + 1e-9))
+
+    def bracket(self, s):
+        """(number of candidates, starting rounds) of bracket ``s``"""
+        n = int(np.ceil((self.smax + 1) / (s + 1) * self.eta ** s))
+        return n, max(int(self.maxrounds * self.eta ** (-s)), 1)
+
+    def run_bracket(self, points, rounds, executor=None):
+        survivors = list(points)
+        states = [{} for _ in survivors]
+        while survivors:
+            results = self.fitter._cv_points(survivors, rounds, executor, states)
+            final = rounds >= self.maxrounds
+            scored = []
+            for point, state, (cv_result, status) in zip(survivors, states, results):
+                if final or len(cv_result) < rounds: # done, or already stopped by a callback
+                    self.fitter._register(point, cv_result, status, budget=rounds)
+                else:
+                    scored.append((self.fitter._target(cv_result), point, state, cv_result, status))
+
+            scored.sort(key=lambda t: -t[0])
+            nkeep = len(survivors) // self.eta
+            for _, point, _, cv_result, status in scored[nkeep:]:
+                self.fitter._register(point, cv_result, status, budget=rounds) # truncated, recorded only
+            survivors = [t[1] for t in scored[:nkeep]]
+            states = [t[2] for t in scored[:nkeep]]
+            rounds = min(rounds * self.eta, self.maxrounds)
+
+    def run(self, nbrackets, init_points=0, acq='ei', hyperband=True, executor=None):
+        """``nbrackets`` brackets, all of the most aggressive one for plain
+        successive halving; ``init_points`` random candidates join the first
+        """
+        utility = UtilityFunction(kind=acq, kappa=2.576, xi=0.0)
+        for i in range(nbrackets):
+            s = self.smax - i % (self.smax + 1) if hyperband else self.smax
+            n, rounds = self.bracket(s)
+            points = self.fitter._random_points(init_points) if i == 0 else []
+            points += self.fitter._propose_batch(utility, max(n - len(points), 0))
+            print(f"[HyperbandScheduler] bracket {i}: {len(points)} candidates from {rounds} rounds")
+            self.run_bracket(points, rounds, executor)
+
+
 class XgboClassifier(XgboFitter):
     def __init__(self, outdir, hyperparamsetting, **kwargs):
         super().__init__(outdir, hyperparamsetting, **kwargs, doregression=False)
@@ -285,6 +529,148 @@ class XgboRegressor(XgboFitter):
     def __init__(self, outdir, hyperparamsetting, **kwargs):
         super().__init__(outdir, hyperparamsetting, **kwargs, doregression=True)
 
+CVEnv = namedtuple('CVEnv', ['model', 'cvfolds', 'iteration', 'begin_iteration', 'end_iteration',
+                             'rank', 'evaluation_result_list']) # same fields as xgboost's callback env
+
+
+def make_cvfolds(xgtrain, nfold, seed, folddir):
+    """``nfold`` (train, test) DMatrix pairs of ``xgtrain``, random split as
+    ``xgb.cv`` does. They are saved with ``save_binary`` under ``folddir`` and
+    loaded from there if a previous build used the same setting and data.
+    """
+    meta = dict(nfold=nfold, seed=seed, num_row=xgtrain.num_row(), fingerprint=fingerprint(xgtrain))
+    metafile = join(folddir, 'meta.json')
+    if os.path.isfile(metafile) and json.load(open(metafile)) == meta:
+        return load_cvfolds(folddir)
+
+    if not os.path.isdir(folddir):
+        os.makedirs(folddir)
+    idx = np.random.RandomState(seed).permutation(xgtrain.num_row())
+    testidx = np.array_split(idx, nfold)
+    folds = []
+    for i in range(nfold):
+        trainidx = np.sort(np.concatenate([testidx[j] for j in range(nfold) if j != i]))
+        dtrain, dtest = xgtrain.slice(trainidx), xgtrain.slice(np.sort(testidx[i]))
+        dtrain.save_binary(join(folddir, f'fold{i}_train.buffer'))
+        dtest.save_binary(join(folddir, f'fold{i}_test.buffer'))
+        folds.append((dtrain, dtest))
+    with open(metafile, 'w') as f:
+        json.dump(meta, f)
+    return folds
+
+
+def fingerprint(dmatrix):
+    """hash of the labels, feature names and number of columns of ``dmatrix``"""
+    h = hashlib.sha1(np.ascontiguousarray(dmatrix.get_label(), dtype=np.float32).tobytes())
+    h.update(json.dumps([list(dmatrix.feature_names or []), dmatrix.num_col()]).encode())
+    return h.hexdigest()
+
+
+def load_cvfolds(folddir):
+    meta = json.load(open(join(folddir, 'meta.json')))
+    return [(xgb.DMatrix(join(folddir, f'fold{i}_train.buffer')), xgb.DMatrix(join(folddir, f'fold{i}_test.buffer')))
+            for i in range(meta['nfold'])]
+
+
+def _aggregate(evals):
+    """[('train-auc', mean, std), ...] across folds from ``Booster.eval_set`` strings"""
+    values = defaultdict(list)
+    for msg in evals:
+        for item in msg.split()[1:]:
+            name, value = item.split(':')
+            values[name].append(float(value))
+    return [(name, np.mean(v), np.std(v)) for name, v in values.items()]
+
+
+def cv_folds(params, folds, num_boost_round, callbacks=(), feval=None, verbose_eval=50, state=None):
+    """``xgb.cv`` on prebuilt ``folds``, same callbacks protocol and result
+    columns. The fold DMatrices keep their quantile cuts between calls.
+
+    With a ``state`` dict, the boosters and evaluation history are kept in it
+    and a later call with the same state and more rounds continues boosting
+    them. The rounds already done are replayed through fresh ``callbacks``.
+    """
+    state = state if state is not None else {}
+    boosters = state.get('boosters')
+    if boosters is None:
+        boosters = [xgb.Booster(params, [dtrain, dtest]) for dtrain, dtest in folds]
+    else:
+        for bst in boosters:
+            bst.set_param(params)
+    history = state.get('history', [])
+    for i in range(num_boost_round):
+        if i < len(history): # boosted by a previous call
+            res = history[i]
+        else:
+            for bst, (dtrain, _) in zip(boosters, folds):
+                bst.update(dtrain, i)
+            res = _aggregate([bst.eval_set([(dtrain, 'train'), (dtest, 'test')], i, feval)
+                              for bst, (dtrain, dtest) in zip(boosters, folds)])
+            history.append(res)
+            if verbose_eval and i % verbose_eval == 0:
+                print('[{}]\t{}'.format(i, '\t'.join('{}:{:g}+{:g}'.format(*r) for r in res)))
+        try:
+            for cb in callbacks:
+                cb(CVEnv(None, boosters, i, 0, num_boost_round, 0, res))
+        except xgb.core.EarlyStopException as e:
+            history = history[:e.best_iteration + 1]
+            break
+    state.update(boosters=boosters, history=history)
+
+    columns = []
+    for name, _, _ in history[0]:
+        columns.extend([f'{name}-mean', f'{name}-std'])
+    return pd.DataFrame([[x for r in res for x in r[1:]] for res in history[:num_boost_round]], columns=columns)
+
+
+def run_cv(params, folds, best_test_eval_metric, num_boost_round,
+           doregression, useeffrms, earlystoprounds, minrounds, bestcurve=None, curvemargin=None, state=None):
+    """one cross validation on ``folds`` with the fitter's callbacks,
+    continuing the boosters of ``state`` if filled (see ``cv_folds``)
+
+    :return: cross validation result and callback status
+    :rtype: tuple
+    """
+    feval = None # evaluation function
+    callback_status = {'status': 0}
+
+    if doregression and useeffrms:
+        callbacks = [early_stop(earlystoprounds, start_round=minrounds, eval_idx=-2),]
+        feval = evaleffrms
+    else:
+        callbacks = [
+            early_stop(earlystoprounds, start_round=minrounds,),
+            callback_overtraining(best_test_eval_metric, callback_status),
+        ]
+    if bestcurve is not None and curvemargin is not None:
+        metric = 'test-effrms' if doregression and useeffrms else 'test-rmse' if doregression else 'test-auc'
+        callbacks.append(callback_curve(bestcurve, curvemargin, callback_status, metric,
+                                        maximize=not doregression, start_round=minrounds))
+
+    cv_result = cv_folds(params, folds,
+                         num_boost_round=num_boost_round,
+                         callbacks=callbacks,
+                         verbose_eval=50,
+                         feval=feval,
+                         state=state)
+    return cv_result, callback_status['status']
+
+
+_CVFOLDS = None # cross validation folds of a worker process
+
+
+def _init_cv_worker(foldsource):
+    """folds saved in a directory, or prebuilt folds object to build"""
+    global _CVFOLDS
+    _CVFOLDS = foldsource.build() if hasattr(foldsource, 'build') else load_cvfolds(foldsource)
+
+
+def _run_cv_worker(params, best_test_eval_metric, cvsetting, state=None):
+    """(cv_result, status, state), the state going back to the scheduler with its boosters"""
+    cv_result, status = run_cv(params, _CVFOLDS, best_test_eval_metric, state=state, **cvsetting)
+    return cv_result, status, state
+
+
 def evaleffrms(preds, dtrain, c=0.683):
     """Effective RMS evaluation function for xgboost
 
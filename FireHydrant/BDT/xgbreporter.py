@@ -7,6 +7,8 @@ An `xgbreport.txt will be dumped under <OUTPUTDIR>, including info below:
 
 * prediction distribution
 * roc curve
+* working points (rocworkingpoints.csv; dense fpr/tpr scans in workingpoints_<model>.csv,
+  with per dataset efficiencies when the predictions carry the dataset)
 * auc score
 * accuracy score
 * classification report
@@ -24,42 +26,32 @@ import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib import gridspec
 from matplotlib.ticker import PercentFormatter
-from sklearn.metrics import roc_curve, roc_auc_score
 np.seterr(divide='ignore', invalid='ignore', over='ignore')
 
 parser = argparse.ArgumentParser(description="Postprocessing output of xgbtrainer")
 parser.add_argument("--dir", '-d', type = str, required = True, help = "training output")
 parser.add_argument("--train", '-t', type = str, required = False, default = None, help = "training data")
-parser.add_argument('--key', '-k', type=str, required=False, default=None, help='key for dataframe')
+parser.add_argument('--key', '-k', type=str, required=False, default=None, help='key for dataframe, or category of a Parquet dataset')
+parser.add_argument('--workers', '-j', type=int, default=4, help='processes rendering the figures')
 args = parser.parse_args()
 assert (os.path.isdir(args.dir) and os.path.isfile(join(args.dir, 'xgbpredictions.h5')))
 
 
 
-def make_prediction_distribution(trainoutdir):
-    print('Making xgb prediction distributions in {}'.format(trainoutdir))
-    from coffea import hist
-
+def load_predictions(trainoutdir):
+    """{'train': df, 'test': df} of xgbpredictions.h5, read once for all reports"""
     datasource = join(trainoutdir, 'xgbpredictions.h5')
-    traindf = pd.read_hdf(datasource, 'train')
-    testdf = pd.read_hdf(datasource, 'test')
+    return {k: pd.read_hdf(datasource, k) for k in ['train', 'test']}
 
-    dataset_axis = hist.Cat('dataset', 'train/test')
-    label_axis = hist.Cat('label', 'S/B')
-    bdt_axis = hist.Bin('score', 'BDT score', 50, -10, 10)
 
+def roc_stats(y_true, y_score, sample_weight=None, groups=None):
+    """``WorkingPoints`` of one model: roc curve, auc and working point queries"""
+    from workingpoints import WorkingPoints
+    return WorkingPoints(y_true, y_score, weight=sample_weight, groups=groups)
 
-    default = hist.Hist("norm. counts", dataset_axis, label_axis, bdt_axis)
-    default.fill(dataset='test', label='signal (test)', score=testdf.query('y==1')['default'].values)
-    default.fill(dataset='test', label='background (test)', score=testdf.query('y==0')['default'].values)
-    default.fill(dataset='train', label='signal (train)', score=traindf.query('y==1')['default'].values)
-    default.fill(dataset='train', label='background (train)', score=traindf.query('y==0')['default'].values)
 
-    optimized = hist.Hist("norm. counts", dataset_axis, label_axis, bdt_axis)
-    optimized.fill(dataset='test', label='signal (test)', score=testdf.query('y==1')['optimized'].values)
-    optimized.fill(dataset='test', label='background (test)', score=testdf.query('y==0')['optimized'].values)
-    optimized.fill(dataset='train', label='signal (train)', score=traindf.query('y==1')['optimized'].values)
-    optimized.fill(dataset='train', label='background (train)', score=traindf.query('y==0')['optimized'].values)
+def plot_prediction_distribution(h, title, outfn):
+    from coffea import hist
 
     data_err_opts = {
         'linestyle':'none',
@@ -75,78 +67,100 @@ def make_prediction_distribution(trainoutdir):
     }
 
     fig, ax = plt.subplots(figsize=(8,6))
-    hist.plot1d(default.project('dataset', 'test'), overlay='label', ax=ax, density=True, clear=False, error_opts=data_err_opts)
-    hist.plot1d(default.project('dataset', 'train'), overlay='label', ax=ax, line_opts=None, clear=False, density=True, fill_opts=fill_opts)
+    hist.plot1d(h.project('dataset', 'test'), overlay='label', ax=ax, density=True, clear=False, error_opts=data_err_opts)
+    hist.plot1d(h.project('dataset', 'train'), overlay='label', ax=ax, line_opts=None, clear=False, density=True, fill_opts=fill_opts)
     ax.legend()
     ax.autoscale(axis='y', tight=True)
     ax.set_ylim(0, None);
-    ax.set_title('default BDT response', x=0.0, ha="left")
+    ax.set_title(title, x=0.0, ha="left")
     ax.set_xlabel(ax.get_xlabel(), x=1.0, ha="right")
     ax.set_ylabel(ax.get_ylabel(), y=1.0, ha="right")
-    plt.savefig(join(trainoutdir, "prediction_dist_default.pdf"), bbox_inches='tight')
+    plt.savefig(outfn, bbox_inches='tight')
     plt.close()
 
-    fig, ax = plt.subplots(figsize=(8,6))
-    hist.plot1d(optimized.project('dataset', 'test'), overlay='label', ax=ax, density=True, clear=False, error_opts=data_err_opts)
-    hist.plot1d(optimized.project('dataset', 'train'), overlay='label', ax=ax, line_opts=None, clear=False, density=True, fill_opts=fill_opts)
-    ax.legend()
-    ax.autoscale(axis='y', tight=True)
+
+def make_prediction_distribution(trainoutdir, predictions):
+    """render jobs of the train/test BDT response distributions"""
+    print('Making xgb prediction distributions in {}'.format(trainoutdir))
+    from coffea import hist
+
+    traindf, testdf = predictions['train'], predictions['test']
+
+    dataset_axis = hist.Cat('dataset', 'train/test')
+    label_axis = hist.Cat('label', 'S/B')
+    bdt_axis = hist.Bin('score', 'BDT score', 50, -10, 10)
+
+    jobs = []
+    for m in ['default', 'optimized']:
+        h = hist.Hist("norm. counts", dataset_axis, label_axis, bdt_axis)
+        h.fill(dataset='test', label='signal (test)', score=testdf.query('y==1')[m].values)
+        h.fill(dataset='test', label='background (test)', score=testdf.query('y==0')[m].values)
+        h.fill(dataset='train', label='signal (train)', score=traindf.query('y==1')[m].values)
+        h.fill(dataset='train', label='background (train)', score=traindf.query('y==0')[m].values)
+        jobs.append((plot_prediction_distribution, (h, f'{m} BDT response', join(trainoutdir, f"prediction_dist_{m}.pdf"))))
+    return jobs
+
+
+def iter_trainingdata(trainingdata, key, batchsize=200000):
+    """DataFrame batches of the training data, a Parquet dataset (``key``
+    the category) or a hdf5 file, without loading it as a whole
+    """
+    if os.path.isdir(trainingdata):
+        import pyarrow.dataset as ds
+        from trainingdata import FEATURES
+        dset = ds.dataset(trainingdata, format='parquet', partitioning='hive')
+        for batch in dset.to_batches(columns=FEATURES + ['label'], filter=ds.field('category') == key,
+                                     batch_size=batchsize):
+            yield batch.to_pandas()
+        return
+    with pd.HDFStore(trainingdata, 'r') as store:
+        nrows = store.get_storer(key).shape[0]
+        for start in range(0, nrows, batchsize):
+            yield store.select(key, start=start, stop=start+batchsize)
+
+
+def plot_full_distribution(h, title, outfn):
+    from coffea import hist
+
+    fig, ax = plt.subplots(figsize=(8, 6))
+    hist.plot1d(h, overlay='label', ax=ax, density=True)
     ax.set_ylim(0, None);
-    ax.set_title('optimized BDT response', x=0.0, ha="left")
+    ax.set_title(title, x=0.0, ha="left")
     ax.set_xlabel(ax.get_xlabel(), x=1.0, ha="right")
     ax.set_ylabel(ax.get_ylabel(), y=1.0, ha="right")
-    plt.savefig(join(trainoutdir, "prediction_dist_optimized.pdf"), bbox_inches='tight')
+    plt.savefig(outfn, bbox_inches='tight')
     plt.close()
 
 
-def make_full_prediction_distribution(trainoutdir, trainingdata, key):
+def make_full_prediction_distribution(trainoutdir, trainingdata, key, batchsize=200000):
+    """render jobs of the BDT response on the full training dataset,
+    predicted batch by batch so memory stays bounded
+    """
     print(f"Make predictions on full training dataset: {trainingdata} and model in {trainoutdir}")
     from coffea import hist
     import xgboost as xgb
 
-    ## full dataset
-    df = pd.read_hdf(trainingdata, key)
-    featurecols = [x for x in df.columns if x != 'label']
-    dfull = xgb.DMatrix(df[featurecols], label=df['label'])
-
-    ## default and optimized models
-    xgbm_default = xgb.Booster({"nthread": 16})
-    xgbm_default.load_model(join(trainoutdir, "model_default/model.bin"))
-    xgbm_optimized = xgb.Booster({"nthread": 16})
-    xgbm_optimized.load_model(join(trainoutdir, "model_optimized/model.bin"))
-
-    ## predictions
-    preds_default = xgbm_default.predict(dfull)
-    preds_optimized = xgbm_optimized.predict(dfull)
-
-    ## making plots
     label_axis = hist.Cat('label', 'S/B')
     bdt_axis = hist.Bin('score', 'BDT score', 50, -10, 10)
 
-    default = hist.Hist("norm. counts", label_axis, bdt_axis)
-    default.fill(label='signal', score=preds_default[df['label'].values.astype(bool)])
-    default.fill(label='background', score=preds_default[~df['label'].values.astype(bool)])
-    optimized = hist.Hist("norm. counts", label_axis, bdt_axis)
-    optimized.fill(label='signal', score=preds_optimized[df['label'].values.astype(bool)])
-    optimized.fill(label='background', score=preds_optimized[~df['label'].values.astype(bool)])
+    models, hists = {}, {}
+    for m in ['default', 'optimized']:
+        models[m] = xgb.Booster({"nthread": 16})
+        models[m].load_model(join(trainoutdir, f"model_{m}/model.bin"))
+        hists[m] = hist.Hist("norm. counts", label_axis, bdt_axis)
 
-    fig, ax = plt.subplots(figsize=(8, 6))
-    hist.plot1d(default, overlay='label', ax=ax, density=True)
-    ax.set_ylim(0, None);
-    ax.set_title('default BDT response on full dataset', x=0.0, ha="left")
-    ax.set_xlabel(ax.get_xlabel(), x=1.0, ha="right")
-    ax.set_ylabel(ax.get_ylabel(), y=1.0, ha="right")
-    plt.savefig(join(trainoutdir, "prediction_fulldist_default.pdf"), bbox_inches='tight')
-    plt.close()
+    for df in iter_trainingdata(trainingdata, key, batchsize=batchsize):
+        featurecols = [x for x in df.columns if x != 'label']
+        dbatch = xgb.DMatrix(df[featurecols])
+        issignal = df['label'].values.astype(bool)
+        for m in models:
+            preds = models[m].predict(dbatch)
+            hists[m].fill(label='signal', score=preds[issignal])
+            hists[m].fill(label='background', score=preds[~issignal])
 
-    fig, ax = plt.subplots(figsize=(8, 6))
-    hist.plot1d(optimized, overlay='label', ax=ax, density=True)
-    ax.set_ylim(0, None);
-    ax.set_title('optimized BDT response on full dataset', x=0.0, ha="left")
-    ax.set_xlabel(ax.get_xlabel(), x=1.0, ha="right")
-    ax.set_ylabel(ax.get_ylabel(), y=1.0, ha="right")
-    plt.savefig(join(trainoutdir, "prediction_fulldist_optimized.pdf"), bbox_inches='tight')
-    plt.close()
+    return [(plot_full_distribution, (hists[m], f'{m} BDT response on full dataset',
+                                      join(trainoutdir, f"prediction_fulldist_{m}.pdf")))
+            for m in models]
 
 
 
@@ -193,9 +207,8 @@ class RocPlot():
         self.auc_ = []
         self.ncol_ = ncol  # legend columns
 
-    def plot(self, y_true, y_score, **kwargs):
-        fpr, tpr, _ = roc_curve(y_true, y_score)
-        self.auc_.append(roc_auc_score(y_true, y_score))
+    def plot(self, fpr, tpr, auc=None, **kwargs):
+        self.auc_.append(auc)
 
         if not hasattr(self, 'fpr_ref'):
             self.fpr_ref = fpr
@@ -219,22 +232,22 @@ class RocPlot():
             self.axis.get_yaxis().set_major_formatter(PercentFormatter(decimals=1, symbol=None))
 
 
-def make_roc_curve(trainoutdir):
-    print('Making roc curve in {}'.format(trainoutdir))
-
-    datasource = join(trainoutdir, 'xgbpredictions.h5')
-    testdf = pd.read_hdf(datasource, 'test')
-
+def plot_roc_curve(rocs, outfn):
     plt.figure(figsize=(8, 6))
     roc = RocPlot(xlim=(0.6, 1), ylim=(1e-5, 1), height_ratios=[4, 1],
                  logscale=True, grid=True, percentage=True,
                  ncol=2, rlim=(0.95, 1.05))
-    for m in ['default', 'optimized']:
-        roc.plot(testdf['y'].values, testdf[m].values, label=m)
+    for m, r in rocs.items():
+        roc.plot(r.fpr, r.tpr, auc=r.auc, label=m)
 
-    plt.savefig(join(trainoutdir, 'roccurve.pdf'), bbox_inches='tight')
+    plt.savefig(outfn, bbox_inches='tight')
     plt.close()
 
+
+def make_roc_curve(trainoutdir, rocs):
+    """working points table, and the render job of the roc curve"""
+    print('Making roc curve in {}'.format(trainoutdir))
+
     print("Extracing working points ...")
     rocstats = {
         'workingpoints': ['tight', 'medium', 'loose'],
@@ -248,45 +261,69 @@ def make_roc_curve(trainoutdir):
     }
 
     for m in ['default', 'optimized']:
-        fpr, tpr, thresholds = roc_curve(testdf['y'].values, testdf[m].values)
-        rocstats['fakepositiverate_' + m] = [fpr[fpr > t][0] for t in rocstats['targetfpr']]
-        rocstats['truepositiverate_' + m] = [tpr[fpr > t][0] for t in rocstats['targetfpr']]
-        rocstats['threshold_' + m] = [thresholds[fpr > t][0] for t in rocstats['targetfpr']]
+        wp = rocs[m].table(fpr=rocstats['targetfpr'])
+        rocstats['fakepositiverate_' + m] = wp['fpr'].tolist()
+        rocstats['truepositiverate_' + m] = wp['tpr'].tolist()
+        rocstats['threshold_' + m] = wp['threshold'].tolist()
+
+        ## dense scans, with per dataset efficiencies if known
+        rocs[m].table(fpr=np.logspace(-5, 0, 201), tpr=np.linspace(0.5, 1, 101)) \
+               .to_csv(join(trainoutdir, f'workingpoints_{m}.csv'), index=False)
 
     pd.DataFrame(rocstats).to_csv(join(trainoutdir, 'rocworkingpoints.csv'))
+    return [(plot_roc_curve, (rocs, join(trainoutdir, 'roccurve.pdf')))]
 
 
-def make_text_report(trainoutdir):
+def make_text_report(trainoutdir, predictions, rocs):
 
-    from sklearn.metrics import accuracy_score, roc_auc_score, classification_report
+    from sklearn.metrics import accuracy_score, classification_report
 
     print("Dumping `accuracy_score`, `roc_auc_score`, and `classification_report` as text files")
-    datasource = join(trainoutdir, 'xgbpredictions.h5')
-    testdf = pd.read_hdf(datasource, 'test')
+    testdf = predictions['test']
 
     with open(join(trainoutdir, 'xgbtestreport.txt'), 'w') as outf:
         for m in ['default', 'optimized']:
             outf.write('**** {} ****\n'.format(m))
 
             outf.write('accuracy score: {}\n'.format(accuracy_score(testdf['y'].values, testdf[m].values.astype(bool))))
-            outf.write('roc auc score: {}\n'.format(roc_auc_score(testdf['y'].values, testdf[m].values)))
+            outf.write('roc auc score: {}\n'.format(rocs[m].auc))
             outf.write('classification report:\n')
             outf.write(classification_report(testdf['y'].values, testdf[m].values.astype(bool), digits=4))
             outf.write('\n\n')
 
 
+def _render(job):
+    func, funcargs = job
+    func(*funcargs)
+
+
+def render(jobs, workers=4):
+    """run figure render jobs ((function, args)) on a process pool"""
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(_render, jobs))
+
+
 
 if __name__ == "__main__":
 
     import time
     starttime = time.time()
 
-    make_prediction_distribution(args.dir)
-    make_roc_curve(args.dir)
-    make_text_report(args.dir)
+    predictions = load_predictions(args.dir)
+    testdf = predictions['test']
+    groups = testdf['dataset'].values if 'dataset' in testdf else None
+    rocs = {m: roc_stats(testdf['y'].values, testdf[m].values, groups=groups)
+            for m in ['default', 'optimized']}
+
+    jobs = make_prediction_distribution(args.dir, predictions)
+    jobs += make_roc_curve(args.dir, rocs)
+    make_text_report(args.dir, predictions, rocs)
 
     if args.train and args.key:
         assert (os.path.exists(args.train))
-        make_full_prediction_distribution(args.dir, args.train, args.key)
+        jobs += make_full_prediction_distribution(args.dir, args.train, args.key)
+
+    render(jobs, workers=args.workers)
 
     print("---> Took {} s".format(time.time()-starttime))
\ No newline at end of file
@@ -2,6 +2,7 @@
 """Run BDT training and optimization
 
 usage: python xgbtrainer.py -d <data.h5> -k <key> -c <config.yml>
+       python xgbtrainer.py -d <trainingdata dir> -k <notrack|tracked> -c <config.yml>
 """
 
 import argparse
@@ -11,13 +12,15 @@ from os.path import join
 import yaml
 
 parser = argparse.ArgumentParser(description="BDT training with XGBoost")
-parser.add_argument("--data", "-d", type=str, help="data file as pandas DataFrame stored in hdf5")
-parser.add_argument("--key", '-k', type=str, default='df', help='key name of dataframe in hdf5')
+parser.add_argument("--data", "-d", type=str, help="Parquet dataset written by trainingdataharvester, or data file as pandas DataFrame stored in hdf5")
+parser.add_argument("--key", '-k', type=str, default='df', help='category (notrack/tracked) of the Parquet dataset, or key name of dataframe in hdf5')
 parser.add_argument("--config", "-c", type=str, help="config file in yaml")
+parser.add_argument("--outofcore", action='store_true', help="stream the Parquet dataset into xgboost instead of loading it in memory")
 parser.add_argument("--outdir", "-o", type=str, default=None, help='specify output directory')
 args = parser.parse_args()
 assert os.path.exists(args.data)
 assert os.path.exists(args.config)
+assert not args.outofcore or os.path.isdir(args.data), "--outofcore needs a Parquet dataset directory"
 if args.outdir:
     if not os.path.isdir(args.outdir):
         print("Output directory --> {} set, but do not exist.".format(args.outdir))
@@ -66,25 +69,44 @@ if __name__ == "__main__":
     optimizer_setting = config.pop('optimizer_setting')
 
     ## load training data
-    df = pd.read_hdf(args.data, args.key)
-    featurecols = [c for c in df.columns if c != 'label']
-    X_train, X_test, y_train, y_test = train_test_split(df[featurecols],
-                                                        df['label'],
-                                                        random_state=np.random.randint(2019),
-                                                        test_size=1 - training_fraction)
-    ## entries from class with more entries are discarded.
-    #  This is because classifier performance is usually bottlenecked by the
-    #  size of the dataset with fewer entries. Having one class with extra
-    #  statistics usually just adds computing time.
-    n_perclass = min(y_train.value_counts())
-    selectedidx = np.concatenate([
-        y_train[y_train==0].head(n_perclass).index.values,
-        y_train[y_train==1].head(n_perclass).index.values,
-    ])
-    X_train = X_train.loc[selectedidx]
-    y_train = y_train.loc[selectedidx]
-    xgtrain = xgb.DMatrix(X_train, label=y_train)
-    xgtest = xgb.DMatrix(X_test, label=y_test)
+    if args.outofcore:
+        ## split and class balancing on row indices, features are streamed
+        #  file by file into quantized DMatrix-es.
+        from xgbdata import RowIndex, RowIndexFolds, build_dmatrix
+        from trainingdata import FEATURES
+        featurecols = FEATURES
+        rowindex = RowIndex(args.data, args.key)
+        trainidx, testidx = rowindex.split(training_fraction, seed=np.random.randint(2019))
+        labels = rowindex.label_array()
+        y_train, y_test = labels[trainidx], labels[testidx]
+        datasets_test = rowindex.dataset_array()[testidx]
+        xgtrain = build_dmatrix(rowindex, trainidx)
+        xgtest = build_dmatrix(rowindex, testidx, ref=xgtrain)
+    else:
+        if os.path.isdir(args.data):
+            from trainingdata import FEATURES, load_trainingdata
+            df = load_trainingdata(args.data, args.key, columns=FEATURES + ['label', 'dataset'])
+        else:
+            df = pd.read_hdf(args.data, args.key)
+        featurecols = [c for c in df.columns if c not in ('label', 'dataset')]
+        X_train, X_test, y_train, y_test = train_test_split(df[featurecols],
+                                                            df['label'],
+                                                            random_state=np.random.randint(2019),
+                                                            test_size=1 - training_fraction)
+        ## entries from class with more entries are discarded.
+        #  This is because classifier performance is usually bottlenecked by the
+        #  size of the dataset with fewer entries. Having one class with extra
+        #  statistics usually just adds computing time.
+        n_perclass = min(y_train.value_counts())
+        selectedidx = np.concatenate([
+            y_train[y_train==0].head(n_perclass).index.values,
+            y_train[y_train==1].head(n_perclass).index.values,
+        ])
+        X_train = X_train.loc[selectedidx]
+        y_train = y_train.loc[selectedidx]
+        datasets_test = df.loc[y_test.index, 'dataset'].values if 'dataset' in df else None
+        xgtrain = xgb.DMatrix(X_train, label=y_train)
+        xgtest = xgb.DMatrix(X_test, label=y_test)
 
 
     ## setup output
@@ -97,6 +119,12 @@ if __name__ == "__main__":
 
     ## build classifier and run optimization
     classifier = XgboClassifier(outputdir, hyperparam_setting, **classifier_setting)
+    if args.outofcore:
+        ## quantized DMatrix-es can't be sliced into folds, stream each fold from its row indices
+        optimizer_setting['folds'] = RowIndexFolds(rowindex, trainidx,
+                                                   nfold=optimizer_setting.pop('nfold', 5),
+                                                   seed=classifier.foldseed_,
+                                                   cachedir=join(outputdir, 'cvfolds'))
     classifier.optimize(xgtrain, **optimizer_setting)
 
 
@@ -115,6 +143,8 @@ if __name__ == "__main__":
         plt.close()
 
     predictions['test']['y'] = y_test
+    if datasets_test is not None:
+        predictions['test']['dataset'] = np.asarray(datasets_test, dtype=str)
     predictions['train']['y'] = y_train
 
     predictionfile = join(outputdir, 'xgbpredictions.h5')
@@ -6,26 +6,22 @@ this script will output a .json file containing complete filepaths to all .root
 weights associated with those files. Signal and data files are assigned a weight of 1.
 '''
 
-import uproot
 import json
-import pyxrootd.client
-import fnmatch
-import numpy as np
-import subprocess
-import concurrent.futures
-import warnings
 import os
-import difflib
 import re
 from optparse import OptionParser
 from datetime import datetime
 from process import *
-from eventCounter import *
+
+from FireHydrant.Tools.commonhelpers import EOSLister, LocalBackend
+from FireHydrant.Tools.filecatalog import FileCatalog, default_catalog_path
 
 parser = OptionParser()
 parser.add_option('-d', '--dataset', help='dataset', dest='dataset')
 parser.add_option('-y', '--year', help='year', dest='year')
 parser.add_option('-p', '--pack', help='pack', dest='pack')
+parser.add_option('--catalog', help='file metadata catalog (SQLite)', dest='catalog', default=None)
+parser.add_option('--localeos', help='local directory tree mirroring EOS, instead of calling eos', dest='localeos', default=None)
 (options, args) = parser.parse_args()
 
 beans={}
@@ -55,269 +51,141 @@ for k,v in processes.items():
     else:
         xsections[k] = 1
 
-datadef = {}
-for folder in beans['2018']:
-    print("Opening", folder)
-    for dataset in xsections.keys():
-        if options.dataset and options.dataset not in dataset: continue 
-            
-        timestampdirs = []
-        urllist = []
-        
-        '''
-        The Dataset 'QCD_Pt-30to50' is not available on disk. This section masks out this dataset, but
-        can be removed if the dataset becomes available.
-        '''
-
-        if dataset == 'QCD_Pt-30to50_MuEnrichedPt5_TuneCP5_13TeV_pythia8':
-            print("Looking into", dataset)
-            print('This dataset has been masked out.')
-            continue
-
-        '''
-        The TTJets dataset has data stored in two different places, so we check both for the most recent
-        timestamp.
-        '''
-            
-        elif dataset == 'TTJets_TuneCP5_13TeV-madgraphMLM-pythia8':
-            latest = []
-            for extrafolder in beans['TTJets']:
-                print("Opening", extrafolder)
-                print("Looking into", extrafolder+"/"+dataset)
-                totalpath = extrafolder+"/"+dataset
-                timestampdirs = []
-                cmd = "eos {0} find -f {1} | grep 'ffNtuple' > {2}".format("root://cmseos.fnal.gov/", totalpath, dataset+"_subdirs.txt")
-                os.system(cmd)
-                slist=open(dataset+"_subdirs.txt")
-                s = slist.readlines()
-                for apath in s:
-                    if "/failed/" in apath:
-                        continue
-                    splits = apath.strip().split('/')
-                    for i in range (0, (len(splits)-1)):
-                        if splits[i] == '':
-                            splits.pop(i)
-                    if extrafolder == '/store/group/lpcmetx/MCSIDM/ffNtuple/2018':
-                        timestamp = splits[-3]
-                    else:
-                        timestamp = splits[-2]
-                    timestampdirs.append(timestamp)
-                
-                timestampdirs = sorted(
-                    timestampdirs, key=lambda x: datetime.strptime(x, "%y%m%d_%H%M%S")
-                )
-
-                latest.append(timestampdirs[-1])
-                
-            truelatest = sorted(
-                latest, key=lambda x: datetime.strptime(x, "%y%m%d_%H%M%S")
-            )
-            
-            truelatest = truelatest[-1]
-            
-            for extrafolder in beans['TTJets']:
-                    testpath = extrafolder+"/"+dataset
-                    cmd = "eos {0} find -d {1} | grep {2} > test.txt".format("root://cmseos.fnal.gov/", testpath, truelatest)
-                    os.system(cmd)
-                    tlist = open("test.txt")
-                    t = tlist.readlines()
-                    for apath in t:
-                        if truelatest in apath:
-                            totalpath = testpath
-                            os.system("rm test.txt")
-                        else:
-                            os.system("rm test.txt")
-            print("totalpath: ", totalpath)
-            cmd = "eos {0} find -f --xurl {1} | grep {2} > {3}".format("root://cmseos.fnal.gov/", totalpath, truelatest, dataset+".txt")
-            os.system(cmd)
-            flist = open(dataset+".txt")
-            f = flist.readlines()
-            print('file length:',len(f))
-            
-        '''
-        The DoubleMuon dataset has four subsections, A, B, C, and D. We want the most recent dataset for
-        each, not overall.
-        '''
-
-        elif dataset == 'DoubleMuon':
-            print("Looking into", folder+"/"+dataset)
-            totalpath = folder+"/"+dataset
-            f = []
-            latest = []
-
-            cmd = "eos {0} find -d {1} | grep '000*/$' > {2}".format("root://cmseos.fnal.gov/", totalpath, dataset+"_subdirs.txt")
-            os.system(cmd)
-            slist=open(dataset+"_subdirs.txt")
-            s = slist.readlines()
-            for abcd in datadataset.keys():
-                print('looking at: ', abcd)
-                timestampdirs = []
-                for apath in s:
-                    if "/failed/" in apath:
-                        continue
-                    if not (abcd in apath):
-                        continue
-                    if '0000' in apath or '0001' in apath:
-                        splits = apath.strip().split('/')
-                        for i in range(0, len(splits)):
-                            if splits[i] == '':
-                                splits.pop(i)
-                        timestamp = splits[-2]
-                        timestampdirs.append(timestamp)
-
-                timestampdirs = sorted(
-                    timestampdirs, key=lambda x: datetime.strptime(x, "%y%m%d_%H%M%S")
-                )
-
-                latest = timestampdirs[-1]
-            
-                cmd = "eos {0} find -f --xurl {1} | grep {2} > {3}".format("root://cmseos.fnal.gov/", totalpath, latest,        abcd+'_'+dataset+".txt")
-                os.system(cmd)
-                flist = open(abcd+'_'+dataset+".txt")
-                f += flist.readlines()
-                print('file length:', len(f))
-                os.system("rm "+abcd+'_'+dataset+".txt")
-                
-        '''
-        The CRAB_PrivateMC dataset has data stored in two different places, as well as subsections like DoubleMuon does.
-        We check both places for the most recent dataset, and store for each subsection.
-        '''
-
-        elif dataset == 'CRAB_PrivateMC':
-            f = []
-            latest = []
-            for ctau in signaldataset.keys():
-                print("Looking at: ", ctau)
-                timestampdirs = []
-                latest = []
-                for extrafolder in beans['Signal']:
-                    print('Opening ', extrafolder)
-                    print("Looking into", extrafolder+"/"+dataset)
-                    totalpath = extrafolder+"/"+dataset
-                    cmd = "eos {0} find -d {1} | grep '000*/$' > {2}".format("root://cmseos.fnal.gov/", totalpath, dataset+"_subdirs.txt")
-                    os.system(cmd)
-                    slist=open(dataset+"_subdirs.txt")
-                    s = slist.readlines()
-                    for apath in s:
-                        if "/failed/" in apath:
-                            continue
-                        if not (ctau in apath):
-                            continue
-                        if '0000' in apath or '0001' in apath:
-                            splits = apath.strip().split('/')
-                            for i in range(0, len(splits)):
-                                if splits[i] == '':
-                                    splits.pop(i)
-                            timestamp = splits[-2]
-                            timestampdirs.append(timestamp)
-
-                    timestampdirs = sorted(
-                        timestampdirs, key=lambda x: datetime.strptime(x, "%y%m%d_%H%M%S")
-                    )
+LISTER = EOSLister(LocalBackend(options.localeos) if options.localeos else None)
+TIMESTAMP = re.compile(r'/(\d{6}_\d{6})/')
+
+def searchfolders(dataset):
+    '''
+    The TTJets and CRAB_PrivateMC datasets have data stored in two different places, we look into both
+    for the most recent timestamp.
+    '''
+    if dataset == 'TTJets_TuneCP5_13TeV-madgraphMLM-pythia8':
+        return beans['TTJets']
+    if dataset == 'CRAB_PrivateMC':
+        return beans['Signal']
+    return beans['2018']
+
+def subsets(dataset):
+    '''
+    The DoubleMuon dataset has four subsections, A, B, C, and D, and CRAB_PrivateMC one per ctau point.
+    We want the most recent submission for each, not overall.
+    '''
+    if dataset == 'DoubleMuon':
+        return list(datadataset)
+    if dataset == 'CRAB_PrivateMC':
+        return list(signaldataset)
+    return [None]
+
+def latest_submission(files, subset=None):
+    '''
+    Files of the latest timestamped submission among `files`, restricted to paths containing `subset`.
+    '''
+    stamped = []
+    for f in files:
+        m = TIMESTAMP.search(f)
+        if m and (subset is None or subset in f):
+            stamped.append((m.group(1), f))
+    if not stamped:
+        print('No timestamped files found for', subset)
+        return []
+    latest = max({ts for ts, _ in stamped}, key=lambda x: datetime.strptime(x, "%y%m%d_%H%M%S"))
+    return [f for ts, f in stamped if ts == latest]
+
+
+datasets = []
+for dataset in xsections.keys():
+    if options.dataset and options.dataset not in dataset: continue
+
+    '''
+    The Dataset 'QCD_Pt-30to50' is not available on disk. This section masks out this dataset, but
+    can be removed if the dataset becomes available.
+    '''
+
+    if dataset == 'QCD_Pt-30to50_MuEnrichedPt5_TuneCP5_13TeV_pythia8':
+        print("Looking into", dataset)
+        print('This dataset has been masked out.')
+        continue
+    datasets.append(dataset)
 
-                    latest.append(timestampdirs[-1])
-                    
-                truelatest = sorted(
-                    latest, key=lambda x: datetime. strptime(x, "%y%m%d_%H%M%S")
-                )
-                
-                truelatest = truelatest[-1]
-                
-                for extrafolder in beans['Signal']:
-                    testpath = extrafolder+"/"+dataset
-                    cmd = "eos {0} find -d {1} | grep {2} > test.txt".format("root://cmseos.fnal.gov/", testpath, truelatest)
-                    os.system(cmd)
-                    tlist = open("test.txt")
-                    t = tlist.readlines()
-                    for apath in t:
-                        if truelatest in apath:
-                            totalpath = testpath
-                            os.system("rm test.txt")
-                        else:
-                            os.system("rm test.txt")
-                
-                cmd = "eos {0} find -f --xurl {1} | grep {2} > {3}".format("root://cmseos.fnal.gov/", totalpath, truelatest,        ctau+'_'+dataset+".txt")
-                os.system(cmd)
-                flist = open(ctau+'_'+dataset+".txt")
-                f += flist.readlines()
-                print('file length:', len(f))
-                os.system("rm "+ctau+'_'+dataset+".txt")
-
-        '''
-        The rest of the datasets have normal data storage.
-        '''
-                
-        else:
-            print("Looking into", folder+"/"+dataset)
-            totalpath = folder+"/"+dataset
-            latest = []
-
-            cmd = "eos {0} find -d {1} | grep '000*/$' > {2}".format("root://cmseos.fnal.gov/", totalpath, dataset+"_subdirs.txt")
-            os.system(cmd)
-            slist=open(dataset+"_subdirs.txt")
-            s = slist.readlines()
-            for apath in s:
-                if "/failed/" in apath:
-                    continue
-                if '0000' in apath or '0001' in apath:
-                    splits = apath.strip().split('/')
-                    for i in range(0, len(splits)):
-                        if splits[i] == '':
-                            splits.pop(i)
-                    timestamp = splits[-2]
-                    timestampdirs.append(timestamp)
-
-            timestampdirs = sorted(
-                timestampdirs, key=lambda x: datetime.strptime(x, "%y%m%d_%H%M%S")
-            )
+'''
+One concurrent `eos find` per dataset folder, then everything is filtered in memory.
+'''
 
-            latest = timestampdirs[-1]
+searchpaths = {d: [folder+"/"+d for folder in searchfolders(d)] for d in datasets}
+found = LISTER.find_many([p for d in datasets for p in searchpaths[d]], pattern='*ffNtuple*.root', strict=False)
 
-            cmd = "eos {0} find -f --xurl {1} | grep {2} > {3}".format("root://cmseos.fnal.gov/", totalpath, latest, dataset+".txt")
-            os.system(cmd)
-            flist = open(dataset+".txt")
-            f = flist.readlines()
-            print('file length:',len(f))
+filelists = {}
+for dataset in datasets:
+    print("Looking into", dataset)
+    allfiles = [f.strip() for p in searchpaths[dataset] for f in found[p] if '/failed/' not in f]
+    filelists[dataset] = []
+    for subset in subsets(dataset):
+        filelists[dataset] += latest_submission(allfiles, subset)
+    print('file length:', len(filelists[dataset]))
 
-        '''
-        Weight is calculated from luminosity and cross-section.
-        '''
+'''
+Weight is calculated per file from luminosity, cross-section and the number of events processed, read for all
+background files in one parallel metadata pass (files already in the catalog are not opened again). Only the
+`history` event counts are needed, so the gen weight branches are not read. Every file of a dataset carries
+xs * lumi / (events processed by all its files); files whose counts cannot be read are left out, as their
+events would be missing from the normalization.
+xs for data and signal events is assigned as 1, which gives a weight of 1.
+'''
 
-        xs = xsections[dataset]
-        for path in f:
-            s = path.strip().split('/')
-            eospath = ""
-            for i in range (0,len(s)): eospath=eospath+'/'+s[i]
-            eospath=eospath.strip('/')
-            if (not ('failed' in eospath)):
-                urllist.append(eospath)
-                if xs != 1: #xs for data and signal events is assigned as 1
-                    eventcount += processed_event_number(eospath)
-                else:
-                    eventcount = xs * lumi #to give a weight of 1 for data and signal events
-                    
-        scale = xs / eventcount
-        weight = scale * lumi
+catalogpath = options.catalog
+if catalogpath is None:
+    if os.getenv('FH_BASE'):
+        catalogpath = default_catalog_path()
+    else:
+        catalogpath = 'beans/filecatalog.db'
+        print('FH_BASE not set, file metadata catalog kept in', catalogpath)
+os.makedirs("beans", exist_ok=True)
 
-        '''
-        Finally, files, weight, and cross-section are all stored, and dumped into a single .json file.
-        '''
+mcfiles = [f for d in datasets if xsections[d] != 1 for f in filelists[d]]
+records = {}
+if mcfiles:
+    with FileCatalog(catalogpath) as catalog:
+        records = catalog.update(mcfiles, genwgt='history')
 
-        print('list length:', len(urllist))
-        urllist = split(urllist, int(options.pack))
-        if urllist:
-            for i in range(0,len(urllist)) :
-                 datadef[dataset+"____"+str(i)] = {
-                      'files': urllist[i],
-                      'weight': weight,
-                      'xs': xs,
-                      }
-        os.system("rm "+dataset+".txt")
-        os.system("rm "+dataset+"_subdirs.txt")
+datadef = {}
+for dataset in datasets:
+    xs = xsections[dataset]
+    urllist = filelists[dataset]
+    if xs != 1:
+        counted = [f for f in urllist if f in records and records[f]['hist_events']]
+        if len(counted) != len(urllist):
+            print(len(urllist)-len(counted), 'files without events processed in', dataset, ', left out.')
+        urllist = counted
+        eventcount = sum(records[f]['hist_events'] for f in urllist)
+        if not eventcount:
+            print('No events processed found for', dataset, ', skipped.')
+            continue
+    else:
+        eventcount = xs * lumi #to give a weight of 1 for data and signal events
+
+    scale = xs / eventcount
+    fileweights = [scale * lumi] * len(urllist)
+
+    '''
+    Finally, files, weight, and cross-section are all stored, and dumped into a single .json file.
+    `weights` holds the weight of each file next to `files`; files of one dataset share the
+    normalization, so `weight` of a pack is that common value.
+    '''
+
+    print('list length:', len(urllist))
+    urllist = split(urllist, int(options.pack))
+    fileweights = split(fileweights, int(options.pack))
+    if urllist:
+        for i in range(0,len(urllist)) :
+             datadef[dataset+"____"+str(i)] = {
+                  'files': urllist[i],
+                  'weights': fileweights[i],
+                  'weight': scale * lumi,
+                  'xs': xs,
+                  }
 
-os.system("mkdir -p beans")
 with open("beans/"+options.year+".json", "w") as fout:
     json.dump(datadef, fout, indent=4)
 
-    
-print("File successfully created.")
\ No newline at end of file
+
+print("File successfully created.")
@@ -8,13 +8,23 @@ from datetime import datetime
 from os.path import basename, join, relpath
 
 from FireHydrant.Samples.eospaths import *
-from FireHydrant.Tools.commonhelpers import eosfindfile, eosls
+from FireHydrant.Tools.commonhelpers import EOSLister, LocalBackend
+from FireHydrant.Tools.filecatalog import FileCatalog, validate_genwgtsum
 
 parser = argparse.ArgumentParser(description="produce data ntuple files")
 parser.add_argument("datatype", type=str, nargs=1, choices=["sigmc", "bkgmc", "data"], help="Type of dataset",)
 parser.add_argument("--skim", action='store_true', help="make ntuple files from skimmed samples. Only valid when datatype is data/bkgmc")
+parser.add_argument("--catalog", type=str, default=None, help="file metadata catalog (SQLite), default $FH_BASE/FireHydrant/Samples/filecatalog.db")
+parser.add_argument("--norestat", action='store_true', help="trust catalogued files without checking their size/mtime on storage")
+parser.add_argument("--format", type=str, default='v2', choices=['v1', 'v2'], help="dataset JSON format; v1: plain file lists, v2: {file: {nentries, treename, size, uuid}}")
+parser.add_argument("--localeos", type=str, default=None, help="list a local directory tree mirroring EOS instead of calling eos, for testing")
+parser.add_argument("--genwgt", type=str, default='auto', choices=['auto', 'branch', 'history'], help="source of genwgtsum; auto uses the history bin if it agrees with the weight branch on a sample of files")
 args = parser.parse_args()
 
+CATALOG = FileCatalog(args.catalog)
+RECORDS = {}  # path -> catalog record (None if it failed to probe), filled by probe_files
+LISTER = EOSLister(LocalBackend(args.localeos) if args.localeos else None)
+
 
 def list_files(dir, pattern=None):
     """
@@ -25,12 +35,15 @@ def list_files(dir, pattern=None):
     :return: a list of file names
     :rtype: list
     """
-    return [f for f in eosfindfile(dir, pattern=pattern) if f and "/failed" not in f]
+    return [f for f in LISTER.find(dir, pattern=pattern) if f and "/failed" not in f]
+
+
+def _sorted_timestamps(timestamps):
+    return sorted(timestamps, key=lambda x: datetime.strptime(x, "%y%m%d_%H%M%S"))
 
 
 def last_submit_timestamp(parentPathOfTimestamps):
-    timestamps = eosls(parentPathOfTimestamps)
-    last_ts = sorted(timestamps, key=lambda x: datetime.strptime(x, "%y%m%d_%H%M%S"))[-1]
+    last_ts = _sorted_timestamps(LISTER.ls(parentPathOfTimestamps))[-1]
     return datetime.strptime(last_ts, "%y%m%d_%H%M%S")
 
 
@@ -44,8 +57,7 @@ def latest_files(parentPathOfTimestamps, pattern=None):
     :rtype: list
     """
     try:
-        timestampdirs = eosls(parentPathOfTimestamps)
-        timestampdirs = sorted(timestampdirs, key=lambda x: datetime.strptime(x, "%y%m%d_%H%M%S"))
+        timestampdirs = _sorted_timestamps(LISTER.ls(parentPathOfTimestamps))
         latest = join(parentPathOfTimestamps, timestampdirs[-1])
 
         return list_files(latest, pattern=pattern)
@@ -55,9 +67,29 @@ def latest_files(parentPathOfTimestamps, pattern=None):
         return []
 
 
+def prefetch_latest(parentPaths, pattern=None):
+    """list all ``parentPaths`` and then their latest submissions concurrently,
+    so that following ``latest_files`` calls are answered from memory.
+    """
+    listed = LISTER.ls_many(parentPaths)
+    latestdirs = []
+    for p, ts in listed.items():
+        try:
+            latestdirs.append(join(p, _sorted_timestamps(ts)[-1]))
+        except (ValueError, IndexError):
+            # empty, or not a timestamp listing; latest_files reports it
+            continue
+    try:
+        LISTER.find_many(latestdirs, pattern=pattern)
+    except Exception as e:
+        # left to the individual latest_files calls to report
+        print(e)
+
+
 def generate_data_files(skim=False):
     print(f"[generate_data_files(skim={skim})]")
     _dirmap = EOSPATHS_DATA_SKIM if skim else EOSPATH_DATA
+    prefetch_latest(_dirmap.values())
     return {k: latest_files(v) for k, v in _dirmap.items()}
 
 
@@ -67,17 +99,14 @@ def generate_background_files(skim=False, forscale=False):
     if forscale:
         _dirmap = EOSPATHS_BKGAOD
 
+    allpaths = [path for group in _dirmap for tag in _dirmap[group] for path in _dirmap[group][tag]]
+    prefetch_latest(allpaths, pattern='*ffNtuple*.root')
+
     ## get max(latest) timestamp
     ## Note: for scale, it will scan AOD skim submissions, we do not put limit on
     ## submission timestamps as it can span over a longer time.
     if forscale is False:
-        timestamps = []
-        for group in _dirmap:
-            for tag in _dirmap[group]:
-                for path in _dirmap[group][tag]:
-                    timestamps.append(sorted(eosls(path), key=lambda x: datetime.strptime(x, "%y%m%d_%H%M%S"))[-1])
-        maxts = sorted(timestamps, key=lambda x: datetime.strptime(x, "%y%m%d_%H%M%S"))[-1]
-        maxts = datetime.strptime(maxts, "%y%m%d_%H%M%S")
+        maxts = max(last_submit_timestamp(path) for path in allpaths)
 
     generated = dict()
     for group in _dirmap:
@@ -92,32 +121,45 @@ def generate_background_files(skim=False, forscale=False):
     return generated
 
 
-def remove_empty_file(filepath):
-    """given a file, if the tree has non-zero number of events, return filepath"""
-    import uproot
-    f_ = uproot.open(filepath)
-    key_ = f_.allkeys(filtername=lambda k: k.endswith(b"ffNtuple"))
-    if key_ and uproot.open(filepath)[key_[0]].numentries != 0:
-        return filepath
-    else:
-        return None
+def _iterfiles(obj):
+    """all file names in (nested dicts of) file lists"""
+    if isinstance(obj, dict):
+        for v in obj.values():
+            yield from _iterfiles(v)
+    elif isinstance(obj, (list, tuple)):
+        for v in obj:
+            if isinstance(v, str):
+                yield v
+            else:
+                yield from _iterfiles(v)
+
+
+def probe_files(*filecollections):
+    """one metadata pass (nentries, genwgtsum, nevents processed) over every
+    file in ``filecollections``, sharing a single process pool across all
+    groups and tags. Files already catalogued are not opened again.
+    """
+    allfiles = list(dict.fromkeys(_iterfiles(list(filecollections))))
+    genwgt = args.genwgt
+    if genwgt == 'auto':
+        stale = CATALOG.stale(allfiles, restat=not args.norestat)
+        genwgt = 'history' if stale and validate_genwgtsum(stale) else 'branch'
+    records = CATALOG.update(allfiles, restat=not args.norestat, genwgt=genwgt)
+    # remembered as None (treated as empty) so that they are not probed again
+    RECORDS.update({f: records.get(f) for f in allfiles})
+
+
+def _records(filelist):
+    missing = [f for f in filelist if f not in RECORDS]
+    if missing:
+        probe_files(missing)
+    return RECORDS
 
 
 def remove_empty_files(filelist):
     """given a list of files, return all files with a tree of non-zero number of events"""
-    import concurrent.futures
-    cleanlist = []
-    with concurrent.futures.ProcessPoolExecutor(max_workers=12) as executor:
-        futures = {executor.submit(remove_empty_file, f): f for f in filelist}
-        for future in concurrent.futures.as_completed(futures):
-            filename = futures[future]
-            try:
-                res = future.result()
-                if res:
-                    cleanlist.append(res)
-            except Exception as e:
-                print(f">> Fail to get numEvents for {filename}\n{str(e)}")
-    return cleanlist
+    records = _records(filelist)
+    return [f for f in filelist if records[f] and records[f]['nentries']]
 
 
 def clean_background_files(filedict):
@@ -133,32 +175,10 @@ def clean_background_files(filedict):
     return cleaneddict
 
 
-def processed_genwgt_sum(ntuplefile):
-    """Given a ntuplefile path, return the sum of gen weights."""
-    import uproot
-    f_ = uproot.open(ntuplefile)
-    key_ = f_.allkeys(filtername=lambda k: k.endswith(b"weight"))
-    if key_:
-        key_ = key_[0]
-        return f_[key_]['weight'].array().sum()
-    else:
-        key_ = f_.allkeys(filtername=lambda k: k.endswith(b"history"))[0]
-        return f_[key_].values[3]  # 0: run, 1: lumi, 2: events, 3: genwgtsum
-
-
 def total_genwgt_sum(filelist):
     """Given a list of ntuple files, return the total sum of gen weights"""
-    import concurrent.futures
-    numsum = 0
-    with concurrent.futures.ProcessPoolExecutor(max_workers=12) as executor:
-        futures = {executor.submit(processed_genwgt_sum, f): f for f in filelist}
-        for future in concurrent.futures.as_completed(futures):
-            filename = futures[future]
-            try:
-                numsum += future.result()
-            except Exception as e:
-                print(f">> Fail to get genwgts for {filename}\n{str(e)}")
-    return numsum
+    records = _records(filelist)
+    return sum(records[f]['genwgtsum'] or 0 for f in filelist if records[f])
 
 
 def generate_background_scale(filedict):
@@ -186,7 +206,10 @@ def generate_background_scale(filedict):
 def generate_signal_files():
     """generate private signal file list json"""
     print("[generate_signal_files]")
-    paramsubdirs = eosls(EOSPATH_SIG)
+    parents = LISTER.ls_many([EOSPATH_SIG, EOSPATH_SIG2['4mu'], EOSPATH_SIG2['2mu2e']])
+    prefetch_latest([join(parent, subdir) for parent, subdirs in parents.items() for subdir in subdirs])
+
+    paramsubdirs = LISTER.ls(EOSPATH_SIG)
     json_4mu, json_2mu2e = {}, {}
     for subdir in paramsubdirs:
         if 'MDp-0p8' in subdir or 'MDp-2p5' in subdir:
@@ -204,41 +227,25 @@ def generate_signal_files():
             json_2mu2e[key] = latest_files(join(EOSPATH_SIG, subdir))
 
     ## samples with new naming
-    for subdir in eosls(EOSPATH_SIG2['4mu']):
+    for subdir in LISTER.ls(EOSPATH_SIG2['4mu']):
         key = subdir.split('_ctau')[0]  # mXX-100_mA-5_lxy-0p3
         json_4mu[key] = latest_files(join(EOSPATH_SIG2['4mu'], subdir))
-    for subdir in eosls(EOSPATH_SIG2['2mu2e']):
+    for subdir in LISTER.ls(EOSPATH_SIG2['2mu2e']):
         key = subdir.split('_ctau')[0]  # mXX-100_mA-5_lxy-0p3
         json_2mu2e[key] = latest_files(join(EOSPATH_SIG2['2mu2e'], subdir))
 
     return json_4mu, json_2mu2e
 
 
-def processed_event_number(ntuplefile):
-    """Given a ntuplefile path, return the number of events it ran over."""
-    import uproot
-    f_ = uproot.open(ntuplefile)
-    key_ = f_.allkeys(filtername=lambda k: k.endswith(b"history"))[0]
-    return f_[key_].values[2]  # 0: run, 1: lumi, 2: events
-
-
 def total_event_number(filelist):
     """Given a list of ntuple files, return the total number of events processed"""
-    import concurrent.futures
-    numevents = 0
-    with concurrent.futures.ProcessPoolExecutor(max_workers=12) as executor:
-        futures = {executor.submit(processed_event_number, f): f for f in filelist}
-        for future in concurrent.futures.as_completed(futures):
-            filename = futures[future]
-            try:
-                numevents += future.result()
-            except Exception as e:
-                print(f">> Fail to get numEvents for {filename}\n{str(e)}")
-    return numevents
+    records = _records(filelist)
+    return sum(records[f]['hist_events'] or 0 for f in filelist if records[f])
 
 
 def generate_signal_scale(fl_4mu, fl_2mu2e):
 
+    from FireHydrant.Analysis.DatasetMapLoader import decompose_paramtag
     from FireHydrant.Samples.signalnumbers import genfiltereff, genxsec, darkphotonbr
     print("[generate_signal_scale]")
 
@@ -246,21 +253,6 @@ def generate_signal_scale(fl_4mu, fl_2mu2e):
     filelists['2mu2e'] = fl_2mu2e
     filelists['4mu'] = fl_4mu
 
-    def decompose_paramtag(paramtag):
-        # paramtag  mXX-1000_mA-0p8_lxy-300 => (1000, 0.8, 300)
-        paramtags = paramtag.split('_')
-        assert (len(paramtags) == 3)
-
-        res = []
-        for t in paramtags:
-            v = t.split('-')[1]
-            if 'p' in v:
-                res.append(float(v.replace('p', '.')))
-            else:
-                res.append(int(v))
-
-        return tuple(res)
-
     scale_2mu2e = {}
     print("\t> 2mu2e")
     for i, paramtag in enumerate(filelists['2mu2e'], start=1):
@@ -301,6 +293,24 @@ def generate_signal_scale(fl_4mu, fl_2mu2e):
     return scale_4mu, scale_2mu2e
 
 
+def with_file_metadata(obj):
+    """v2 dataset format: every file list in (nested dicts of) ``obj`` becomes
+    {file: {nentries, treename, size, uuid}}, so that jobs can be chunked
+    without opening the files. Files that could not be probed get {}.
+    """
+    if isinstance(obj, dict):
+        return {k: with_file_metadata(v) for k, v in obj.items()}
+    records = _records(obj)
+    fields = ('nentries', 'treename', 'size', 'uuid')
+    return {f: {k: records[f][k] for k in fields} if records[f] else {} for f in obj}
+
+
+def stage_out_datasets(outfn, datasets, shortcutdir, shortcutfn):
+    if args.format == 'v2':
+        datasets = with_file_metadata(datasets)
+    stage_out_json(outfn, datasets, shortcutdir, shortcutfn)
+
+
 def stage_out_json(outfn, datasets, shortcutdir, shortcutfn):
     with open(outfn, "w") as outf:
         outf.write(json.dumps(datasets, indent=4))
@@ -327,44 +337,50 @@ if __name__ == "__main__":
             outfn = join(outdir, f"control_data2018_{datetime.now().strftime('%y%m%d')}.json")
             shortcutfn = join(shortcutdir, 'control_data2018.json')
 
-        stage_out_json(outfn, datasets, shortcutdir, shortcutfn)
+        if args.format == 'v2': probe_files(datasets)
+        stage_out_datasets(outfn, datasets, shortcutdir, shortcutfn)
 
     if args.datatype[0] == "bkgmc":
         if args.skim:
             datasets = generate_background_files(skim=True)
+            datasetsForscale = generate_background_files(skim=True, forscale=True)
+            probe_files(datasets, datasetsForscale)
+
+            datasets = clean_background_files(datasets)
             outfn = join(outdir, f"skimmed_backgrounds_{datetime.now().strftime('%y%m%d')}.json")
             shortcutfn = join(shortcutdir, 'skimmed_backgrounds.json')
-            stage_out_json(outfn, datasets, shortcutdir, shortcutfn)
+            stage_out_datasets(outfn, datasets, shortcutdir, shortcutfn)
 
-            datasetsForscale = generate_background_files(skim=True, forscale=True)
             scales = generate_background_scale(datasetsForscale)
             outfn = join(outdir, f"skimmed_backgrounds_scale_{datetime.now().strftime('%y%m%d')}.json")
             shortcutfn = join(shortcutdir, 'skimmed_backgrounds_scale.json')
             stage_out_json(outfn, scales, shortcutdir, shortcutfn)
         else:
-            datasets_ = generate_data_files()
+            datasets_ = generate_background_files()
+            probe_files(datasets_)
 
             scales = generate_background_scale(datasets_)
             outfn = join(outdir, f"backgrounds_scale_{datetime.now().strftime('%y%m%d')}.json")
             shortcutfn = join(shortcutdir, 'backgrounds_scale.json')
-            stage_out_json(outfn, datasets, shortcutdir, shortcutfn)
+            stage_out_json(outfn, scales, shortcutdir, shortcutfn)
 
             datasets = clean_background_files(datasets_)
             outfn = join(outdir, f"backgrounds_{datetime.now().strftime('%y%m%d')}.json")
             shortcutfn = join(shortcutdir, 'backgrounds.json')
-            stage_out_json(outfn, datasets, shortcutdir, shortcutfn)
+            stage_out_datasets(outfn, datasets, shortcutdir, shortcutfn)
 
 
     if args.datatype[0] == "sigmc":
         ds_4mu, ds_2mu2e = generate_signal_files()
+        probe_files(ds_4mu, ds_2mu2e)
 
         outfn = join(outdir, f"signal_4mu_{datetime.now().strftime('%y%m%d')}.json")
         shortcutfn = join(shortcutdir, 'signal_4mu.json')
-        stage_out_json(outfn, ds_4mu, shortcutdir, shortcutfn)
+        stage_out_datasets(outfn, ds_4mu, shortcutdir, shortcutfn)
 
         outfn = join(outdir, f"signal_2mu2e_{datetime.now().strftime('%y%m%d')}.json")
         shortcutfn = join(shortcutdir, 'signal_2mu2e.json')
-        stage_out_json(outfn, ds_2mu2e, shortcutdir, shortcutfn)
+        stage_out_datasets(outfn, ds_2mu2e, shortcutdir, shortcutfn)
 
         ## signal scales
         scale_4mu, scale_2mu2e = generate_signal_scale(ds_4mu, ds_2mu2e)
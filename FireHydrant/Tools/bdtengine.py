@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+"""compiled xgboost BDTs for scoring leptonjets inside processors
+
+A trained model (``model_*/model.bin`` or ``dump.raw.txt`` of xgbtrainer) is
+compiled into flat node arrays -- feature, threshold, yes/no/missing child,
+leaf value -- and evaluated with a vectorized walker that advances every
+(row, tree) pair one level per step. Only numpy arrays are kept, so an engine
+pickles small and goes to the workers with the processor.
+
+Scores are margins, as ``Booster.predict(output_margin=True)``: splits are
+``x < threshold`` in float32, NaN takes the missing branch, leaves are added
+in float32 tree by tree onto the base margin. Compiled from ``model.bin`` the
+thresholds are the exact model values; ``dump.raw.txt`` holds them only to
+the precision of the dump.
+"""
+import json
+import re
+
+import numpy as np
+from FireHydrant.BDT.trainingdata import FEATURES, categorize
+
+_split_pattern = re.compile(r"(\t*)(\d+):\[(?P<var>.+)<(?P<cut>[^\]]+)\] yes=(?P<yes>\d+),no=(?P<no>\d+),missing=(?P<missing>\d+)")
+_leaf_pattern = re.compile(r"(\t*)(\d+):leaf=(?P<leaf>\S+)")
+
+
+def _base_margin(base_score, objective):
+    """margin of the model's ``base_score``, transformed as xgboost does for the objective.
+    binary:logitraw gets the logit as in older xgboost; newer versions (1.7 at least)
+    take its base_score as the margin itself.
+    """
+    if objective.startswith('binary:logi') or objective == 'reg:logistic': # logitraw included
+        return float(np.float32(-np.log(1. / base_score - 1.)))
+    return float(np.float32(base_score))
+
+
+def _booster_json(booster):
+    try:
+        return json.loads(bytes(booster.save_raw('json')))
+    except TypeError: # xgboost without raw JSON, go through a file
+        import os
+        import tempfile
+        fd, fn = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            booster.save_model(fn)
+            with open(fn) as f:
+                return json.load(f)
+        finally:
+            os.remove(fn)
+
+
+class BDTEngine:
+    """flat-array form of a tree ensemble, see module docstring"""
+
+    def __init__(self, feature, threshold, yes, no, missing, value, roots, base_margin=0.5, feature_names=None):
+        self.feature = np.asarray(feature, dtype=np.int32)       # -1 for leaves
+        self.threshold = np.asarray(threshold, dtype=np.float32)
+        self.yes = np.asarray(yes, dtype=np.int32)               # absolute node indices,
+        self.no = np.asarray(no, dtype=np.int32)                 # leaves point to themselves
+        self.missing = np.asarray(missing, dtype=np.int32)
+        self.value = np.asarray(value, dtype=np.float32)
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.base_margin = np.float32(base_margin)
+        self.feature_names = list(feature_names) if feature_names is not None else None
+        self.depth = self._maxdepth()
+
+    def _maxdepth(self):
+        """number of split levels of the deepest tree"""
+        depth = 0
+        frontier = self.roots[self.feature[self.roots] >= 0]
+        while len(frontier):
+            depth += 1
+            children = np.concatenate([self.yes[frontier], self.no[frontier], self.missing[frontier]])
+            frontier = np.unique(children[self.feature[children] >= 0])
+        return depth
+
+    @property
+    def ntrees(self):
+        return len(self.roots)
+
+    @classmethod
+    def from_trees(cls, trees, base_margin=0.5, feature_names=None):
+        """``trees``: list of {nodeid: (feature, threshold, yes, no, missing)
+        for splits, or leaf value} with node ids local to each tree
+        """
+        feature, threshold, yes, no, missing, value, roots = [], [], [], [], [], [], []
+        for tree in trees:
+            offset = len(feature)
+            local = {nid: offset + i for i, nid in enumerate(sorted(tree))}
+            roots.append(local[0])
+            for nid in sorted(tree):
+                node = tree[nid]
+                me = local[nid]
+                if isinstance(node, tuple):
+                    f, cut, y, n, m = node
+                    feature.append(f)
+                    threshold.append(cut)
+                    yes.append(local[y])
+                    no.append(local[n])
+                    missing.append(local[m])
+                    value.append(0.)
+                else:
+                    feature.append(-1)
+                    threshold.append(0.)
+                    yes.append(me)
+                    no.append(me)
+                    missing.append(me)
+                    value.append(node)
+        return cls(feature, threshold, yes, no, missing, value, roots,
+                   base_margin=base_margin, feature_names=feature_names)
+
+    @classmethod
+    def from_dump(cls, dumpfile, feature_names=None, base_score=0.5, objective='binary:logitraw'):
+        """compile a text dump (``Booster.dump_model``). Split variables are
+        resolved against ``feature_names`` (default ``FEATURES``), ``fN`` as
+        the N-th feature. The dump holds no base score, pass the model's
+        (``objective='reg:linear'`` takes it as the margin as is, e.g. for
+        binary:logitraw models of newer xgboost).
+        """
+        feature_names = list(feature_names or FEATURES)
+        index = {n: i for i, n in enumerate(feature_names)}
+
+        def varindex(var):
+            if var in index:
+                return index[var]
+            if re.match(r"f\d+$", var):
+                return int(var[1:])
+            raise KeyError(f"split variable `{var}` not in feature names")
+
+        trees = []
+        with open(dumpfile) as f:
+            for line in f:
+                line = line.rstrip('\n')
+                if not line:
+                    continue
+                if line.startswith('booster['):
+                    trees.append({})
+                    continue
+                m = _split_pattern.match(line)
+                if m:
+                    trees[-1][int(m.group(2))] = (varindex(m.group('var')), float(m.group('cut')),
+                                                  int(m.group('yes')), int(m.group('no')), int(m.group('missing')))
+                    continue
+                m = _leaf_pattern.match(line)
+                if not m:
+                    raise ValueError(f"cannot parse dump line: {line!r}")
+                trees[-1][int(m.group(2))] = float(m.group('leaf'))
+        return cls.from_trees(trees, base_margin=_base_margin(base_score, objective), feature_names=feature_names)
+
+    @classmethod
+    def from_booster(cls, booster, feature_names=None):
+        """compile an ``xgb.Booster`` from its JSON model (exact float32
+        thresholds and leaves). The base margin is what
+        ``predict(output_margin=True)`` adds to the leaves on one row, checked
+        against the base score transformed for the objective.
+        """
+        import xgboost as xgb
+
+        model = _booster_json(booster)
+        learner = model['learner']
+        base_score = float(learner['learner_model_param']['base_score'].strip('[]')) # a vector in newer xgboost
+        objective = learner['objective']['name']
+        num_feature = int(learner['learner_model_param']['num_feature'])
+        feature_names = list(feature_names or booster.feature_names or FEATURES)
+
+        trees = []
+        for t in learner['gradient_booster']['model']['trees']:
+            tree = {}
+            for nid, (l, r, f, cut, dl) in enumerate(zip(t['left_children'], t['right_children'], t['split_indices'],
+                                                        t['split_conditions'], t['default_left'])):
+                if l == -1:
+                    tree[nid] = cut # leaf value
+                else:
+                    tree[nid] = (f, cut, l, r, l if dl else r)
+            trees.append(tree)
+        engine = cls.from_trees(trees, base_margin=0., feature_names=feature_names)
+
+        row = np.zeros((1, num_feature), dtype=np.float32)
+        margin = booster.predict(xgb.DMatrix(row, feature_names=booster.feature_names), output_margin=True)[0]
+        base_margin = np.float32(margin) - engine.predict(row)[0]
+        expected = [_base_margin(base_score, objective)]
+        if objective == 'binary:logitraw':
+            expected.append(float(np.float32(base_score)))
+        assert any(np.isclose(base_margin, e, rtol=1e-5, atol=1e-4) for e in expected), \
+            f"base margin {base_margin} from predict, {expected} from base_score={base_score} ({objective})"
+        engine.base_margin = np.float32(base_margin)
+        return engine
+
+    @classmethod
+    def load_model(cls, modelfile, feature_names=None):
+        """compile ``model.bin`` (needs xgboost) or ``dump.raw.txt``"""
+        if modelfile.endswith('.txt'):
+            return cls.from_dump(modelfile, feature_names=feature_names)
+        import xgboost as xgb
+        booster = xgb.Booster()
+        booster.load_model(modelfile)
+        return cls.from_booster(booster, feature_names=feature_names)
+
+    def predict(self, X, blocksize=8192):
+        """margin scores of float32 feature matrix ``X`` (nrows, nfeatures)"""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        out = np.empty(len(X), dtype=np.float32)
+        for start in range(0, len(X), blocksize):
+            out[start:start+blocksize] = self._predict_block(X[start:start+blocksize])
+        return out
+
+    def _predict_block(self, X):
+        nrows = len(X)
+        rows = np.arange(nrows)[:, None]
+        idx = np.broadcast_to(self.roots, (nrows, self.ntrees)).copy()
+        for _ in range(self.depth):
+            f = self.feature[idx]
+            x = X[rows, np.maximum(f, 0)]
+            nxt = np.where(np.isnan(x), self.missing[idx], np.where(x < self.threshold[idx], self.yes[idx], self.no[idx]))
+            idx = np.where(f >= 0, nxt, idx)
+
+        leaves = np.empty((nrows, self.ntrees + 1), dtype=np.float32)
+        leaves[:, 0] = self.base_margin
+        leaves[:, 1:] = self.value[idx]
+        return np.cumsum(leaves, axis=1, dtype=np.float32)[:, -1] # tree by tree, as xgboost does
+
+    def save(self, filename):
+        np.savez_compressed(filename, feature=self.feature, threshold=self.threshold, yes=self.yes, no=self.no,
+                            missing=self.missing, value=self.value, roots=self.roots,
+                            base_margin=self.base_margin, feature_names=np.array(self.feature_names or []))
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as f:
+            names = list(f['feature_names']) or None
+            return cls(f['feature'], f['threshold'], f['yes'], f['no'], f['missing'], f['value'], f['roots'],
+                       base_margin=f['base_margin'], feature_names=names)
+
+
+class LeptonJetBDT:
+    """the notrack/tracked model pair, each leptonjet scored by the model of its category"""
+
+    def __init__(self, notrack, tracked):
+        self.engines = dict(notrack=notrack, tracked=tracked)
+
+    @classmethod
+    def from_outputs(cls, notrackdir, trackeddir, model='optimized'):
+        """pair of xgbtrainer output directories, compiled from ``model_<model>/model.bin``"""
+        from os.path import join
+        return cls(BDTEngine.load_model(join(notrackdir, f'model_{model}', 'model.bin')),
+                   BDTEngine.load_model(join(trackeddir, f'model_{model}', 'model.bin')))
+
+    def predict(self, X):
+        """margin scores of ``X`` (nrows, len(FEATURES)), ordered as ``FEATURES``"""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        category = categorize(X[:, FEATURES.index('nef')])
+        out = np.empty(len(X), dtype=np.float32)
+        for cat, engine in self.engines.items():
+            mask = category == cat
+            if mask.any():
+                out[mask] = engine.predict(X[mask])
+        return out
@@ -1,19 +1,34 @@
 #!/usr/bin/env python
 """system utilities
 """
-import subprocess
+import asyncio
+import fnmatch
+import os
 import shlex
+import subprocess
+
+
+def _eosls_cmd(eospath, xdirector="root://cmseos.fnal.gov/"):
+    if eospath.startswith("root://"):
+        return "eos ls {}".format(eospath)
+    return "eos {0} ls {1}".format(xdirector, eospath)
+
+
+def _eosfind_cmd(eospath, xdirector="root://cmseos.fnal.gov/", pattern=None):
+    if eospath.startswith("root://"):
+        if pattern:
+            return 'eos find -name "{0}" -f --xurl {1}'.format(pattern, eospath)
+        return "eos find -f --xurl {0}".format(eospath)
+    if pattern:
+        return 'eos {0} find -name "{1}" -f --xurl {2}'.format(xdirector, pattern, eospath)
+    return "eos {0} find -f --xurl {1}".format(xdirector, eospath)
 
 
 def eosls(eospath, xdirector="root://cmseos.fnal.gov/"):
     """list file on EOS with eos command line tool
     """
 
-    if eospath.startswith("root://"):
-        cmd = "eos ls {}".format(eospath)
-    else:
-        cmd = "eos {0} ls {1}".format(xdirector, eospath)
-
+    cmd = _eosls_cmd(eospath, xdirector)
     try:
         return subprocess.check_output(shlex.split(cmd)).decode().split()
     except:
@@ -25,15 +40,137 @@ def eosfindfile(eospath, xdirector="root://cmseos.fnal.gov/", pattern=None):
     """find all files under ``eospath`` with eos command line tool
     """
 
-    if eospath.startswith("root://"):
-        if pattern:
-            cmd = 'eos find -name "{0}" -f --xurl {1}'.format(pattern, eospath)
-        else:
-            cmd = "eos find -f --xurl {0}".format(eospath)
-    else:
-        if pattern:
-            cmd = 'eos {0} find -name "{1}" -f --xurl {2}'.format(xdirector, pattern, eospath)
-        else:
-            cmd = "eos {0} find -f --xurl {1}".format(xdirector, eospath)
-
+    cmd = _eosfind_cmd(eospath, xdirector, pattern)
     return subprocess.check_output(shlex.split(cmd)).decode().split()
+
+
+class EOSBackend:
+    """``eos ls``/``eos find`` as asyncio subprocesses"""
+
+    def __init__(self, xdirector="root://cmseos.fnal.gov/"):
+        self.xdirector = xdirector
+
+    async def _run(self, cmd):
+        proc = await asyncio.create_subprocess_exec(
+            *shlex.split(cmd), stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        out, err = await proc.communicate()
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, cmd, output=out, stderr=err)
+        return out.decode().split()
+
+    async def ls(self, eospath):
+        return await self._run(_eosls_cmd(eospath, self.xdirector))
+
+    async def find(self, eospath, pattern=None):
+        return await self._run(_eosfind_cmd(eospath, self.xdirector, pattern))
+
+
+class LocalBackend:
+    """stand-in for ``eos`` on a local directory tree, e.g. for tests.
+    EOS paths are looked up under ``root``; ``find`` returns local paths.
+    """
+
+    def __init__(self, root='/'):
+        self.root = root
+
+    def _local(self, eospath):
+        if eospath.startswith("root://"):
+            eospath = '/' + eospath[len("root://"):].partition('/')[2].lstrip('/')
+        return os.path.join(self.root, eospath.lstrip('/'))
+
+    def _find(self, eospath, pattern=None):
+        top = self._local(eospath)
+        if not os.path.isdir(top):
+            raise FileNotFoundError(f"no such directory: {top}")
+        res = []
+        for dirpath, _, filenames in os.walk(top):
+            res.extend(os.path.join(dirpath, f) for f in sorted(filenames)
+                       if pattern is None or fnmatch.fnmatch(f, pattern))
+        return res
+
+    async def ls(self, eospath):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, lambda: sorted(os.listdir(self._local(eospath))))
+
+    async def find(self, eospath, pattern=None):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self._find, eospath, pattern)
+
+
+class EOSLister:
+    """concurrent, memoized ``ls``/``find`` on top of a backend
+    (``EOSBackend`` by default, ``LocalBackend`` for a local stand-in).
+
+    At most ``maxconcurrent`` listing calls are in flight at once; each
+    distinct call is made once per lister, later calls are served from
+    memory. ``ls`` failures print an error and give [] like ``eosls``,
+    ``find`` failures raise like ``eosfindfile`` (unless ``strict=False``).
+    Failed calls are not memoized, a later call tries again.
+    """
+
+    def __init__(self, backend=None, maxconcurrent=16):
+        self.backend = backend or EOSBackend()
+        self.maxconcurrent = maxconcurrent
+        self._cache = {}
+
+    async def _call(self, sem, pending, key):
+        if key in self._cache:
+            return self._cache[key]
+        if key not in pending:
+            pending[key] = asyncio.ensure_future(self._fetch(sem, key))
+        res = await pending[key]
+        self._cache[key] = res
+        return res
+
+    async def _fetch(self, sem, key):
+        op, path, pattern = key
+        async with sem:
+            if op == 'ls':
+                return await self.backend.ls(path)
+            return await self.backend.find(path, pattern=pattern)
+
+    async def _gather(self, keys):
+        sem, pending = asyncio.Semaphore(self.maxconcurrent), {}
+        return await asyncio.gather(*[self._call(sem, pending, k) for k in keys], return_exceptions=True)
+
+    def _run(self, keys, strict=True):
+        keys = list(keys)
+        todo = list(dict.fromkeys(k for k in keys if k not in self._cache))
+        errors = {}
+        if todo:
+            results = asyncio.run(self._gather(todo))
+            errors = {k: r for k, r in zip(todo, results) if isinstance(r, Exception)}
+        res = []
+        for k in keys:
+            if k in errors:
+                if k[0] == 'ls':
+                    print(f"ERROR when listing {k[1]}: {errors[k]}")
+                elif strict:
+                    raise errors[k]
+                else:
+                    print(f"ERROR when searching {k[1]}: {errors[k]}")
+                res.append([])
+            else:
+                res.append(list(self._cache[k]))
+        return res
+
+    def ls_many(self, paths):
+        """{path: entries} of all ``paths``, listed concurrently"""
+        paths = list(paths)
+        return dict(zip(paths, self._run(('ls', p, None) for p in paths)))
+
+    def find_many(self, paths, pattern=None, strict=True):
+        """{path: files} of all ``paths``, searched concurrently. With
+        ``strict=False`` paths that fail give [] instead of raising.
+        """
+        paths = list(paths)
+        return dict(zip(paths, self._run((('find', p, pattern) for p in paths), strict=strict)))
+
+    def ls(self, path):
+        return self.ls_many([path])[path]
+
+    def find(self, path, pattern=None):
+        return self.find_many([path], pattern=pattern)[path]
+
+    def clear(self):
+        self._cache.clear()
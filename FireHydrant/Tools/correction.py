@@ -2,6 +2,8 @@
 """correction functions need to be applied for the analysis
 """
 import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from os.path import join
 
 import numpy as np
@@ -21,6 +23,61 @@ def get_pu_weights_function():
     return sf_pu_cen, sf_pu_up, sf_pu_down
 
 
+class stacked_lookup:
+    """1D lookup of several variations sharing the same binning.
+
+    Calling it on N values returns an (N, nvariations) array, so all the
+    variations come out of one gather. Out-of-range values are clipped to the
+    first/last bin as ``dense_lookup`` does, NaN goes to the last bin. Uniform
+    binning (e.g. the unit-wide bins of the pileup histograms) is turned into a
+    direct index computation (shift, scale, floor, clip); otherwise it falls
+    back to ``np.searchsorted``. Both give the same bins.
+    """
+
+    def __init__(self, values, edges):
+        self._table = np.ascontiguousarray(np.stack([np.asarray(v, dtype=np.float64) for v in values], axis=-1))
+        self._edges = np.asarray(edges, dtype=np.float64)
+        self._nbins = self._table.shape[0]
+        if self._edges.shape[0] != self._nbins+1:
+            raise ValueError(f"{self._nbins} bins do not match {self._edges.shape[0]} edges")
+
+        widths = np.diff(self._edges)
+        self._uniform = bool(np.allclose(widths, widths[0], rtol=1e-9, atol=0))
+        self._lo = self._edges[0]
+        self._invwidth = 1. / widths[0]
+
+    @property
+    def uniform(self):
+        return self._uniform
+
+    def index(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        if self._uniform:
+            idx = np.floor((x - self._lo) * self._invwidth)
+            idx = np.nan_to_num(idx, nan=self._nbins-1)  # NaN sorts last in searchsorted
+            idx = np.clip(idx, 0, self._nbins-1).astype(np.intp)
+            # rounding can put a value right at an edge one bin off
+            idx -= (x < self._edges[idx]) & (idx > 0)
+            idx += (x >= self._edges[idx+1]) & (idx < self._nbins-1)
+            return idx
+        idx = np.searchsorted(self._edges, x, side='right') - 1
+        return np.clip(idx, 0, self._nbins-1)
+
+    def __call__(self, x):
+        return self._table[self.index(x)]
+
+
+def get_pu_weights_lookup():
+    """central, up, down pileup weights as one ``stacked_lookup``"""
+
+    pufile_ = uproot.open(join(os.getenv('FH_BASE'), 'FireHydrant/Tools/store/puWeights_10x_56ifb.root'))
+    hists = [pufile_[k] for k in ('puWeights', 'puWeightsUp', 'puWeightsDown')]
+    if any(not np.array_equal(h.edges, hists[0].edges) for h in hists[1:]):
+        raise ValueError("pileup weight variations do not share the same binning")
+
+    return stacked_lookup([h.values for h in hists], hists[0].edges)
+
+
 def get_ttbar_weight(pt):
     return np.exp(0.0615 - 0.0005 * np.clip(pt, 0, 800))
 
@@ -57,4 +114,58 @@ def get_nlo_weight_function(type):
 
     correction = dense_lookup(sf_qcd * sf_ewk, kfactor[nlo[type]].edges)
 
-    return correction
\ No newline at end of file
+    return correction
+
+
+
+class CorrectionRegistry:
+    """correction lookups referenced by name.
+
+    Each lookup is built on first access and memoized for the lifetime of the
+    process, so processors only need to carry the name around; nothing from
+    ``Tools/store`` gets pickled along with them.
+    """
+
+    def __init__(self):
+        self._builders = {}
+        self._cache = {}
+
+    def register(self, name, builder):
+        """register ``builder`` (a callable without arguments) under ``name``"""
+        self._builders[name] = builder
+        self._cache.pop(name, None)
+
+    def names(self):
+        return list(self._builders)
+
+    def __contains__(self, name):
+        return name in self._builders
+
+    def __getitem__(self, name):
+        if name not in self._cache:
+            if name not in self._builders:
+                raise KeyError(f"correction `{name}` not registered, available: {self.names()}")
+            self._cache[name] = self._builders[name]()
+        return self._cache[name]
+
+    def preload(self, names=None):
+        """build lookups ahead of their first use, default all registered"""
+        for name in (self.names() if names is None else names):
+            self[name]
+
+
+CORRECTIONS = CorrectionRegistry()
+CORRECTIONS.register('pileup', get_pu_weights_lookup)
+CORRECTIONS.register('nlo_w', partial(get_nlo_weight_function, 'w'))
+CORRECTIONS.register('nlo_z', partial(get_nlo_weight_function, 'z'))
+CORRECTIONS.register('nlo_a', partial(get_nlo_weight_function, 'a'))
+
+
+def preload_corrections(names=('pileup',)):
+    """worker initializer, load corrections once per process at startup"""
+    CORRECTIONS.preload(names)
+
+
+## drop-in for `pool` of coffea's futures_executor, e.g.
+## executor_args=dict(workers=12, flatten=False, pool=PreloadedPool)
+PreloadedPool = partial(ProcessPoolExecutor, initializer=preload_corrections)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+"""(run, lumi, event) -> (file, entry) index of ffNtuple files (SQLite)
+
+The index is built by a dedicated pass reading only the ``run``, ``lumi`` and
+``event`` branches, one process per file. Events are kept in a table sorted
+by (run, lumi, event), so locating an event is a single B-tree lookup and
+picking it reads just the baskets holding that entry.
+
+    python eventindex.py build data
+    python eventindex.py pick 320002:123:456789 321834:88:1234 --branches pfjet_p4 run
+"""
+import concurrent.futures
+import os
+import sqlite3
+from collections import defaultdict
+from os.path import join
+
+
+def default_index_path():
+    """$FH_BASE/FireHydrant/Samples/eventindex.db, beans/eventindex.db if FH_BASE is not set"""
+    if os.getenv('FH_BASE'):
+        return join(os.getenv('FH_BASE'), 'FireHydrant/Samples/eventindex.db')
+    os.makedirs('beans', exist_ok=True)
+    path = join('beans', 'eventindex.db')
+    print('FH_BASE not set, event index kept in', path)
+    return path
+
+
+def read_event_ids(path, treename='ffNtuplizer/ffNtuple'):
+    """(path, run, lumi, event) arrays of one file, entry i at position i"""
+    import uproot
+
+    tree = uproot.open(path)[treename]
+    arrays = tree.arrays(['run', 'lumi', 'event'], namedecode='utf-8')
+    return path, arrays['run'], arrays['lumi'], arrays['event']
+
+
+def parse_event_id(s):
+    """'run:lumi:event' -> (run, lumi, event)"""
+    run, lumi, event = (int(x) for x in s.split(':'))
+    return run, lumi, event
+
+
+class EventIndex:
+    """SQLite backed event index. ``files`` holds the indexed files,
+    ``events`` (run, lumi, event, dataset) -> (file id, entry).
+    """
+
+    def __init__(self, dbpath=None):
+        self.dbpath = dbpath or default_index_path()
+        self._conn = sqlite3.connect(self.dbpath)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY, path TEXT UNIQUE, dataset TEXT, treename TEXT, nentries INTEGER);
+            CREATE TABLE IF NOT EXISTS events (
+                run INTEGER, lumi INTEGER, event INTEGER, dataset TEXT, file INTEGER, entry INTEGER,
+                PRIMARY KEY (run, lumi, event, dataset)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS events_file ON events (file);
+        """)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def indexed(self, paths):
+        paths = list(paths)
+        res = set()
+        for i in range(0, len(paths), 500):
+            batch = paths[i:i+500]
+            cur = self._conn.execute("SELECT path FROM files WHERE path IN ({})".format(','.join('?'*len(batch))), batch)
+            res.update(row[0] for row in cur)
+        return res
+
+    def add(self, dataset, path, run, lumi, event, treename='ffNtuplizer/ffNtuple'):
+        """index the events of one file, entry i being (run[i], lumi[i], event[i]).
+        A file indexed before keeps its id, its previous events are dropped.
+        """
+        row = self._conn.execute("SELECT id FROM files WHERE path=?", (path,)).fetchone()
+        if row is None:
+            cur = self._conn.execute("INSERT INTO files (path, dataset, treename, nentries) VALUES (?, ?, ?, ?)",
+                                     (path, dataset, treename, len(run)))
+            fileid = cur.lastrowid
+        else:
+            fileid = row[0]
+            self._conn.execute("DELETE FROM events WHERE file=?", (fileid,))
+            self._conn.execute("UPDATE files SET dataset=?, treename=?, nentries=? WHERE id=?",
+                               (dataset, treename, len(run), fileid))
+        self._conn.executemany("INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?)",
+                               ((int(r), int(l), int(e), dataset, fileid, i) for i, (r, l, e) in enumerate(zip(run, lumi, event))))
+
+    def build(self, fileset, treename='ffNtuplizer/ffNtuple', workers=12):
+        """index every file of ``fileset`` ({dataset: [files]}) not indexed yet"""
+        datasetof = {f: dataset for dataset, files in fileset.items() for f in files}
+        todo = [f for f in datasetof if f not in self.indexed(datasetof)]
+        if not todo:
+            return
+        print(f"[EventIndex] indexing {len(todo)}/{len(datasetof)} files")
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(read_event_ids, f, treename): f for f in todo}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    path, run, lumi, event = future.result()
+                except Exception as e:
+                    print(f">> Fail to index {futures[future]}\n{str(e)}")
+                    continue
+                self.add(datasetof[path], path, run, lumi, event, treename=treename)
+        self._conn.commit()
+
+    def locate(self, events, dataset=None):
+        """[(run, lumi, event, dataset, path, treename, entry)] of ``events``,
+        a list of (run, lumi, event) or 'run:lumi:event'. Unknown events are skipped.
+        """
+        query = ("SELECT e.run, e.lumi, e.event, e.dataset, f.path, f.treename, e.entry "
+                 "FROM events e JOIN files f ON e.file = f.id WHERE e.run=? AND e.lumi=? AND e.event=?")
+        if dataset is not None:
+            query += " AND e.dataset=?"
+        res = []
+        for ev in events:
+            key = parse_event_id(ev) if isinstance(ev, str) else tuple(ev)
+            args = key + (dataset,) if dataset is not None else key
+            found = self._conn.execute(query, args).fetchall()
+            if not found:
+                print(f">> event {':'.join(map(str, key))} not in index")
+            res.extend(found)
+        return res
+
+    def pick(self, events, branches=None, dataset=None):
+        """full ffNtuple records ({branch: value}) of ``events``, each file
+        opened once and each event read on its own entry range
+        """
+        import uproot
+
+        byfile = defaultdict(list)
+        for loc in self.locate(events, dataset=dataset):
+            byfile[(loc[4], loc[5])].append(loc)
+
+        records = []
+        for (path, treename), locs in byfile.items():
+            tree = uproot.open(path)[treename]
+            for run, lumi, event, ds, _, _, entry in locs:
+                arrays = tree.arrays(branches, entrystart=entry, entrystop=entry+1, namedecode='utf-8')
+                rec = {k: v[0] for k, v in arrays.items()}
+                rec.update(_event=f'{run}:{lumi}:{event}', _dataset=ds, _path=path, _entry=entry)
+                records.append(rec)
+        return records
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="(run, lumi, event) -> (file, entry) index")
+    parser.add_argument("--db", type=str, default=None, help="index file, default $FH_BASE/FireHydrant/Samples/eventindex.db (beans/eventindex.db without FH_BASE)")
+    subparsers = parser.add_subparsers(dest='command')
+
+    pbuild = subparsers.add_parser('build', help="index a DatasetMapLoader selection")
+    pbuild.add_argument("which", type=str, help="bkg/data/both, or sig:all/sig:4mu/sig:2mu2e/sig:simple")
+    pbuild.add_argument("--treename", type=str, default='ffNtuplizer/ffNtuple')
+    pbuild.add_argument("--workers", type=int, default=12)
+
+    ppick = subparsers.add_parser('pick', help="print records of events")
+    ppick.add_argument("events", type=str, nargs='+', help="run:lumi:event")
+    ppick.add_argument("--dataset", type=str, default=None)
+    ppick.add_argument("--branches", type=str, nargs='*', default=None, help="default all branches")
+
+    args = parser.parse_args()
+    index = EventIndex(args.db)
+
+    if args.command == 'build':
+        from FireHydrant.Tools.sharding import load_fileset
+        fileset, _ = load_fileset(args.which)
+        index.build(fileset, treename=args.treename, workers=args.workers)
+    elif args.command == 'pick':
+        for rec in index.pick(args.events, branches=args.branches, dataset=args.dataset):
+            print(rec['_event'].center(80, '_'))
+            for k, v in rec.items():
+                print(f"{k}: {v}")
+    else:
+        parser.print_help()
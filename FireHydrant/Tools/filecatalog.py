@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+"""persistent metadata catalog of ffNtuple files (SQLite)
+
+For every file it keeps the ffNtuple tree name and entries, the ROOT file
+uuid, the gen weight
+sum and the mode it was probed with, the ``history`` counts
+(run/lumi/events/genwgtsum), size and mtime.
+Each file is opened once by ``probe_file``; later lookups only go back to
+storage for files that are new, whose size/mtime changed, or that were
+probed with another genwgt mode.
+"""
+import concurrent.futures
+import os
+import random
+import sqlite3
+import time
+from os.path import join
+
+import numpy as np
+
+COLUMNS = [
+    ('path', 'TEXT PRIMARY KEY'),
+    ('size', 'INTEGER'),
+    ('mtime', 'REAL'),
+    ('treename', 'TEXT'),
+    ('nentries', 'INTEGER'),
+    ('uuid', 'TEXT'),
+    ('genwgtsum', 'REAL'),
+    ('hist_runs', 'REAL'),
+    ('hist_lumis', 'REAL'),
+    ('hist_events', 'REAL'),
+    ('hist_genwgtsum', 'REAL'),
+    ('branch_genwgtsum', 'REAL'),
+    ('genwgtsource', 'TEXT'),
+    ('genwgtmode', 'TEXT'),
+    ('probed', 'REAL'),
+]
+
+
+def default_catalog_path():
+    if not os.getenv('FH_BASE'):
+        raise RuntimeError("FH_BASE is not set, source setup.sh or pass the catalog path explicitly")
+    return join(os.getenv('FH_BASE'), 'FireHydrant/Samples/filecatalog.db')
+
+
+def stat_file(path):
+    """(size, mtime) of a local file or an xrootd url"""
+    if path.startswith('root://'):
+        from XRootD import client
+        server, _, fpath = path[len('root://'):].partition('/')
+        status, info = client.FileSystem(f'root://{server}').stat(fpath)
+        if not status.ok:
+            raise IOError(f"cannot stat {path}: {status.message}")
+        return info.size, float(info.modtime)
+    st = os.stat(path)
+    return st.st_size, st.st_mtime
+
+
+def stream_branch_sum(branch):
+    """sum of a flat numeric branch, holding one basket in memory at a time"""
+    total = 0.
+    for i in range(branch.numbaskets):
+        total += float(np.sum(branch.basket(i), dtype=np.float64))
+    return total
+
+
+def probe_file(path, genwgt='branch'):
+    """open ``path`` once and return its catalog record as a dict.
+
+    ``genwgt`` chooses where ``genwgtsum`` comes from:
+    'branch'  -- stream-sum the ``weight`` tree if present, else history;
+    'history' -- the history genwgtsum bin if present, else the branch;
+    'both'    -- compute both (``branch_genwgtsum``/``hist_genwgtsum``),
+                 keep the branch sum, for validation.
+    """
+    import uproot
+
+    size, mtime = stat_file(path)
+    f_ = uproot.open(path)
+    uuid = getattr(f_._context, 'uuid', None)
+    rec = dict(path=path, size=size, mtime=mtime, treename=None, nentries=0, uuid=None, genwgtsum=None,
+               hist_runs=None, hist_lumis=None, hist_events=None, hist_genwgtsum=None,
+               branch_genwgtsum=None, genwgtsource=None, genwgtmode=genwgt, probed=time.time())
+    if uuid is not None:
+        rec['uuid'] = uuid.hex() if isinstance(uuid, bytes) else str(uuid)
+
+    treekey = f_.allkeys(filtername=lambda k: k.endswith(b"ffNtuple"))
+    if treekey:
+        rec['treename'] = treekey[0].decode().split(';')[0]
+        rec['nentries'] = int(f_[treekey[0]].numentries)
+
+    histkey = f_.allkeys(filtername=lambda k: k.endswith(b"history"))
+    if histkey:
+        values = f_[histkey[0]].values  # 0: run, 1: lumi, 2: events, 3: genwgtsum
+        rec['hist_runs'], rec['hist_lumis'], rec['hist_events'] = (float(v) for v in values[:3])
+        if len(values) > 3:
+            rec['hist_genwgtsum'] = float(values[3])
+
+    wgtkey = f_.allkeys(filtername=lambda k: k.endswith(b"weight"))
+    usehistory = genwgt == 'history' and rec['hist_genwgtsum'] is not None
+    if wgtkey and not usehistory:
+        rec['branch_genwgtsum'] = stream_branch_sum(f_[wgtkey[0]]['weight'])
+        rec['genwgtsum'], rec['genwgtsource'] = rec['branch_genwgtsum'], 'branch'
+    else:
+        rec['genwgtsum'], rec['genwgtsource'] = rec['hist_genwgtsum'], 'history'
+
+    return rec
+
+
+def validate_genwgtsum(paths, nsample=10, rtol=1e-6, workers=12, seed=None):
+    """compare the streamed ``weight`` branch sum with the history genwgtsum
+    bin on a random sample of ``paths``, print the discrepancies.
+
+    :return: True if every sampled file has both and they agree within ``rtol``
+    :rtype: bool
+    """
+    paths = list(paths)
+    sample = random.Random(seed).sample(paths, min(nsample, len(paths)))
+    if not sample:
+        return False
+
+    consistent = True
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(probe_file, p, 'both'): p for p in sample}
+        for future in concurrent.futures.as_completed(futures):
+            p = futures[future]
+            try:
+                rec = future.result()
+            except Exception as e:
+                print(f">> Fail to probe {p}\n{str(e)}")
+                consistent = False
+                continue
+            branchsum, histsum = rec['branch_genwgtsum'], rec['hist_genwgtsum']
+            if branchsum is None or histsum is None:
+                print(f">> genwgtsum of {p}: branch={branchsum}, history={histsum}, cannot compare")
+                consistent = False
+            elif not np.isclose(branchsum, histsum, rtol=rtol, atol=0):
+                print(f">> genwgtsum mismatch in {p}: branch={branchsum}, history={histsum}")
+                consistent = False
+    print(f"[validate_genwgtsum] {len(sample)} files sampled, {'consistent' if consistent else 'INCONSISTENT'}")
+    return consistent
+
+
+class FileCatalog:
+    """SQLite backed ``path -> record`` store, see ``probe_file`` for the fields"""
+
+    def __init__(self, dbpath=None):
+        self.dbpath = dbpath or default_catalog_path()
+        self._conn = sqlite3.connect(self.dbpath)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("CREATE TABLE IF NOT EXISTS files ({})".format(
+            ', '.join(f'{name} {decl}' for name, decl in COLUMNS)))
+        existing = {row['name'] for row in self._conn.execute("PRAGMA table_info(files)")}
+        for name, decl in COLUMNS:
+            if name not in existing:
+                self._conn.execute(f"ALTER TABLE files ADD COLUMN {name} {decl}")
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def put(self, rec):
+        names = [name for name, _ in COLUMNS]
+        self._conn.execute("INSERT OR REPLACE INTO files ({}) VALUES ({})".format(
+            ', '.join(names), ', '.join('?'*len(names))), [rec.get(n) for n in names])
+
+    def lookup(self, paths):
+        """{path: record dict} for the catalogued ones among ``paths``"""
+        paths = list(paths)
+        res = {}
+        for i in range(0, len(paths), 500):
+            batch = paths[i:i+500]
+            cur = self._conn.execute("SELECT * FROM files WHERE path IN ({})".format(','.join('?'*len(batch))), batch)
+            res.update({row['path']: dict(row) for row in cur})
+        return res
+
+    def get(self, path):
+        return self.lookup([path]).get(path)
+
+    def stale(self, paths, restat=True, workers=12, genwgt=None):
+        """paths not in the catalog, catalogued before the file uuid was
+        recorded or (if ``genwgt`` is given) with another genwgt mode, plus
+        (if ``restat``) the ones whose size/mtime on storage differ from the
+        catalogued ones
+        """
+        known = self.lookup(paths)
+        stale = [p for p in paths if p not in known or known[p]['uuid'] is None
+                 or (genwgt is not None and known[p]['genwgtmode'] != genwgt)]
+        if restat and known:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(stat_file, p): p for p in known}
+                for future in concurrent.futures.as_completed(futures):
+                    p = futures[future]
+                    try:
+                        size, mtime = future.result()
+                    except Exception as e:
+                        print(f">> Fail to stat {p}\n{str(e)}")
+                        continue
+                    if p not in stale and (size != known[p]['size'] or mtime != known[p]['mtime']):
+                        stale.append(p)
+        return stale
+
+    def update(self, paths, restat=True, workers=12, executor=None, genwgt=None):
+        """probe new (and with ``restat`` changed) files among ``paths``.
+
+        Probes run on ``executor`` if given, otherwise on a process pool of
+        ``workers``. ``genwgt`` is passed to ``probe_file`` ('branch' if None)
+        and files catalogued with another mode are probed again; with None
+        any mode is accepted. Returns {path: record} of all ``paths`` that
+        could be probed.
+        """
+        paths = list(dict.fromkeys(paths))
+        todo = self.stale(paths, restat=restat, workers=workers, genwgt=genwgt)
+        if todo:
+            print(f"[FileCatalog] probing {len(todo)}/{len(paths)} files")
+            own = executor is None
+            if own:
+                executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+            try:
+                futures = {executor.submit(probe_file, p, genwgt or 'branch'): p for p in todo}
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        self.put(future.result())
+                    except Exception as e:
+                        print(f">> Fail to probe {futures[future]}\n{str(e)}")
+            finally:
+                if own: executor.shutdown()
+            self._conn.commit()
+        return self.lookup(paths)
+
+    def total(self, paths, field, update=True):
+        """sum of ``field`` over ``paths``, files without a value count 0"""
+        recs = self.update(paths) if update else self.lookup(paths)
+        return sum(r[field] or 0 for r in recs.values())
+
+    def nonempty(self, paths, update=True):
+        """``paths`` whose ffNtuple tree has entries, order kept"""
+        recs = self.update(paths) if update else self.lookup(paths)
+        return [p for p in paths if p in recs and recs[p]['nentries']]
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+"""Binary on-disk format for processor outputs, loaded lazily per key.
+
+Layout of an output directory::
+
+    index.json              {key: kind} for every item of the output
+    <key>/meta.json         axes, sparse identifiers, label, dtype
+    <key>/sumw.npy          (nrows, *dense shape incl. flows), one row per
+    <key>/sumw2.npy         sparse identifier combination; or
+    <key>/arrays.npz        the same rows as separate compressed members
+
+``column_accumulator`` values go to ``<key>/value.npy``; anything else is
+saved with ``coffea.util.save`` as ``<key>/object.coffea``.
+
+``load_output`` returns a read-only mapping. Histograms come back as
+``LazyHist`` proxies which only read the rows a selection touches --
+memory-mapped for the uncompressed format, decompressing just those members
+for the compressed one.
+"""
+import json
+import os
+import re
+from os.path import isdir, isfile, join
+
+import numpy as np
+from coffea import hist
+from coffea.processor import column_accumulator
+from coffea.util import load, save
+
+FORMAT_VERSION = 1
+
+
+def _axis_meta(axis):
+    if isinstance(axis, hist.Cat):
+        return dict(type='Cat', name=axis.name, label=axis.label, sorting=axis._sorting)
+    if isinstance(axis, hist.Bin):
+        if axis._uniform:
+            return dict(type='Bin', name=axis.name, label=axis.label, n=int(axis._bins), lo=float(axis._lo), hi=float(axis._hi))
+        return dict(type='Bin', name=axis.name, label=axis.label, edges=axis.edges().tolist())
+    raise TypeError(f"cannot serialize axis of type {type(axis)}")
+
+
+def _axis_from_meta(meta):
+    if meta['type'] == 'Cat':
+        return hist.Cat(meta['name'], meta['label'], sorting=meta['sorting'])
+    if 'edges' in meta:
+        return hist.Bin(meta['name'], meta['label'], np.array(meta['edges']))
+    return hist.Bin(meta['name'], meta['label'], meta['n'], meta['lo'], meta['hi'])
+
+
+def save_hist(h, dirname, compress=False):
+    """write one ``coffea.hist.Hist`` into ``dirname``"""
+    if not isdir(dirname): os.makedirs(dirname)
+
+    rowkeys = list(h._sumw.keys())
+    meta = dict(
+        version=FORMAT_VERSION,
+        kind='hist',
+        label=h.label,
+        dtype=np.dtype(h._dtype).str,
+        axes=[_axis_meta(ax) for ax in h.axes()],
+        rows=[[k.name for k in key] for key in rowkeys],
+        labels=[{i.name: i.label for i in ax.identifiers()} for ax in h.sparse_axes()],
+        dense_shape=list(h._dense_shape),
+        sumw2=h._sumw2 is not None,
+        compress=compress,
+    )
+
+    sumw = [h._sumw[key] for key in rowkeys]
+    sumw2 = [h._sumw2[key] for key in rowkeys] if h._sumw2 is not None else None
+    if compress:
+        arrays = {f'sumw_{i}': a for i, a in enumerate(sumw)}
+        if sumw2 is not None:
+            arrays.update({f'sumw2_{i}': a for i, a in enumerate(sumw2)})
+        np.savez_compressed(join(dirname, 'arrays.npz'), **arrays)
+    else:
+        empty = np.zeros((0, *h._dense_shape), dtype=h._dtype)
+        np.save(join(dirname, 'sumw.npy'), np.stack(sumw) if sumw else empty)
+        if sumw2 is not None:
+            np.save(join(dirname, 'sumw2.npy'), np.stack(sumw2) if sumw2 else empty)
+
+    with open(join(dirname, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=1)
+
+
+def save_output(output, dirname, compress=False):
+    """persist processor ``output`` (dict-like) under ``dirname``, one
+    subdirectory per key. See module docstring for the layout.
+    """
+    if not isdir(dirname): os.makedirs(dirname)
+
+    index = {}
+    for k in output:
+        obj = output[k]
+        keydir = join(dirname, k)
+        if not isdir(keydir): os.makedirs(keydir)
+        if isinstance(obj, LazyHist):
+            obj = obj.load()
+        if isinstance(obj, hist.Hist):
+            save_hist(obj, keydir, compress=compress)
+            index[k] = 'hist'
+        elif isinstance(obj, column_accumulator):
+            np.save(join(keydir, 'value.npy'), obj.value)
+            index[k] = 'column'
+        else:
+            save(obj, join(keydir, 'object.coffea'))
+            index[k] = 'object'
+
+    with open(join(dirname, 'index.json'), 'w') as f:
+        json.dump(dict(version=FORMAT_VERSION, keys=index), f, indent=1)
+
+
+def _match(name, pattern):
+    if isinstance(pattern, re.Pattern):
+        return pattern.match(name) is not None
+    if isinstance(pattern, (list, tuple, set)):
+        return name in pattern
+    return name == pattern
+
+
+class LazyHist:
+    """proxy of a persisted ``coffea.hist.Hist``.
+
+    Axes and sparse identifiers are known from ``meta.json`` alone. ``load``
+    reads only the rows matching a selection on sparse axes; indexing with
+    strings/regexes/lists on sparse axes and ``integrate`` over a sparse axis
+    do the same implicitly. Anything else is forwarded to the fully loaded
+    histogram.
+    """
+
+    def __init__(self, dirname, transform=None):
+        self._dirname = dirname
+        self._transform = transform
+        with open(join(dirname, 'meta.json')) as f:
+            self._meta = json.load(f)
+        self._axesmeta = self._meta['axes']
+        self._sparse = [a['name'] for a in self._axesmeta if a['type'] == 'Cat']
+        self._full = None
+
+    @property
+    def label(self):
+        return self._meta['label']
+
+    def axes(self):
+        return tuple(_axis_from_meta(a) for a in self._axesmeta)
+
+    def identifiers(self, axis):
+        """names of the identifiers of sparse ``axis``"""
+        i = self._sparse.index(axis)
+        return sorted({row[i] for row in self._meta['rows']})
+
+    def _rows(self, selection):
+        rows = []
+        for irow, row in enumerate(self._meta['rows']):
+            if all(_match(row[self._sparse.index(ax)], pat) for ax, pat in selection.items()):
+                rows.append(irow)
+        return rows
+
+    def _read(self, what, rows):
+        if self._meta['compress']:
+            with np.load(join(self._dirname, 'arrays.npz')) as arrays:
+                return [arrays[f'{what}_{i}'] for i in rows]
+        arr = np.load(join(self._dirname, f'{what}.npy'), mmap_mode='r')
+        return [np.array(arr[i]) for i in rows]
+
+    def load(self, **selection):
+        """``coffea.hist.Hist`` with only the rows whose sparse identifiers
+        match ``selection`` (axis name -> name, list of names or compiled regex)
+        """
+        if not selection and self._full is not None:
+            return self._full
+        unknown = set(selection) - set(self._sparse)
+        if unknown:
+            raise ValueError(f"{sorted(unknown)} are not sparse axes of this histogram: {self._sparse}")
+
+        axes = self.axes()
+        sparseaxes = [ax for ax in axes if isinstance(ax, hist.Cat)]
+        h = hist.Hist(self.label, *axes, dtype=np.dtype(self._meta['dtype']))
+        rows = self._rows(selection)
+        sumw = self._read('sumw', rows)
+        sumw2 = self._read('sumw2', rows) if self._meta['sumw2'] else None
+        if sumw2 is not None:
+            h._sumw2 = {}
+        for n, irow in enumerate(rows):
+            names = self._meta['rows'][irow]
+            key = tuple(ax.index(hist.StringBin(name, self._meta['labels'][i][name]))
+                        for i, (ax, name) in enumerate(zip(sparseaxes, names)))
+            h._sumw[key] = sumw[n]
+            if sumw2 is not None:
+                h._sumw2[key] = sumw2[n]
+
+        if self._transform:
+            h = self._transform(h)
+        if not selection:
+            self._full = h
+        return h
+
+    def __getitem__(self, keys):
+        if not isinstance(keys, tuple):
+            keys = (keys,)
+        selection = {}
+        for axmeta, key in zip(self._axesmeta, keys):
+            if axmeta['type'] == 'Cat' and isinstance(key, (str, re.Pattern, list)):
+                selection[axmeta['name']] = key
+        return self.load(**selection)[keys]
+
+    def integrate(self, axis_name, int_range=slice(None), overflow='none'):
+        if axis_name in self._sparse and isinstance(int_range, (str, re.Pattern, list)):
+            return self.load(**{axis_name: int_range}).integrate(axis_name, int_range, overflow=overflow)
+        return self.load().integrate(axis_name, int_range, overflow=overflow)
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        return getattr(self.load(), attr)
+
+
+class LazyOutput:
+    """read-only dict-like view of a directory written by ``save_output``.
+    Items are read on first access; histograms as ``LazyHist`` proxies,
+    column values memory-mapped. ``transform(key, hist)`` is applied to each
+    histogram after loading, if given.
+    """
+
+    def __init__(self, dirname, transform=None):
+        self._dirname = dirname
+        self._transform = transform
+        with open(join(dirname, 'index.json')) as f:
+            self._index = json.load(f)['keys']
+        self._cache = {}
+
+    def keys(self):
+        return list(self._index)
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def items(self):
+        return ((k, self[k]) for k in self._index)
+
+    def __getitem__(self, key):
+        if key not in self._cache:
+            if key not in self._index:
+                raise KeyError(f"`{key}` not found in {self._dirname}")
+            keydir = join(self._dirname, key)
+            kind = self._index[key]
+            if kind == 'hist':
+                transform = (lambda h: self._transform(key, h)) if self._transform else None
+                self._cache[key] = LazyHist(keydir, transform=transform)
+            elif kind == 'column':
+                self._cache[key] = column_accumulator(np.load(join(keydir, 'value.npy'), mmap_mode='r'))
+            else:
+                self._cache[key] = load(join(keydir, 'object.coffea'))
+        return self._cache[key]
+
+
+def load_output(dirname, transform=None):
+    """lazy counterpart of ``save_output``"""
+    if not isfile(join(dirname, 'index.json')):
+        raise FileNotFoundError(f"{dirname} is not an output directory written by save_output")
+    return LazyOutput(dirname, transform=transform)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""Fine-grained master histograms, rebinned on demand.
+
+Processors fill master histograms once -- uniform axes with ``factor`` times
+finer bins (``fine_bin``) or log-linear HDR-style axes (``hdr_bin``) -- and
+persist them with ``save_masters`` (``histstore`` format). Plotting scripts
+then load them lazily per key and ``rebin`` / ``rebin_like`` them into
+whatever coarser binning the plot needs, without touching the ntuples again.
+"""
+import numpy as np
+from coffea import hist
+from FireHydrant.Tools.histstore import LazyHist, load_output, save_output
+
+
+def fine_bin(name, label, n, lo, hi, factor=1):
+    """``hist.Bin(name, label, n, lo, hi)`` with ``factor`` times finer bins.
+    factor=1 is the plain binning.
+    """
+    return hist.Bin(name, label, n*factor, lo, hi)
+
+
+def hdr_edges(lo, hi, subbins=16):
+    """log-linear bin edges between ``lo`` (>0) and ``hi``.
+
+    Each power-of-two octave is split into ``subbins`` uniform bins, so the
+    relative bin width stays at most 1/subbins over the whole range
+    (HdrHistogram-like).
+    """
+    if lo <= 0 or hi <= lo:
+        raise ValueError(f"hdr_edges needs 0 < lo < hi, got lo={lo}, hi={hi}")
+    octaves = np.arange(np.floor(np.log2(lo)), np.ceil(np.log2(hi))+1)
+    edges = np.concatenate([np.linspace(2**o, 2**(o+1), subbins+1)[:-1] for o in octaves[:-1]] + [[2**octaves[-1]]])
+    edges = edges[(edges > lo) & (edges < hi)]
+    return np.concatenate([[lo], edges, [hi]])
+
+
+def hdr_bin(name, label, lo, hi, subbins=16):
+    """``hist.Bin`` with log-linear edges, see ``hdr_edges``"""
+    return hist.Bin(name, label, hdr_edges(lo, hi, subbins))
+
+
+def _target_edges(axis, binning):
+    """new edges from int (merge factor), (n, lo, hi), array of edges or hist.Bin"""
+    if isinstance(binning, hist.Bin):
+        return binning.edges()
+    if isinstance(binning, (int, np.integer)):
+        return axis.edges()[::binning]
+    if isinstance(binning, tuple) and len(binning) == 3:
+        n, lo, hi = binning
+        return np.linspace(lo, hi, n+1)
+    return np.asarray(binning, dtype=float)
+
+
+def rebin(h, axis, binning, snap=False):
+    """rebin dense ``axis`` of master histogram ``h`` into ``binning``.
+
+    ``binning`` can be a merge factor, an ``(n, lo, hi)`` tuple, an array of
+    edges or a ``hist.Bin``. A narrower range re-ranges the axis: master bins
+    outside of it end up in the under/overflow. Every new edge has to be a
+    master edge, otherwise master bins would be split; with ``snap=True`` new
+    edges are moved to the closest master edge instead of raising.
+    """
+    oldaxis = h.axis(axis)
+    masteredges = oldaxis.edges()
+    edges = _target_edges(oldaxis, binning)
+
+    idx = np.clip(np.searchsorted(masteredges, edges), 1, len(masteredges)-1)
+    closest = np.where(np.abs(masteredges[idx-1]-edges) <= np.abs(masteredges[idx]-edges), idx-1, idx)
+    aligned = np.isclose(masteredges[closest], edges, rtol=1e-9, atol=1e-12)
+    if not aligned.all():
+        if not snap:
+            raise ValueError(f"edges {edges[~aligned]} of new `{oldaxis.name}` binning are not master edges, "
+                             "use a compatible binning or snap=True")
+        edges = np.unique(masteredges[closest])
+    else:
+        edges = masteredges[closest]
+
+    label = binning.label if isinstance(binning, hist.Bin) else oldaxis.label
+    return h.rebin(oldaxis.name, hist.Bin(oldaxis.name, label, edges))
+
+
+def rebin_like(h, reference, snap=False):
+    """rebin every dense axis of ``h`` present in ``reference`` (a Hist or
+    a dict-like of them, e.g. a processor's coarse ``accumulator``) to the
+    reference binning. Dict-likes are handled key by key.
+    """
+    if isinstance(h, LazyHist):
+        h = h.load()
+    if not isinstance(h, hist.Hist):
+        return {k: rebin_like(h[k], reference[k], snap=snap) if k in reference else h[k] for k in h}
+    out = h
+    for refaxis in reference.dense_axes():
+        if refaxis.name not in [a.name for a in out.dense_axes()]:
+            continue
+        if np.array_equal(out.axis(refaxis.name).edges(), refaxis.edges()):
+            continue
+        out = rebin(out, refaxis.name, refaxis, snap=snap)
+    return out
+
+
+def save_masters(output, dirname, compress=False):
+    """persist processor ``output`` with ``histstore.save_output``"""
+    save_output(output, dirname, compress=compress)
+
+
+def load_masters(dirname, like=None, snap=False):
+    """lazy counterpart of ``save_masters``. With ``like`` (e.g. a processor's
+    coarse ``accumulator``) each histogram is rebinned with ``rebin_like``
+    when it is first accessed.
+    """
+    if like is None:
+        return load_output(dirname)
+    return load_output(dirname, transform=lambda k, h: rebin_like(h, like[k], snap=snap) if k in like else h)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+"""split filesets into shards of about equal number of events, run each shard
+as an independent job writing a partial output, and merge the partial outputs.
+
+    python sharding.py split bkg 16 -o shards/bkg
+    python sharding.py run shards/bkg/shard_003.json FireHydrant.Analysis.AN_leptonjetBkg:LJBkgProcessor \\
+        --kwargs '{"data_type": "bkg"}' -o partial/bkg_003.coffea
+    python sharding.py merge partial/bkg_*.coffea -o bkg.coffea
+
+``which`` is bkg/data/both for ``DatasetMapLoader``, sig:all/sig:4mu/... for
+``SigDatasetMapLoader``. Entry counts come from v2 dataset files, otherwise
+from the file metadata catalog. Processors taking ``grouping``/``scales``/
+``mapping`` get those of the shard's selection.
+"""
+import glob
+import heapq
+import importlib
+import inspect
+import json
+import os
+import sys
+from os.path import join
+
+
+def load_fileset(which):
+    """(fileset, v2 metadata) of a ``DatasetMapLoader``/``SigDatasetMapLoader`` selection"""
+    from FireHydrant.Analysis.DatasetMapLoader import DatasetMapLoader, SigDatasetMapLoader
+
+    if which.startswith('sig:'):
+        loader, which = SigDatasetMapLoader(), which[len('sig:'):]
+    else:
+        loader = DatasetMapLoader()
+    return loader.get_datasets(which), loader.get_metadata(which)
+
+
+def scaling_kwargs(which):
+    """processor keyword arguments scaling/grouping the datasets of ``which``:
+    ``grouping`` for bkg, ``mapping`` for data, ``scales`` for signal
+    """
+    from FireHydrant.Analysis.DatasetMapLoader import DatasetMapLoader, SigDatasetMapLoader
+    from FireHydrant.Analysis.Utils import DatasetGrouping
+
+    if which.startswith('sig:'):
+        return dict(scales=SigDatasetMapLoader().get_scales(which[len('sig:'):]))
+    dml = DatasetMapLoader()
+    kwargs = {}
+    if which in ('bkg', 'both'):
+        kwargs['grouping'] = DatasetGrouping(dml.get_mapping('bkg'), dml.get_bkgscales())
+    if which in ('data', 'both'):
+        kwargs['mapping'] = dml.get_mapping('data')
+    return kwargs
+
+
+def file_entries(fileset, metadata=None, catalog=None):
+    """{file: nentries} of all files in ``fileset``, from ``metadata`` where
+    known, the rest from the metadata catalog (probing files not in it yet)
+    """
+    from FireHydrant.Tools.filecatalog import FileCatalog
+
+    metadata = metadata or {}
+    entries = {}
+    for dataset, files in fileset.items():
+        for f in files:
+            m = metadata.get(dataset, {}).get(f)
+            if m and m.get('nentries') is not None:
+                entries[f] = m['nentries']
+    missing = [f for files in fileset.values() for f in files if f not in entries]
+    if missing:
+        records = (catalog or FileCatalog()).update(missing)
+        entries.update({f: records[f]['nentries'] for f in missing if f in records})
+    return entries
+
+
+def shard_fileset(fileset, nshards, entries):
+    """split ``fileset`` file-wise into ``nshards`` filesets of about equal
+    total entries (largest files first, each to the lightest shard).
+    Files without entry count are spread round-robin and count 0. There are
+    never more shards than files, so no shard is empty.
+
+    :return: list of (nentries, fileset)
+    """
+    items = sorted(((entries.get(f, 0), dataset, f) for dataset, files in fileset.items() for f in files),
+                   key=lambda t: -t[0])
+    nshards = min(nshards, len(items))
+    heap = [(0, i) for i in range(nshards)]
+    shards = [{} for _ in range(nshards)]
+    loads = [0] * nshards
+    for i, (n, dataset, f) in enumerate(items):
+        if n:
+            load, ishard = heapq.heappop(heap)
+            loads[ishard] = load + n
+            heapq.heappush(heap, (loads[ishard], ishard))
+        else:
+            ishard = i % nshards
+        shards[ishard].setdefault(dataset, []).append(f)
+    return list(zip(loads, shards))
+
+
+def write_shards(which, nshards, outdir, catalog=None):
+    fileset, metadata = load_fileset(which)
+    entries = file_entries(fileset, metadata, catalog=catalog)
+    if not os.path.isdir(outdir): os.makedirs(outdir)
+
+    shards = shard_fileset(fileset, nshards, entries)
+    if len(shards) < nshards:
+        print(f"only {len(shards)} files, writing {len(shards)} shards instead of {nshards}")
+    nshards = len(shards)
+
+    shardfns = []
+    for i, (nevents, shard) in enumerate(shards):
+        shardmeta = {d: {f: metadata[d][f] for f in files if f in metadata.get(d, {})} for d, files in shard.items()}
+        fn = join(outdir, f'shard_{i:03d}.json')
+        with open(fn, 'w') as f:
+            json.dump(dict(which=which, shard=i, nshards=nshards, nevents=nevents,
+                           fileset=shard, metadata=shardmeta), f, indent=1)
+        print(f"[{i}/{nshards}] {fn}: {nevents} events, {sum(len(v) for v in shard.values())} files")
+        shardfns.append(fn)
+    return shardfns
+
+
+def import_processor(spec):
+    """``module.path:ClassName`` -> class. Analysis modules parse the command
+    line at import, so they are imported with an empty one.
+    """
+    modname, _, clsname = spec.partition(':')
+    argv, sys.argv = sys.argv, sys.argv[:1]
+    try:
+        module = importlib.import_module(modname)
+    finally:
+        sys.argv = argv
+    return getattr(module, clsname)
+
+
+def run_shard(shardfn, processorspec, outfn, kwargs=None, treename='ffNtuplizer/ffNtuple',
+              workers=12, chunksize=500000, flatten=False):
+    """process one shard and save the (post-processed) output to ``outfn``"""
+    import coffea.processor as processor
+    from coffea.util import save
+    from FireHydrant.Analysis.DatasetMapLoader import metadata_cache
+    from FireHydrant.Tools.correction import PreloadedPool
+
+    with open(shardfn) as f:
+        shard = json.load(f)
+
+    processorcls = import_processor(processorspec)
+    # scales of the shard's selection, for the processors taking them
+    accepted = inspect.signature(processorcls.__init__).parameters
+    kwargs = dict({k: v for k, v in scaling_kwargs(shard['which']).items() if k in accepted}, **(kwargs or {}))
+    output = processor.run_uproot_job(shard['fileset'],
+                                      treename=treename,
+                                      processor_instance=processorcls(**kwargs),
+                                      executor=processor.futures_executor,
+                                      executor_args=dict(workers=workers, flatten=flatten, pool=PreloadedPool),
+                                      chunksize=chunksize,
+                                      metadata_cache=metadata_cache(shard['metadata']),
+                                      )
+    outdir = os.path.dirname(outfn)
+    if outdir and not os.path.isdir(outdir): os.makedirs(outdir)
+    save(output, outfn)
+    return output
+
+
+def merge_outputs(partialfns, outfn=None):
+    """sum the partial outputs saved by ``run_shard``. Outputs are
+    post-processed per shard, which is fine for the scaling/grouping our
+    processors do in ``postprocess``.
+    """
+    from coffea.util import load, save
+
+    merged = None
+    for fn in partialfns:
+        part = load(fn)
+        if merged is None:
+            merged = part
+        else:
+            merged += part
+    if outfn:
+        save(merged, outfn)
+    return merged
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="event-count balanced sharding of filesets")
+    subparsers = parser.add_subparsers(dest='command')
+
+    psplit = subparsers.add_parser('split', help="write shard files")
+    psplit.add_argument("which", type=str, help="bkg/data/both, or sig:all/sig:4mu/sig:2mu2e/sig:simple")
+    psplit.add_argument("nshards", type=int)
+    psplit.add_argument("-o", "--outdir", type=str, default="shards")
+    psplit.add_argument("--catalog", type=str, default=None, help="file metadata catalog (SQLite)")
+
+    prun = subparsers.add_parser('run', help="process one shard")
+    prun.add_argument("shard", type=str, help="shard file written by split")
+    prun.add_argument("processor", type=str, help="module.path:ProcessorClass")
+    prun.add_argument("-o", "--output", type=str, required=True, help="partial output (.coffea)")
+    prun.add_argument("--kwargs", type=json.loads, default={}, help="processor keyword arguments, as JSON")
+    prun.add_argument("--treename", type=str, default='ffNtuplizer/ffNtuple')
+    prun.add_argument("--workers", type=int, default=12)
+    prun.add_argument("--chunksize", type=int, default=500000)
+    prun.add_argument("--flatten", action='store_true')
+
+    pmerge = subparsers.add_parser('merge', help="merge partial outputs")
+    pmerge.add_argument("partials", type=str, nargs='+', help="partial outputs, glob patterns allowed")
+    pmerge.add_argument("-o", "--output", type=str, required=True)
+
+    args = parser.parse_args()
+
+    if args.command == 'split':
+        from FireHydrant.Tools.filecatalog import FileCatalog
+        write_shards(args.which, args.nshards, args.outdir, catalog=FileCatalog(args.catalog))
+    elif args.command == 'run':
+        run_shard(args.shard, args.processor, args.output, kwargs=args.kwargs, treename=args.treename,
+                  workers=args.workers, chunksize=args.chunksize, flatten=args.flatten)
+    elif args.command == 'merge':
+        partials = sorted(fn for pattern in args.partials for fn in glob.glob(pattern))
+        merge_outputs(partials, args.output)
+        print(f"merged {len(partials)} partial outputs into {args.output}")
+    else:
+        parser.print_help()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""BDTEngine against a node-by-node reference walker"""
+import numpy as np
+import pytest
+from FireHydrant.BDT.trainingdata import FEATURES
+from FireHydrant.Tools.bdtengine import BDTEngine, LeptonJetBDT
+
+
+def random_tree(rng, nfeatures, maxdepth):
+    """{nodeid: (feature, threshold, yes, no, missing) or leaf value}, unbalanced"""
+    tree, todo, nextid = {}, [(0, 0)], 1
+    while todo:
+        nid, depth = todo.pop()
+        if depth == maxdepth or (depth and rng.rand() < 0.3):
+            tree[nid] = float(np.float32(rng.normal(0, 0.1)))
+            continue
+        yes, no = nextid, nextid + 1
+        nextid += 2
+        tree[nid] = (rng.randint(nfeatures), float(np.float32(rng.normal())), yes, no, [yes, no][rng.randint(2)])
+        todo += [(yes, depth+1), (no, depth+1)]
+    return tree
+
+
+def random_trees(seed, ntrees=30, nfeatures=6, maxdepth=5):
+    rng = np.random.RandomState(seed)
+    return [random_tree(rng, nfeatures, maxdepth) for _ in range(ntrees)]
+
+
+def random_rows(seed, nrows=3000, nfeatures=6):
+    rng = np.random.RandomState(seed)
+    X = rng.normal(size=(nrows, nfeatures)).astype(np.float32)
+    X[rng.rand(nrows, nfeatures) < 0.1] = np.nan
+    return X
+
+
+def reference(trees, X, base_margin):
+    out = np.empty(len(X), dtype=np.float32)
+    for r, row in enumerate(X):
+        total = np.float32(base_margin)
+        for tree in trees:
+            node = tree[0]
+            while isinstance(node, tuple):
+                f, cut, yes, no, missing = node
+                x = row[f]
+                node = tree[missing if np.isnan(x) else (yes if x < np.float32(cut) else no)]
+            total = np.float32(total + np.float32(node))
+        out[r] = total
+    return out
+
+
+def dump(trees, feature_names):
+    """``Booster.dump_model`` text of ``trees``"""
+    lines = []
+    for i, tree in enumerate(trees):
+        lines.append(f'booster[{i}]:')
+        todo = [(0, 0)]
+        while todo:
+            nid, depth = todo.pop()
+            node = tree[nid]
+            if isinstance(node, tuple):
+                f, cut, yes, no, missing = node
+                lines.append('\t'*depth + f'{nid}:[{feature_names[f]}<{cut!r}] yes={yes},no={no},missing={missing}')
+                todo += [(no, depth+1), (yes, depth+1)]
+            else:
+                lines.append('\t'*depth + f'{nid}:leaf={node!r}')
+    return '\n'.join(lines) + '\n'
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_predict_matches_reference(seed):
+    trees = random_trees(seed)
+    X = random_rows(seed)
+    engine = BDTEngine.from_trees(trees, base_margin=0.25)
+    assert engine.ntrees == len(trees) and engine.depth <= 5
+    np.testing.assert_array_equal(engine.predict(X, blocksize=1000), reference(trees, X, 0.25))
+
+
+def test_single_leaf_trees():
+    trees = [{0: 0.5}, {0: -0.25}]
+    engine = BDTEngine.from_trees(trees, base_margin=0.)
+    assert engine.depth == 0
+    np.testing.assert_array_equal(engine.predict(np.zeros((3, 2))), [0.25] * 3)
+
+
+def test_from_dump(tmp_path):
+    trees = random_trees(5, nfeatures=len(FEATURES))
+    dumpfile = tmp_path / 'dump.raw.txt'
+    dumpfile.write_text(dump(trees, FEATURES))
+    engine = BDTEngine.from_dump(str(dumpfile), base_score=0.5, objective='binary:logistic')
+    assert engine.base_margin == 0.
+
+    X = random_rows(5, nfeatures=len(FEATURES))
+    np.testing.assert_array_equal(engine.predict(X), reference(trees, X, 0.))
+
+    dumpfile.write_text(dump(trees, [f'f{i}' for i in range(len(FEATURES))]))
+    np.testing.assert_array_equal(BDTEngine.from_dump(str(dumpfile)).predict(X), engine.predict(X))
+
+
+def test_save_load(tmp_path):
+    engine = BDTEngine.from_trees(random_trees(1), base_margin=-0.5, feature_names=list('abcdef'))
+    engine.save(str(tmp_path / 'engine.npz'))
+    loaded = BDTEngine.load(str(tmp_path / 'engine.npz'))
+    X = random_rows(1)
+    np.testing.assert_array_equal(loaded.predict(X), engine.predict(X))
+    assert loaded.feature_names == list('abcdef')
+
+
+def test_leptonjet_categories():
+    nf = len(FEATURES)
+    notrack = BDTEngine.from_trees(random_trees(2, nfeatures=nf), base_margin=1.)
+    tracked = BDTEngine.from_trees(random_trees(3, nfeatures=nf), base_margin=-1.)
+    X = random_rows(4, nfeatures=nf)
+    X[:, FEATURES.index('nef')] = np.where(np.arange(len(X)) % 3 == 0, 1., 0.5)
+    isnotrack = X[:, FEATURES.index('nef')] >= 0.999
+
+    scores = LeptonJetBDT(notrack, tracked).predict(X)
+    np.testing.assert_array_equal(scores[isnotrack], notrack.predict(X[isnotrack]))
+    np.testing.assert_array_equal(scores[~isnotrack], tracked.predict(X[~isnotrack]))
+
+
+def test_from_booster():
+    xgb = pytest.importorskip('xgboost')
+    rng = np.random.RandomState(0)
+    X = rng.normal(size=(2000, 4)).astype(np.float32)
+    y = (X[:, 0] + X[:, 1]**2 + rng.normal(size=2000) > 1).astype(int)
+    X[rng.rand(*X.shape) < 0.05] = np.nan
+    for objective in ('binary:logistic', 'binary:logitraw'):
+        booster = xgb.train(dict(objective=objective, max_depth=4, eta=0.3, base_score=0.3),
+                            xgb.DMatrix(X, label=y), num_boost_round=20)
+        engine = BDTEngine.from_booster(booster, feature_names=list('abcd'))
+        np.testing.assert_allclose(engine.predict(X), booster.predict(xgb.DMatrix(X), output_margin=True),
+                                   rtol=1e-6, atol=1e-6)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""EOSLister on a local directory tree"""
+import os
+
+import pytest
+from FireHydrant.Tools.commonhelpers import EOSLister, LocalBackend
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """<tmp>/store/group/user/sample/{200101_000000,200201_000000}/0000/*.root"""
+    for ts, names in [('200101_000000', ['ffNtuple_1.root', 'ffNtuple_2.root']),
+                      ('200201_000000', ['ffNtuple_1.root', 'log.txt'])]:
+        d = tmp_path / 'store/group/user/sample' / ts / '0000'
+        d.mkdir(parents=True)
+        for n in names:
+            (d / n).write_text('')
+    return tmp_path
+
+
+def test_ls_find(tree):
+    lister = EOSLister(LocalBackend(str(tree)))
+    assert lister.ls('/store/group/user/sample') == ['200101_000000', '200201_000000']
+    found = lister.find('/store/group/user/sample/200201_000000')
+    assert sorted(os.path.basename(f) for f in found) == ['ffNtuple_1.root', 'log.txt']
+    found = lister.find('/store/group/user/sample', pattern='*ffNtuple*.root')
+    assert len(found) == 3 and all(f.startswith(str(tree)) for f in found)
+
+
+def test_xrootd_url(tree):
+    lister = EOSLister(LocalBackend(str(tree)))
+    assert lister.ls('root://cmseos.fnal.gov//store/group/user/sample') == ['200101_000000', '200201_000000']
+
+
+def test_many(tree):
+    lister = EOSLister(LocalBackend(str(tree)), maxconcurrent=2)
+    parents = [f'/store/group/user/sample/{ts}' for ts in ('200101_000000', '200201_000000')]
+    listed = lister.ls_many(parents + parents)
+    assert listed == {p: ['0000'] for p in parents}
+    found = lister.find_many(parents, pattern='*.root')
+    assert [len(found[p]) for p in parents] == [2, 1]
+
+
+def test_memoized(tree):
+    lister = EOSLister(LocalBackend(str(tree)))
+    path = '/store/group/user/sample'
+    before = lister.ls(path)
+    (tree / 'store/group/user/sample/200301_000000').mkdir()
+    assert lister.ls(path) == before
+    lister.clear()
+    assert lister.ls(path) == before + ['200301_000000']
+
+
+def test_failures(tree, capsys):
+    lister = EOSLister(LocalBackend(str(tree)))
+    path = '/store/group/user/other'
+    assert lister.ls(path) == []
+    assert 'ERROR when listing' in capsys.readouterr().out
+
+    # not memoized, the next call sees the directory
+    (tree / 'store/group/user/other/200101_000000').mkdir(parents=True)
+    assert lister.ls(path) == ['200101_000000']
+
+    with pytest.raises(FileNotFoundError):
+        lister.find('/store/group/user/missing')
+    assert lister.find_many(['/store/group/user/missing'], strict=False) == {'/store/group/user/missing': []}
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+"""stacked_lookup against a plain searchsorted lookup"""
+import numpy as np
+import pytest
+
+pytest.importorskip('coffea')
+from FireHydrant.Tools.correction import stacked_lookup
+
+
+def searchsorted_index(edges, x):
+    return np.clip(np.searchsorted(edges, x, side='right') - 1, 0, len(edges) - 2)
+
+
+@pytest.mark.parametrize('edges', [
+    np.arange(0., 101.),                      # pileup-like unit bins
+    np.linspace(-1., 2., 31),
+    np.round(np.arange(0., 3.01, 0.1), 10),   # edges not exact in binary
+])
+def test_uniform_matches_searchsorted(edges):
+    rng = np.random.RandomState(42)
+    nbins = len(edges) - 1
+    lookup = stacked_lookup([rng.rand(nbins), rng.rand(nbins), rng.rand(nbins)], edges)
+    assert lookup.uniform
+
+    x = np.concatenate([rng.uniform(edges[0]-5, edges[-1]+5, 10000), edges,
+                        np.nextafter(edges, -np.inf), [np.nan, np.inf, -np.inf]])
+    ref = searchsorted_index(edges, x)
+    np.testing.assert_array_equal(lookup.index(x), ref)
+    np.testing.assert_array_equal(lookup(x), lookup._table[ref])
+
+
+def test_nan_goes_to_last_bin():
+    lookup = stacked_lookup([np.arange(10.)], np.arange(11.))
+    assert lookup.index(np.nan) == 9
+    np.testing.assert_array_equal(lookup(np.array([np.nan, -np.inf, np.inf])), [[9.], [0.], [9.]])
+
+
+def test_nonuniform_falls_back():
+    edges = np.array([0., 1., 2., 4., 8.])
+    lookup = stacked_lookup([np.arange(4.), -np.arange(4.)], edges)
+    assert not lookup.uniform
+
+    x = np.array([-1., 0., 0.5, 1., 3.9, 4., 7.9, 8., 100., np.nan])
+    np.testing.assert_array_equal(lookup.index(x), searchsorted_index(edges, x))
+    assert lookup(x).shape == (len(x), 2)
+
+
+def test_edges_must_match_bins():
+    with pytest.raises(ValueError):
+        stacked_lookup([np.arange(4.)], np.arange(4.))
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""save_output/load_output round trip of a processor output"""
+import re
+
+import numpy as np
+import pytest
+
+pytest.importorskip('coffea')
+from coffea import hist, processor
+from FireHydrant.Tools.histstore import LazyHist, load_output, save_output
+
+
+def make_output():
+    rng = np.random.RandomState(3)
+    h = hist.Hist('Counts', hist.Cat('dataset', 'dataset'), hist.Cat('channel', 'channel'),
+                  hist.Bin('x', 'x [GeV]', 20, 0, 100), hist.Bin('y', 'y', [0, 1, 2, 5]))
+    for ds in ('TTJets', 'DYJetsToLL', 'QCD_Pt-470to600'):
+        for ch in ('2mu2e', '4mu'):
+            n = rng.randint(100, 1000)
+            h.fill(dataset=ds, channel=ch, x=rng.uniform(-10, 110, n), y=rng.uniform(-1, 6, n), weight=rng.rand(n))
+    return processor.dict_accumulator({
+        'h': h,
+        'column': processor.column_accumulator(rng.rand(50)),
+        'counts': processor.defaultdict_accumulator(int, {'TTJets': 3}),
+    })
+
+
+def assert_same_hist(h, ref):
+    assert [a.name for a in h.axes()] == [a.name for a in ref.axes()]
+    for a, b in zip(h.dense_axes(), ref.dense_axes()):
+        np.testing.assert_array_equal(a.edges(), b.edges())
+        assert a.label == b.label
+    values, refvalues = h.values(sumw2=True, overflow='all'), ref.values(sumw2=True, overflow='all')
+    assert values.keys() == refvalues.keys()
+    for k in refvalues:
+        np.testing.assert_array_equal(values[k][0], refvalues[k][0])
+        np.testing.assert_array_equal(values[k][1], refvalues[k][1])
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_round_trip(tmp_path, compress):
+    output = make_output()
+    save_output(output, str(tmp_path / 'out'), compress=compress)
+    loaded = load_output(str(tmp_path / 'out'))
+
+    assert sorted(loaded.keys()) == sorted(output)
+    assert isinstance(loaded['h'], LazyHist)
+    assert_same_hist(loaded['h'].load(), output['h'])
+    np.testing.assert_array_equal(loaded['column'].value, output['column'].value)
+    assert dict(loaded['counts']) == {'TTJets': 3}
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_partial_reads(tmp_path, compress):
+    output = make_output()
+    save_output(output, str(tmp_path / 'out'), compress=compress)
+    lazy = load_output(str(tmp_path / 'out'))['h']
+
+    assert lazy.identifiers('dataset') == ['DYJetsToLL', 'QCD_Pt-470to600', 'TTJets']
+    assert_same_hist(lazy.load(dataset='TTJets'), output['h'][['TTJets']])
+    assert_same_hist(lazy.load(dataset=re.compile('QCD.*'), channel='4mu'),
+                     output['h'][re.compile('QCD.*'), '4mu'])
+    assert_same_hist(lazy.integrate('dataset', ['TTJets', 'DYJetsToLL']),
+                     output['h'].integrate('dataset', ['TTJets', 'DYJetsToLL']))
+    with pytest.raises(ValueError):
+        lazy.load(x='TTJets')
+
+
+def test_transform(tmp_path):
+    output = make_output()
+    save_output(output, str(tmp_path / 'out'))
+    seen = []
+    loaded = load_output(str(tmp_path / 'out'), transform=lambda k, h: seen.append(k) or h.integrate('y'))
+    assert [a.name for a in loaded['h'].load().dense_axes()] == ['x']
+    assert seen == ['h']
+    with pytest.raises(FileNotFoundError):
+        load_output(str(tmp_path / 'missing'))
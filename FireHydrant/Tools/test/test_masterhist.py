@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""rebinned master histograms against histograms filled directly in the coarse binning"""
+import numpy as np
+import pytest
+
+pytest.importorskip('coffea')
+from coffea import hist
+from FireHydrant.Tools.masterhist import fine_bin, hdr_edges, rebin, rebin_like
+
+
+def filled(*bins, seed=1):
+    rng = np.random.RandomState(seed)
+    h = hist.Hist('Counts', hist.Cat('dataset', 'dataset'), *bins)
+    for ds in ('a', 'b'):
+        h.fill(dataset=ds, **{b.name: rng.uniform(-2, 12, 5000) for b in bins}, weight=rng.rand(5000))
+    return h
+
+
+def assert_same(h, ref, overflow='none'):
+    values, refvalues = h.values(overflow=overflow), ref.values(overflow=overflow)
+    assert values.keys() == refvalues.keys()
+    for k in refvalues:
+        np.testing.assert_allclose(values[k], refvalues[k], rtol=1e-12)
+
+
+def test_merge_factor():
+    master = filled(fine_bin('x', 'x', 10, 0, 10, factor=4))
+    coarse = filled(hist.Bin('x', 'x', 10, 0, 10))
+    assert_same(rebin(master, 'x', 4), coarse, overflow='all')
+
+
+def test_tuple_and_edges():
+    master = filled(fine_bin('x', 'x', 10, 0, 10, factor=4))
+    assert_same(rebin(master, 'x', (5, 0, 10)), filled(hist.Bin('x', 'x', 5, 0, 10)), overflow='all')
+    edges = [0, 1, 2.5, 5, 10]
+    assert_same(rebin(master, 'x', edges), filled(hist.Bin('x', 'x', edges)), overflow='all')
+
+
+def test_narrower_range_goes_to_overflow():
+    master = filled(fine_bin('x', 'x', 10, 0, 10, factor=4))
+    narrow = rebin(master, 'x', (4, 2, 6))
+    assert_same(narrow, filled(hist.Bin('x', 'x', 4, 2, 6)))
+    for k, v in narrow.values(overflow='all').items():
+        np.testing.assert_allclose(v.sum(), master.values(overflow='all')[k].sum())
+
+
+def test_misaligned_edges():
+    master = filled(fine_bin('x', 'x', 10, 0, 10, factor=4))
+    with pytest.raises(ValueError):
+        rebin(master, 'x', [0, 1.1, 10])
+    snapped = rebin(master, 'x', [0, 1.1, 10], snap=True)
+    np.testing.assert_allclose(snapped.axis('x').edges(), [0, 1, 10])
+
+
+def test_rebin_like():
+    master = filled(fine_bin('x', 'x', 10, 0, 10, factor=4), fine_bin('y', 'y', 5, 0, 10, factor=2))
+    coarse = filled(hist.Bin('x', 'x', 10, 0, 10), hist.Bin('y', 'y', 5, 0, 10))
+    assert_same(rebin_like(master, coarse), coarse, overflow='all')
+
+    out = rebin_like({'h': master, 'other': master}, {'h': coarse.identity()})
+    assert_same(out['h'], coarse, overflow='all')
+    assert out['other'] is master
+
+
+def test_hdr_edges():
+    edges = hdr_edges(0.1, 500, subbins=8)
+    assert edges[0] == 0.1 and edges[-1] == 500
+    assert np.all(np.diff(edges) > 0)
+    assert np.all(np.diff(edges)[1:-1] / edges[1:-2] <= 1/8 + 1e-12)
+    with pytest.raises(ValueError):
+        hdr_edges(0, 10)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+"""shard_fileset: every file once, balanced entries, no empty shard"""
+import numpy as np
+import pytest
+from FireHydrant.Tools.sharding import shard_fileset
+
+
+def random_fileset(seed, ndatasets=5, nfiles=40):
+    rng = np.random.RandomState(seed)
+    fileset = {f'ds{d}': [f'ds{d}/f{i}.root' for i in range(rng.randint(1, nfiles))] for d in range(ndatasets)}
+    entries = {f: int(rng.lognormal(10, 1)) for files in fileset.values() for f in files}
+    return fileset, entries
+
+
+def flatten(shards):
+    return sorted((d, f) for _, shard in shards for d, files in shard.items() for f in files)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('nshards', [1, 3, 16])
+def test_partition_and_balance(seed, nshards):
+    fileset, entries = random_fileset(seed)
+    shards = shard_fileset(fileset, nshards, entries)
+
+    assert len(shards) == nshards
+    assert flatten(shards) == sorted((d, f) for d, files in fileset.items() for f in files)
+    for load, shard in shards:
+        assert shard
+        assert load == sum(entries[f] for files in shard.values() for f in files)
+
+    # largest first to the lightest shard: loads differ by at most one file,
+    # and the heaviest shard is within 4/3 of the best possible split
+    loads = [load for load, _ in shards]
+    assert max(loads) - min(loads) <= max(entries.values())
+    assert max(loads) <= 4/3 * max(sum(entries.values()) / nshards, max(entries.values()))
+
+
+def test_more_shards_than_files():
+    fileset = {'a': ['a1', 'a2'], 'b': ['b1']}
+    shards = shard_fileset(fileset, 8, {'a1': 10, 'a2': 5, 'b1': 7})
+    assert len(shards) == 3
+    assert sorted(load for load, _ in shards) == [5, 7, 10]
+
+
+def test_files_without_entries():
+    fileset = {'a': ['a1', 'a2', 'a3', 'a4'], 'b': ['b1', 'b2']}
+    shards = shard_fileset(fileset, 2, {'a1': 100, 'b1': 100})
+    assert sorted(load for load, _ in shards) == [100, 100]
+    assert flatten(shards) == sorted((d, f) for d, files in fileset.items() for f in files)
+    assert all(sum(len(v) for v in shard.values()) == 3 for _, shard in shards)